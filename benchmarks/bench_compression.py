@@ -0,0 +1,133 @@
+"""
+Benchmark of the transparent compression of `upload_artifact` and
+`download_artifact`: the throughput and ratio of each codec, and the network
+bandwidth below which compressing an artifact makes its transfer faster.
+
+Compression runs while the compressed stream is uploaded (and decompression
+while it is downloaded), so a compressed transfer takes about
+max(codec time, compressed size / bandwidth). It beats the raw transfer
+(size / bandwidth) as long as the bandwidth is below the codec throughput,
+which is the crossover point reported here. The codecs are measured through
+the same code path as the transfers; the network is not involved.
+
+Variants are named codec -level xthreads ('d' for the default level).
+
+Run from the project root (where infra_config.json is):
+    python -m benchmarks.bench_compression --size-mb 256
+    python -m benchmarks.bench_compression --file path/to/artifact
+"""
+import argparse
+import io
+import os
+import tempfile as tmpf
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Bandwidths (MB/s) to estimate the transfer times for.
+BANDWIDTHS = [10, 50, 100, 250, 1000]
+
+
+def _make_csv(path: str, size_mb: int):
+    rng = np.random.default_rng(0)
+    rows = max(size_mb * 1024 ** 2 // 26, 1)
+    pd.DataFrame({
+        'id': np.arange(rows),
+        'category': rng.choice(['alpha', 'beta', 'gamma', 'delta'], rows),
+        'value': rng.normal(size=rows).round(6),
+        'count': rng.integers(0, 1000, rows)
+    }).to_csv(path, index=False)
+
+
+def _measure(file_path: str, compression: str, level: int,
+             max_workers: int) -> Dict[str, Any]:
+    # The storage client is not used, so no credentials are needed.
+    from google.cloud import storage
+    storage.Client = lambda *args, **kwargs: None
+    from infra.core.gcp import gcs
+    # Multiple workers are always used when given, whatever the file size.
+    gcs.PARALLEL_COMPRESSION_THRESHOLD = 0
+
+    size = os.path.getsize(file_path)
+    start_time = time.perf_counter()
+    compressed = b''.join(gcs._compress_file(file_path, compression, level,
+                                             max_workers))
+    compress_seconds = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    writer = gcs._DecompressingWriter(io.BytesIO(), compression)
+    for i in range(0, len(compressed), gcs.UPLOAD_CHUNK_SIZE):
+        writer.write(compressed[i:i + gcs.UPLOAD_CHUNK_SIZE])
+    writer.finish()
+    decompress_seconds = time.perf_counter() - start_time
+
+    size_mb = size / 1024 ** 2
+
+    return {
+        'ratio': size / len(compressed),
+        'compressedMB': len(compressed) / 1024 ** 2,
+        'compressMBps': size_mb / compress_seconds,
+        'decompressMBps': size_mb / decompress_seconds
+    }
+
+
+def _transfer_seconds(size_mb: float, row: Dict[str, Any],
+                      bandwidth: float, codec_mbps: float) -> float:
+    return max(size_mb / codec_mbps, row['compressedMB'] / bandwidth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size-mb', type=int, default=128,
+                        help='The size of the generated csv artifact.')
+    parser.add_argument('--file', help='An artifact to benchmark instead of '
+                        'a generated csv.')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tmpf.TemporaryDirectory() as tmp_dir:
+        file_path = args.file
+
+        if file_path is None:
+            file_path = os.path.join(tmp_dir, 'artifact.csv')
+            _make_csv(file_path, args.size_mb)
+
+        size_mb = os.path.getsize(file_path) / 1024 ** 2
+        variants = [('gzip', None, 1), ('gzip', 1, 1),
+                    ('gzip', None, args.workers), ('zstd', None, 1),
+                    ('zstd', None, args.workers)]
+        rows: List[Any] = [(f'{compression} -{level or "d"} x{workers}',
+                            _measure(file_path, compression, level, workers))
+                           for compression, level, workers in variants]
+
+    print(f'{size_mb:.0f} MB artifact')
+    print(f'{"variant":<16}{"ratio":>7}{"comp MB/s":>11}'
+          f'{"decomp MB/s":>13}{"crossover MB/s":>16}')
+
+    for name, row in rows:
+        # The slower side of the transfer limits the bandwidth at which
+        # compression still pays off.
+        crossover = min(row['compressMBps'], row['decompressMBps'])
+        print(f'{name:<16}{row["ratio"]:>7.1f}'
+              f'{row["compressMBps"]:>11.0f}{row["decompressMBps"]:>13.0f}'
+              f'{crossover:>16.0f}')
+
+    print()
+    print('Estimated upload seconds by bandwidth (MB/s)')
+    print(f'{"variant":<16}' +
+          ''.join(f'{bandwidth:>9}' for bandwidth in BANDWIDTHS))
+    print(f'{"raw":<16}' + ''.join(f'{size_mb / bandwidth:>9.2f}'
+                                   for bandwidth in BANDWIDTHS))
+
+    for name, row in rows:
+        seconds = [_transfer_seconds(size_mb, row, bandwidth,
+                                     row['compressMBps'])
+                   for bandwidth in BANDWIDTHS]
+        print(f'{name:<16}' +
+              ''.join(f'{value:>9.2f}' for value in seconds))
+
+
+if __name__ == '__main__':
+    main()
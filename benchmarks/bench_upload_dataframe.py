@@ -0,0 +1,199 @@
+"""
+Benchmark of `upload_dataframe_to_gcs`: the legacy path (csv written to a
+temporary file and uploaded with `upload_artifact`) against the streamed csv,
+parquet and feather uploads.
+
+The storage client is replaced by one that reads and discards the uploaded
+bytes, so the results measure encoding and local I/O, not the network, and no
+credentials are needed. Each variant runs in its own process; its peak RSS
+and the RSS growth during the upload (sampled from /proc, so Linux only) are
+reported.
+
+Run from the project root (where infra_config.json is):
+    python -m benchmarks.bench_upload_dataframe --rows 2000000
+"""
+import argparse
+import multiprocessing
+import queue
+import os
+import resource
+import sys
+import tempfile as tmpf
+import threading
+import time
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+VARIANTS = [
+    ('legacy csv (temp file)', 'legacy', None),
+    ('csv', 'csv', None),
+    ('csv + gzip', 'csv', 'gzip'),
+    ('csv + zstd', 'csv', 'zstd'),
+    ('parquet', 'parquet', None),
+    ('parquet + zstd', 'parquet', 'zstd'),
+    ('feather + zstd', 'feather', 'zstd'),
+]
+_uploaded = [0]
+
+
+class _DiscardBlob():
+    def __init__(self, name: str, chunk_size: int = None):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.metadata = None
+
+    def upload_from_file(self, file_obj, size: int = None, **kwargs):
+        chunk_size = self.chunk_size or 8 * 1024 ** 2
+
+        while True:
+            data = file_obj.read(chunk_size)
+            _uploaded[0] += len(data)
+            if len(data) < chunk_size:
+                break
+
+
+class _DiscardBucket():
+    def __init__(self, client: '_DiscardClient'):
+        self.client = client
+
+    def blob(self, blob_name: str, chunk_size: int = None, **kwargs):
+        return _DiscardBlob(blob_name, chunk_size)
+
+
+class _DiscardClient():
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def bucket(self, bucket_name: str) -> _DiscardBucket:
+        return _DiscardBucket(self)
+
+
+def _make_dataframe(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+
+    return pd.DataFrame({
+        'id': np.arange(rows),
+        'category': rng.choice(['a', 'b', 'c', 'd'], rows),
+        'value': rng.normal(size=rows),
+        'count': rng.integers(0, 1000, rows),
+        'label': [f'label-{i % 1000}' for i in range(rows)]
+    })
+
+
+def _max_rss_mb() -> float:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return max_rss / 1024 ** 2 if sys.platform == 'darwin' else max_rss / 1024
+
+
+class _RSSSampler():
+    """Samples the current RSS of the process on a background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self._interval = interval
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self.baseline = self._current_mb()
+        self.peak = self.baseline
+
+    def _current_mb(self) -> float:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * self._page_size / 1024 ** 2
+
+    def _sample(self):
+        while not self._stop.wait(self._interval):
+            self.peak = max(self.peak, self._current_mb())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._current_mb())
+
+
+def _legacy_upload(dataframe: pd.DataFrame, bucket_name: str,
+                   object_name: str) -> bool:
+    from infra.core.gcp.gcs import upload_artifact
+
+    with tmpf.NamedTemporaryFile(mode='r+', suffix='.csv') as tf:
+        dataframe.to_csv(tf)
+        tf.flush()
+        return upload_artifact(bucket_name, object_name, tf.name)
+
+
+def _run_variant(rows: int, file_format: str, compression: str,
+                 results: Any):
+    import google.cloud.logging
+    from google.cloud import storage
+    storage.Client = _DiscardClient
+    google.cloud.logging.Client = _DiscardClient
+
+    from infra.extensions.gcp import upload_dataframe_to_gcs
+
+    dataframe = _make_dataframe(rows)
+
+    with _RSSSampler() as rss:
+        start_time = time.perf_counter()
+
+        if file_format == 'legacy':
+            result = _legacy_upload(dataframe, 'bench', 'df.csv')
+        else:
+            result = upload_dataframe_to_gcs(dataframe, 'bench', 'df',
+                                             file_format=file_format,
+                                             compression=compression)
+
+        elapsed = time.perf_counter() - start_time
+
+    frame_mb = dataframe.memory_usage(deep=True).sum() / 1024 ** 2
+    results.put({
+        'ok': result,
+        'seconds': elapsed,
+        'frameMBps': frame_mb / elapsed,
+        'uploadedMB': _uploaded[0] / 1024 ** 2,
+        'peakRSSMB': _max_rss_mb(),
+        'extraRSSMB': rss.peak - rss.baseline
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    args = parser.parse_args()
+    context = multiprocessing.get_context('spawn')
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    for name, file_format, compression in VARIANTS:
+        results = context.Queue()
+        process = context.Process(target=_run_variant,
+                                  args=(args.rows, file_format, compression,
+                                        results))
+        process.start()
+
+        while True:
+            try:
+                rows[name] = results.get(timeout=1)
+                break
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f'The {name} variant has failed.')
+
+        process.join()
+
+    print(f'{args.rows} rows')
+    print(f'{"variant":<24}{"ok":>4}{"secs":>8}{"frame MB/s":>12}'
+          f'{"upload MB":>11}{"peak RSS":>10}{"extra RSS":>11}')
+
+    for name, row in rows.items():
+        print(f'{name:<24}{str(row["ok"]):>4}{row["seconds"]:>8.2f}'
+              f'{row["frameMBps"]:>12.1f}{row["uploadedMB"]:>11.1f}'
+              f'{row["peakRSSMB"]:>10.0f}{row["extraRSSMB"]:>11.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,8 +3,11 @@ This modules contains classes and methods for using various databases.
 Currently supported:
 *  MongoDB
 """
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Iterator, Sequence, Type
 
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from pymongo.errors import (CollectionInvalid, ConnectionFailure,
@@ -12,6 +15,19 @@ from pymongo.errors import (CollectionInvalid, ConnectionFailure,
 
 from infra.core.enums import LogSeverities
 from infra.core.logging import log_event
+from infra.core.metrics import REGISTRY, instrument
+
+_OPERATIONS = REGISTRY.counter('infra_db_operations_total',
+                               'MongoDB operations by status.',
+                               ('operation', 'status'))
+_LATENCY = REGISTRY.histogram('infra_db_operation_seconds',
+                              'The duration of MongoDB operations.',
+                              ('operation',))
+_DOCUMENTS = REGISTRY.counter('infra_db_documents_total',
+                              'The documents read from MongoDB.',
+                              ('operation',))
+_BYTES = REGISTRY.counter('infra_db_bytes_total',
+                          'The BSON bytes read from MongoDB.', ('operation',))
 
 
 class MongoHandler():
@@ -51,20 +67,36 @@ class MongoHandler():
                   message='A user requested to change the db.',
                   **metadata)
 
-    def get_collection(self, col_name: str) -> Collection:
+    def get_collection(self, col_name: str,
+                       raw_bson: bool = False,
+                       codec_options: CodecOptions = None) -> Collection:
         """Get a collection from the current db.
 
         Args:
             col_name (str): The collection name.
+            raw_bson (bool, optional): True for returning documents as
+            `RawBSONDocument` instances. A raw document keeps the BSON bytes
+            returned by the server and decodes them only when a field is
+            accessed, which is much cheaper than building a full dict for
+            documents of which only a few fields are read.
+            Defaults to False.
+            codec_options (CodecOptions, optional): Custom codec options for
+            the collection. Overrides `raw_bson` when supplied.
+            Defaults to None.
 
         Returns:
             Collection: The collection instance.
         """
-        collection = self._db.get_collection(col_name)
+        if codec_options is None and raw_bson:
+            codec_options = CodecOptions(document_class=RawBSONDocument)
+
+        collection = self._db.get_collection(col_name,
+                                             codec_options=codec_options)
         metadata = {
             'collName': col_name,
             'className': 'MongoHandler',
             'funcName': 'get_collection',
+            'rawBSON': raw_bson,
             'eventGroup': 'Mongo'
         }
 
@@ -75,6 +107,49 @@ class MongoHandler():
 
         return collection
 
+    def find_records(self, col_name: str,
+                     record_type: Type,
+                     query: Dict[str, Any] = None,
+                     batch_size: int = 0,
+                     **find_options) -> Iterator[Any]:
+        """Query a collection and decode the results straight into records.
+
+        Only the fields of the record type are requested from the server and
+        the documents are read as raw BSON, so no intermediate dict is built
+        per document.
+
+        Args:
+            col_name (str): The collection name.
+            record_type (Type): The record class. Either a NamedTuple or a
+            class that declares its fields with `__slots__`.
+            query (Dict[str, Any], optional): The query filter.
+            Defaults to None (all documents).
+            batch_size (int, optional): The number of documents the server
+            returns per batch. Defaults to 0 (server default).
+            **find_options: Any other option of `Collection.find`.
+
+        Raises:
+            TypeError: If the record type is neither a NamedTuple nor a
+            `__slots__` based class.
+
+        Returns:
+            Iterator[Any]: A lazy iterator over the records. Fields that are
+            missing from a document are set to None.
+        """
+        # Validated here, since the records generator runs only when read.
+        fields = _record_fields(record_type)
+        projection = {field: 1 for field in fields}
+
+        if '_id' not in projection:
+            projection['_id'] = 0
+
+        collection = self.get_collection(col_name, raw_bson=True)
+        cursor = collection.find(query, projection, batch_size=batch_size,
+                                 **find_options)
+
+        return _decode_records(cursor, record_type, fields)
+
+    @instrument(_OPERATIONS, _LATENCY, 'create_collection')
     def create_collection(self, col_name: str, **options) -> bool:
         """Create a new collection if not already exists.
 
@@ -115,6 +190,7 @@ class MongoHandler():
 
             return False
 
+    @instrument(_OPERATIONS, _LATENCY, 'delete_collection')
     def delete_collection(self, col_name: str) -> bool:
         """Deletes a collection if exists.
 
@@ -154,6 +230,7 @@ class MongoHandler():
 
             return False
 
+    @instrument(_OPERATIONS, _LATENCY, 'update_collection_schema')
     def update_collection_schema(self, col_name: str,
                                  schema: Dict[str, Any],
                                  validation_level: str = 'strict',
@@ -226,3 +303,71 @@ class MongoHandler():
     @property
     def dbName(self):
         return self._curr_db_name
+
+
+def _record_fields(record_type: Type) -> Sequence[str]:
+    """Get the field names of a record type.
+
+    Args:
+        record_type (Type): A NamedTuple or a `__slots__` based class.
+
+    Raises:
+        TypeError: If the fields of the record type cannot be determined.
+
+    Returns:
+        Sequence[str]: The field names by their declaration order.
+    """
+    if hasattr(record_type, '_fields'):
+        return tuple(record_type._fields)
+
+    slots = getattr(record_type, '__slots__', None)
+
+    if slots is None:
+        raise TypeError(f'{record_type.__name__} must be a NamedTuple or '
+                        f'declare its fields with __slots__.')
+    if isinstance(slots, str):
+        return (slots,)
+
+    return tuple(slots)
+
+
+def _decode_records(cursor: Iterator[RawBSONDocument],
+                    record_type: Type,
+                    fields: Sequence[str]) -> Iterator[Any]:
+    """Decode the raw documents of a cursor into records, counting them in
+    the metrics once the cursor is exhausted or closed. The observed latency
+    spans from the first read to the last one."""
+    start_time = time.perf_counter()
+    # Counted locally and added to the metrics once, off the hot loop.
+    documents = 0
+    received_bytes = 0
+    status = 'error'
+
+    try:
+        if hasattr(record_type, '_fields'):
+            for doc in cursor:
+                documents += 1
+                received_bytes += len(doc.raw)
+                yield record_type(*[doc.get(field) for field in fields])
+        else:
+            for doc in cursor:
+                documents += 1
+                received_bytes += len(doc.raw)
+                record = record_type.__new__(record_type)
+
+                for field in fields:
+                    setattr(record, field, doc.get(field))
+
+                yield record
+
+        status = 'ok'
+    except GeneratorExit:
+        # The consumer stopped reading the records.
+        status = 'ok'
+        raise
+    finally:
+        _LATENCY.observe(time.perf_counter() - start_time,
+                         operation='find_records')
+        _OPERATIONS.inc(operation='find_records', status=status)
+        _DOCUMENTS.inc(documents, operation='find_records')
+        _BYTES.inc(received_bytes, operation='find_records')
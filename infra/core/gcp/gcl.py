@@ -6,10 +6,24 @@ from typing import Any, Dict
 import google.cloud.logging as gcl
 
 from infra.core.enums import LogSeverities
+from infra.core.metrics import REGISTRY, instrument
+
+_OPERATIONS = REGISTRY.counter('infra_gcl_operations_total',
+                               'Google Cloud Logging operations by status.',
+                               ('operation', 'status'))
+_LATENCY = REGISTRY.histogram('infra_gcl_operation_seconds',
+                              'The duration of Google Cloud Logging '
+                              'operations.', ('operation',))
+_EVENTS = REGISTRY.counter('infra_gcl_events_total',
+                           'The events logged to Google Cloud Logging.',
+                           ('severity',))
 
 _stackdriver_client = gcl.Client()
 
 
+# These functions return None, only raising is a failure.
+@instrument(_OPERATIONS, _LATENCY, 'delete_logs',
+            is_failure=lambda result: False)
 def gcl_delete_logs(logger_name: str):
     """
     Deletes all logs of the specified logger.
@@ -21,6 +35,8 @@ def gcl_delete_logs(logger_name: str):
     logger.delete()
 
 
+@instrument(_OPERATIONS, _LATENCY, 'log_event',
+            is_failure=lambda result: False)
 def gcl_log_event(logger_name: str,
                   event: Dict[str, Any],
                   severity: LogSeverities):
@@ -35,6 +51,7 @@ def gcl_log_event(logger_name: str,
     """
     logger = _stackdriver_client.logger(logger_name)
     logger.log_struct(event, severity=severity.name)
+    _EVENTS.inc(severity=severity.name)
 
 
 __all__ = ['gcl_log_event', 'gcl_delete_logs']
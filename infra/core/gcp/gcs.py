@@ -1,104 +1,2011 @@
 """
 This module contains methods for using google cloud storage.
 """
+import base64
+import collections
+import fnmatch
+import hashlib
+import io
+import json
+import math
+import mmap
 import os
+import queue
 import socket
-import subprocess
-from typing import Any, Dict
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Any, BinaryIO, Dict, Iterable, List, Mapping, Tuple,
+                    Union)
 
 from google.cloud import storage
 from google.cloud.exceptions import Conflict, GoogleCloudError, NotFound
 
+from configuration.config import config
 from infra.core.enums import Environments, LogSeverities, StorageClasses
+from infra.core.gcp.gcs_cache import ArtifactCache
 from infra.core.logging import log_event
+from infra.core.metrics import REGISTRY, instrument
+
+try:
+    import google_crc32c
+except ImportError:
+    google_crc32c = None
+
+_gcs_conf: Dict[str, Any] = config.get('gcs', {})
+# Resumable uploads are sent in chunks, which must be multiples of 256 KB.
+UPLOAD_CHUNK_SIZE = _gcs_conf.get('upload_chunk_size', 32 * 256 * 1024)
+STREAM_QUEUE_SIZE = _gcs_conf.get('stream_queue_size', 8)
+MAX_WORKERS = _gcs_conf.get('max_workers', 8)
+# The size of the ranges requested by artifact readers.
+READ_AHEAD_SIZE = _gcs_conf.get('read_ahead_size', 1024 ** 2)
+WRITE_BUFFER_SIZE = _gcs_conf.get('write_buffer_size', 1024 ** 2)
+# Files above this size are uploaded as parallel parts that are composed
+# into the final object.
+PARALLEL_UPLOAD_THRESHOLD = _gcs_conf.get('parallel_upload_threshold',
+                                          150 * 1024 ** 2)
+PARALLEL_UPLOAD_PART_SIZE = _gcs_conf.get('parallel_upload_part_size',
+                                          64 * 1024 ** 2)
+# The parts of composite uploads are kept under this prefix until composed.
+COMPOSITE_PARTS_PREFIX = _gcs_conf.get('composite_parts_prefix',
+                                       '.composite-parts/')
+# The maximal number of source objects of a single compose request.
+_MAX_COMPOSE_COMPONENTS = 32
+# Artifacts downloaded by generation are cached here when it is configured.
+CACHE_DIR = _gcs_conf.get('cache_dir')
+CACHE_MAX_BYTES = _gcs_conf.get('cache_max_bytes', 10 * 1024 ** 3)
+# Artifacts are compressed on upload with 'gzip' or 'zstd' when configured.
+COMPRESSION = _gcs_conf.get('compression')
+COMPRESSION_LEVEL = _gcs_conf.get('compression_level')
+# Files above this size are compressed on multiple threads, in blocks of
+# COMPRESSION_BLOCK_SIZE.
+PARALLEL_COMPRESSION_THRESHOLD = _gcs_conf.get(
+    'parallel_compression_threshold', 32 * 1024 ** 2)
+COMPRESSION_BLOCK_SIZE = _gcs_conf.get('compression_block_size',
+                                       4 * 1024 ** 2)
+COMPRESSIONS = ('gzip', 'zstd')
+# The metadata keys of the checksums of the content of compressed objects.
+_UNCOMPRESSED_CHECKSUM_KEYS = {'crc32c': 'uncompressedCrc32c',
+                               'md5': 'uncompressedMd5'}
+_HASH_BLOCK_SIZE = 1024 ** 2
+# The file in a synced directory that keeps the stats and checksums of its
+# files between syncs.
+SYNC_MANIFEST_NAME = '.gcs_sync_manifest.json'
+# In-progress downloads are written next to their destination under this
+# suffix and a unique id, and are ignored when syncing a directory.
+SYNC_TMP_SUFFIX = '.sync-tmp-'
+_WILDCARDS = '*?['
+
+_OPERATIONS = REGISTRY.counter('infra_gcs_operations_total',
+                               'Google Cloud Storage operations by status.',
+                               ('operation', 'status'))
+_LATENCY = REGISTRY.histogram('infra_gcs_operation_seconds',
+                              'The duration of Google Cloud Storage '
+                              'operations.', ('operation',))
+_BYTES = REGISTRY.counter('infra_gcs_bytes_total',
+                          'The bytes sent to and received from Google Cloud '
+                          'Storage.', ('operation', 'direction'))
 
 _gcs_client = storage.Client()
+_bucket_handles: Dict[str, storage.Bucket] = {}
+_artifact_cache = ArtifactCache(CACHE_DIR, CACHE_MAX_BYTES) \
+    if CACHE_DIR else None
 
 
-def create_bucket(bucket_name: str, app_name: str,
-                  storage_class: StorageClasses = StorageClasses.STANDARD,
-                  ) -> bool:
+def _get_bucket(bucket_name: str) -> storage.Bucket:
     """
-     Create a new bucket in Google Cloud Storage.
+    Get a cached handle of a bucket. Unlike `Client.get_bucket`, creating a
+    handle does not send a request, a missing bucket is reported by the first
+    request that uses it.
+
+    Args:
+        bucket_name (str): The bucket name.
+
+    Returns:
+        storage.Bucket: The bucket handle.
+    """
+    bucket = _bucket_handles.get(bucket_name)
+
+    if bucket is None or bucket.client is not _gcs_client:
+        bucket = _gcs_client.bucket(bucket_name)
+        _bucket_handles[bucket_name] = bucket
+
+    return bucket
+
+
+class _ChunkPipe(io.RawIOBase):
+    """
+    A bounded, thread safe pipe between a producer of byte chunks and a
+    reader (e.g an upload). The producer blocks while the pipe is full, so
+    the memory used by the pipe is bounded by its queue size.
+    """
+
+    def __init__(self, max_chunks: int = STREAM_QUEUE_SIZE):
+        super().__init__()
+        self._chunks = queue.Queue(maxsize=max_chunks)
+        self._buffer = memoryview(b'')
+        self._position = 0
+        self._eof = False
+        self._reader_closed = False
+        self.error = None
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, b) -> int:
+        # Fills the whole buffer unless the stream ends, since resumable
+        # uploads of an unknown size treat a short read as the end of the
+        # stream.
+        filled = 0
+
+        while filled < len(b):
+            if not self._buffer:
+                if self._eof:
+                    break
+
+                chunk = self._chunks.get()
+
+                if chunk is None:
+                    self._eof = True
+                    if self.error is not None:
+                        raise self.error
+                    continue
+
+                self._buffer = memoryview(chunk)
+
+            size = min(len(b) - filled, len(self._buffer))
+            b[filled:filled + size] = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            filled += size
+
+        self._position += filled
+
+        return filled
+
+    def close(self):
+        self._reader_closed = True
+        super().close()
+
+    def put(self, chunk: bytes):
+        """
+        Add a chunk to the pipe, blocking while the pipe is full.
+
+        Args:
+            chunk (bytes): The chunk to add. Empty chunks are ignored.
+
+        Raises:
+            BrokenPipeError: If the reader side was closed.
+        """
+        if not chunk:
+            return
+
+        while True:
+            if self._reader_closed:
+                raise BrokenPipeError('The reader side of the pipe is closed.')
+            try:
+                self._chunks.put(bytes(chunk), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, error: Exception = None):
+        """
+        Mark the end of the stream.
+
+        Args:
+            error (Exception, optional): An error that the reader should raise
+            instead of reaching the end of the stream. Defaults to None.
+        """
+        self.error = error
+
+        while not self._reader_closed:
+            try:
+                self._chunks.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def feed(self, chunks: Iterable[bytes]):
+        """
+        Write all the chunks of an iterable into the pipe and mark the end of
+        the stream. Errors of the iterable are passed to the reader.
+
+        Args:
+            chunks (Iterable[bytes]): The chunks to write.
+        """
+        try:
+            for chunk in chunks:
+                self.put(chunk)
+        except BrokenPipeError:
+            return
+        except Exception as e:
+            self.finish(e)
+            return
+
+        self.finish()
+
+
+class TransferReport():
+    """
+    The result of a multi-artifact transfer. The report is truthy only if no
+    artifact has failed.
+    """
+
+    def __init__(self):
+        self.files: List[str] = []
+        self.skipped: List[str] = []
+        self.deleted: List[str] = []
+        self.failures: Dict[str, str] = {}
+        self.bytes = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return not self.failures
+
+    def __repr__(self) -> str:
+        return f'TransferReport(files={len(self.files)}, ' \
+            f'skipped={len(self.skipped)}, deleted={len(self.deleted)}, ' \
+            f'failures={len(self.failures)}, bytes={self.bytes}, ' \
+            f'elapsed={self.elapsed:.3f})'
+
+    @property
+    def throughput(self) -> float:
+        """float: The transferred bytes per second."""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def add_file(self, path: str, size: int):
+        with self._lock:
+            self.files.append(path)
+            self.bytes += size
+
+    def add_skipped(self, path: str):
+        with self._lock:
+            self.skipped.append(path)
+
+    def add_deleted(self, path: str):
+        with self._lock:
+            self.deleted.append(path)
+
+    def add_failure(self, name: str, error: str):
+        with self._lock:
+            self.failures[name] = error
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'files': len(self.files),
+            'skipped': len(self.skipped),
+            'deleted': len(self.deleted),
+            'failures': len(self.failures),
+            'bytes': self.bytes,
+            'elapsed': self.elapsed,
+            'throughput': self.throughput
+        }
+
+
+def _checksum(blocks: Iterable[bytes], algorithm: str) -> str:
+    """
+    Calculate the checksum of a content in the format GCS reports it
+    (base64 of the big-endian digest).
+
+    Args:
+        blocks (Iterable[bytes]): The content to hash.
+        algorithm (str): Either 'crc32c' or 'md5'.
+
+    Returns:
+        str: The base64 encoded checksum.
+    """
+    hasher = google_crc32c.Checksum() if algorithm == 'crc32c' \
+        else hashlib.md5()
+
+    for block in blocks:
+        hasher.update(block)
+
+    return base64.b64encode(hasher.digest()).decode('ascii')
+
+
+def _file_checksum(file_path: str, algorithm: str) -> str:
+    with open(file_path, 'rb') as f:
+        return _checksum(iter(lambda: f.read(_HASH_BLOCK_SIZE), b''),
+                         algorithm)
+
+
+def _buffer_checksum(buffer: memoryview, algorithm: str) -> str:
+    # The crc32c extension accepts only bytes, so the buffer is copied one
+    # block at a time.
+    blocks = (bytes(buffer[i:i + _HASH_BLOCK_SIZE])
+              for i in range(0, len(buffer), _HASH_BLOCK_SIZE))
+
+    return _checksum(blocks, algorithm)
+
+
+def _content_size(blob: storage.Blob) -> Union[int, None]:
+    """The size of an object once downloaded, that is after decompressing a
+    compressed object. None if it is not known."""
+    if blob.content_encoding in COMPRESSIONS:
+        size = (blob.metadata or {}).get('uncompressedSize')
+        return None if size is None else int(size)
+
+    return blob.size
+
+
+def _content_checksum(blob: storage.Blob,
+                      algorithm: str) -> Union[str, None]:
+    """The checksum of an object once downloaded. The checksums of the
+    content of compressed objects are kept in their metadata, if known."""
+    if blob.content_encoding in COMPRESSIONS:
+        return (blob.metadata or {}).get(
+            _UNCOMPRESSED_CHECKSUM_KEYS[algorithm])
+
+    return blob.crc32c if algorithm == 'crc32c' else blob.md5_hash
+
+
+def _checksum_matches(file_path: str, blob: storage.Blob) -> bool:
+    """
+    Check whether a local file has the same content as an object (once
+    downloaded), using the cheapest checksum both sides have.
+
+    Args:
+        file_path (str): The local file.
+        blob (storage.Blob): The object, with its properties loaded.
+
+    Returns:
+        bool: True if the file exists and its checksum matches.
+    """
+    if not os.path.isfile(file_path) or \
+            os.path.getsize(file_path) != _content_size(blob):
+        return False
+
+    for algorithm in ('crc32c', 'md5'):
+        checksum = _content_checksum(blob, algorithm)
+
+        if checksum and (algorithm == 'md5' or google_crc32c is not None):
+            return _file_checksum(file_path, algorithm) == checksum
+
+    return False
+
+
+def _list_artifacts(bucket_name: str,
+                    cloud_path: str = None,
+                    recursive: bool = True
+                    ) -> List[Tuple[storage.Blob, str]]:
+    """
+    List the objects matching a cloud path along with their path relative to
+    the directory of the cloud path.
+
+    Args:
+        bucket_name (str): The bucket to list.
+        cloud_path (str, optional): A directory-like prefix, an object name or
+        a wild card path (e.g folder/*.txt). Wild cards are matched per
+        path segment, so '*' never matches a '/': 'data/*.csv' matches
+        'data/a.csv' but not 'data/raw/a.csv'. Defaults to None (the whole
+        bucket).
+        recursive (bool, optional): False for skipping objects in
+        subdirectories of the cloud path. A recursive listing of a wild card
+        path also lists the objects under the matching directories, e.g
+        'data/*' lists 'data/raw/a.csv'. Defaults to True.
+
+    Returns:
+        List[Tuple[storage.Blob, str]]: The matching objects and their
+        relative paths.
+    """
+    path = (cloud_path or '').lstrip('/')
+    wildcard_index = min([path.find(c) for c in _WILDCARDS if c in path],
+                         default=-1)
+
+    if wildcard_index >= 0:
+        prefix = path[:wildcard_index]
+        base = prefix[:prefix.rfind('/') + 1]
+    else:
+        prefix = path.rstrip('/')
+        base = prefix + '/' if prefix else ''
+
+    patterns = path.split('/')
+    artifacts = []
+
+    for blob in _gcs_client.list_blobs(bucket_name, prefix=prefix or None):
+        name = blob.name
+
+        if name.endswith('/'):
+            continue
+        if wildcard_index >= 0:
+            segments = name.split('/')
+
+            if len(segments) < len(patterns) or not all(
+                    fnmatch.fnmatchcase(segment, pattern)
+                    for segment, pattern in zip(segments, patterns)):
+                continue
+            relative_path = name[len(base):]
+        elif name == prefix:
+            relative_path = name.rpartition('/')[2]
+        elif name.startswith(base):
+            relative_path = name[len(base):]
+        else:
+            continue
+
+        if not recursive and '/' in relative_path:
+            continue
+
+        artifacts.append((blob, relative_path))
+
+    return artifacts
+
+
+def _local_path(local_dir: str, relative_path: str) -> str:
+    """
+    Get the local path of an object under a destination directory.
+
+    Raises:
+        ValueError: If the object path leads outside the directory, e.g by
+        '../' segments.
+    """
+    file_path = os.path.join(local_dir, *relative_path.split('/'))
+    root = os.path.realpath(local_dir)
+    real_path = os.path.realpath(file_path)
+
+    if real_path == root or os.path.commonpath([root, real_path]) != root:
+        raise ValueError(f'The object path {relative_path} is outside of '
+                         f'the destination directory.')
+
+    return file_path
+
+
+def _load_sync_manifest(local_dir: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(os.path.join(local_dir, SYNC_MANIFEST_NAME)) as f:
+            return json.load(f).get('files', {})
+    except (OSError, ValueError):
+        # A missing or corrupted manifest only costs rehashing.
+        return {}
+
+
+def _save_sync_manifest(local_dir: str, files: Dict[str, Dict[str, Any]]):
+    manifest_path = os.path.join(local_dir, SYNC_MANIFEST_NAME)
+    tmp_path = _tmp_path(manifest_path)
+
+    with open(tmp_path, 'w') as f:
+        json.dump({'files': files}, f, sort_keys=True)
+
+    os.replace(tmp_path, manifest_path)
+
+
+def _tmp_path(path: str) -> str:
+    return f'{path}{SYNC_TMP_SUFFIX}{uuid.uuid4().hex}'
+
+
+def _is_tmp_path(path: str) -> bool:
+    name, suffix, tmp_id = path.rpartition(SYNC_TMP_SUFFIX)
+
+    return bool(suffix) and len(tmp_id) == 32 and \
+        all(c in '0123456789abcdef' for c in tmp_id)
+
+
+def _local_files(local_dir: str) -> Dict[str, str]:
+    """Map the relative object-style paths of the files under a directory to
+    their local paths."""
+    files = {}
+
+    for root, _, file_names in os.walk(local_dir):
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            relative_path = os.path.relpath(file_path, local_dir)
+
+            if relative_path == SYNC_MANIFEST_NAME or \
+                    _is_tmp_path(file_name):
+                continue
+
+            files[relative_path.replace(os.sep, '/')] = file_path
+
+    return files
+
+
+def _sync_checksum(file_path: str, entry: Dict[str, Any],
+                   algorithm: str) -> str:
+    """
+    Get the checksum of a local file from its manifest entry, hashing the
+    file only if its size or modification time has changed or the checksum
+    was not calculated yet. The entry is updated in place.
+
+    Args:
+        file_path (str): The local file.
+        entry (Dict[str, Any]): The manifest entry of the file.
+        algorithm (str): Either 'crc32c' or 'md5'.
+
+    Returns:
+        str: The base64 encoded checksum.
+    """
+    stat = os.stat(file_path)
+
+    if entry.get('size') != stat.st_size or \
+            entry.get('mtime') != stat.st_mtime_ns:
+        entry.clear()
+        entry.update(size=stat.st_size, mtime=stat.st_mtime_ns)
+
+    if algorithm not in entry:
+        entry[algorithm] = _file_checksum(file_path, algorithm)
+
+    return entry[algorithm]
+
+
+def _sync_algorithm(blob: storage.Blob = None) -> Union[str, None]:
+    # The checksum to compare with an object, or to keep for a local file.
+    if google_crc32c is not None and \
+            (blob is None or _content_checksum(blob, 'crc32c')):
+        return 'crc32c'
+    if blob is None or _content_checksum(blob, 'md5'):
+        return 'md5'
+
+    return None
+
+
+def _gzip_compress(block: bytes, level: int = None) -> bytes:
+    # A complete gzip member. Concatenated members are a valid gzip stream.
+    level = zlib.Z_DEFAULT_COMPRESSION if level is None else level
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    return compressor.compress(block) + compressor.flush()
+
+
+def _compressor(compression: str, level: int = COMPRESSION_LEVEL,
+                threads: int = 0) -> Any:
+    """Create a streaming gzip or zstd compressor, with `compress` and
+    `flush` methods."""
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3 if level is None else level,
+                                        threads=threads).compressobj()
+
+    # wbits of 16 + MAX_WBITS writes a gzip header and trailer.
+    return zlib.compressobj(
+        zlib.Z_DEFAULT_COMPRESSION if level is None else level,
+        zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _compress_chunks(chunks: Iterable[bytes],
+                     compression: str,
+                     level: int = COMPRESSION_LEVEL,
+                     threads: int = 0) -> Iterable[bytes]:
+    """
+    Compress a stream of chunks into a single gzip or zstd stream.
+
+    Args:
+        chunks (Iterable[bytes]): The chunks to compress.
+        compression (str): Either 'gzip' or 'zstd'.
+        level (int, optional): The compression level. Defaults to
+        COMPRESSION_LEVEL (the default of the codec).
+        threads (int, optional): The number of zstd worker threads.
+        Defaults to 0 (compressing on the calling thread).
+
+    Yields:
+        bytes: The compressed chunks.
+    """
+    compressor = _compressor(compression, level, threads)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+
+def _set_content_encoding(blob: storage.Blob, compression: str):
+    """Mark an object to upload as compressed, so downloads decompress it."""
+    blob.metadata = dict(blob.metadata or {}, compression=compression)
+    blob.content_encoding = compression
+
+
+def _compress_file(file_path: str,
+                   compression: str,
+                   level: int = COMPRESSION_LEVEL,
+                   max_workers: int = MAX_WORKERS) -> Iterable[bytes]:
+    """
+    Compress a file into a gzip or zstd stream. Files above
+    PARALLEL_COMPRESSION_THRESHOLD are compressed on multiple threads: zstd
+    by its own worker threads, gzip as independent members (one per block)
+    on a thread pool, since zlib releases the GIL.
+
+    Args:
+        file_path (str): The file to compress.
+        compression (str): Either 'gzip' or 'zstd'.
+        level (int, optional): The compression level. Defaults to
+        COMPRESSION_LEVEL (the default of the codec).
+        max_workers (int, optional): The number of compression threads.
+        Defaults to MAX_WORKERS.
+
+    Yields:
+        bytes: The compressed chunks.
+    """
+    parallel = max_workers > 1 and \
+        os.path.getsize(file_path) > PARALLEL_COMPRESSION_THRESHOLD
+
+    with open(file_path, 'rb') as f:
+        blocks = iter(lambda: f.read(COMPRESSION_BLOCK_SIZE), b'')
+
+        if parallel and compression == 'gzip':
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # Blocks are compressed ahead of the upload, in order.
+                pending = collections.deque()
+
+                for block in blocks:
+                    pending.append(executor.submit(_gzip_compress, block,
+                                                   level))
+                    if len(pending) > 2 * max_workers:
+                        yield pending.popleft().result()
+
+                while pending:
+                    yield pending.popleft().result()
+        else:
+            yield from _compress_chunks(blocks, compression, level,
+                                        max_workers if parallel else 0)
+
+
+class _DecompressingWriter(io.RawIOBase):
+    """
+    A writable file that decompresses a gzip or zstd stream into another
+    file as it is written, e.g by a download. Streams of several gzip
+    members or zstd frames are supported.
+    """
+
+    def __init__(self, file_obj: BinaryIO, encoding: str):
+        super().__init__()
+        self._file = file_obj
+        self._encoding = encoding
+        self._decompressor = self._new_decompressor()
+        self._started = False
+
+    def _new_decompressor(self) -> Any:
+        if self._encoding == 'zstd':
+            import zstandard
+            return zstandard.ZstdDecompressor().decompressobj()
+
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        data = bytes(b)
+
+        while data:
+            self._started = True
+
+            try:
+                decompressed = self._decompressor.decompress(data)
+            except Exception as e:
+                # zlib and zstandard raise their own error types.
+                raise ValueError(f'Invalid {self._encoding} stream: {e}') \
+                    from e
+
+            self._file.write(decompressed)
+
+            if not self._decompressor.eof:
+                break
+
+            # The rest of the data starts the next member or frame.
+            data = self._decompressor.unused_data
+            self._decompressor = self._new_decompressor()
+            self._started = False
+
+        return len(b)
+
+    def finish(self):
+        """
+        Check that the stream has ended.
+
+        Raises:
+            ValueError: If the compressed stream is truncated.
+        """
+        if self._started:
+            raise ValueError(f'The {self._encoding} stream is truncated.')
+
+
+def _download_decompressed(blob: storage.Blob, file_obj: BinaryIO):
+    """
+    Download an object whose content encoding is gzip or zstd into a file,
+    decompressing it while it is downloaded.
+
+    Raises:
+        ValueError: If the compressed content is invalid or truncated.
+    """
+    writer = _DecompressingWriter(file_obj, blob.content_encoding)
+    # The raw download skips the decompressive transcoding of gzip, and is
+    # validated against the stored checksums.
+    blob.download_to_file(writer, raw_download=True)
+    writer.finish()
+
+
+def _decompress_bytes(data: bytes, encoding: str) -> bytes:
+    buffer = io.BytesIO()
+    writer = _DecompressingWriter(buffer, encoding)
+    writer.write(data)
+    writer.finish()
+
+    return buffer.getvalue()
+
+
+def _download_to_path(blob: storage.Blob, dest_path: str,
+                      decompress: bool = True):
+    """
+    Download an object into a temporary file next to the destination and
+    rename it once the download is complete, so the destination never holds
+    a partial artifact.
+
+    Args:
+        blob (storage.Blob): The object to download, with its properties
+        loaded.
+        dest_path (str): The local destination path.
+        decompress (bool, optional): False for saving objects whose content
+        encoding is gzip or zstd as they are stored. Defaults to True.
+    """
+    part_path = _tmp_path(dest_path)
+
+    try:
+        if blob.content_encoding in COMPRESSIONS:
+            with open(part_path, 'wb') as f:
+                if decompress:
+                    _download_decompressed(blob, f)
+                else:
+                    blob.download_to_file(f, raw_download=True)
+        else:
+            blob.download_to_filename(part_path)
+
+        os.replace(part_path, dest_path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+
+class _BufferReader(io.RawIOBase):
+    """A seekable, read-only file-like view of a buffer, without copying it."""
+
+    def __init__(self, buffer: memoryview):
+        super().__init__()
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+
+        self._position = max(0, min(offset, len(self._buffer)))
+
+        return self._position
+
+    def readinto(self, b) -> int:
+        size = min(len(b), len(self._buffer) - self._position)
+        b[:size] = self._buffer[self._position:self._position + size]
+        self._position += size
+
+        return size
+
+
+class ArtifactReader(io.RawIOBase):
+    """
+    A seekable file-like reader of an object. Each read is a range request,
+    so only the requested bytes are downloaded. Use `open_artifact` for a
+    buffered reader that reads ahead.
+    """
+
+    def __init__(self, blob: storage.Blob):
+        """
+        Args:
+            blob (storage.Blob): The object, with its properties loaded. Reads
+            are pinned to its generation.
+
+        Raises:
+            ValueError: If the object is compressed (has a gzip or zstd
+            content encoding), since its ranges can not be decompressed on
+            their own.
+        """
+        if blob.content_encoding in COMPRESSIONS:
+            raise ValueError(f'The artifact {blob.name} is compressed with '
+                             f'{blob.content_encoding} and can not be read '
+                             f'by ranges.')
+
+        super().__init__()
+        self._blob = blob
+        self._position = 0
+        self.name = blob.name
+        self.size = blob.size
+        self.generation = blob.generation
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        self._position = max(0, offset)
+
+        return self._position
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """
+        Read a range of the object without moving the stream position.
+
+        Args:
+            start (int): The first byte of the range.
+            end (int): The last byte of the range (inclusive).
+
+        Returns:
+            bytes: The content of the range.
+        """
+        end = min(end, self.size - 1)
+
+        if start > end:
+            return b''
+
+        content = self._blob.download_as_string(start=start, end=end)
+        _BYTES.inc(len(content), operation='open_artifact',
+                   direction='download')
+
+        return content
+
+    def readinto(self, b) -> int:
+        data = self.read_range(self._position, self._position + len(b) - 1)
+        size = len(data)
+        b[:size] = data
+        self._position += size
+
+        return size
+
+
+class ArtifactWriter(io.RawIOBase):
+    """
+    A file-like writer of an object. The written bytes are sent as a
+    resumable upload on a background thread, and the object is created when
+    the writer is closed. Leaving a `with` block because of an exception
+    aborts the upload.
+    """
+
+    def __init__(self, blob: storage.Blob, content_type: str = None,
+                 buffer_size: int = WRITE_BUFFER_SIZE,
+                 compression: str = None):
+        """
+        Args:
+            blob (storage.Blob): The object to write, with its metadata set.
+            content_type (str, optional): The content type of the object.
+            Defaults to None.
+            buffer_size (int, optional): The size of the chunks passed to the
+            upload. Defaults to WRITE_BUFFER_SIZE.
+            compression (str, optional): 'gzip' or 'zstd' for compressing the
+            written bytes and setting the content encoding of the object.
+            Defaults to None.
+        """
+        super().__init__()
+        self._blob = blob
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+        self._compressor = None
+        self._pipe = _ChunkPipe()
+        self._error = None
+        self._written = 0
+        self.name = blob.name
+
+        if compression is not None:
+            self._compressor = _compressor(compression)
+            _set_content_encoding(blob, compression)
+
+        self._upload_thread = threading.Thread(target=self._upload,
+                                               args=(content_type,),
+                                               daemon=True)
+        self._upload_thread.start()
+
+    def _upload(self, content_type: str):
+        try:
+            self._blob.upload_from_file(self._pipe, content_type=content_type)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._pipe.close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._written
+
+    def write(self, b) -> int:
+        if self.closed:
+            raise ValueError('I/O operation on closed artifact writer.')
+
+        with memoryview(b) as view, view.cast('B') as data:
+            size = len(data)
+            self._buffer += data
+
+        self._written += size
+
+        if len(self._buffer) >= self._buffer_size:
+            self._flush_buffer()
+
+        return size
+
+    def _flush_buffer(self, final: bool = False):
+        chunk = self._buffer
+
+        if self._compressor is not None:
+            chunk = self._compressor.compress(chunk)
+
+            if final:
+                chunk += self._compressor.flush()
+
+        try:
+            self._pipe.put(chunk)
+        except BrokenPipeError:
+            raise self._error or BrokenPipeError('The upload has stopped.')
+
+        self._buffer = bytearray()
+
+    def close(self):
+        """Complete the upload and create the object."""
+        if self.closed:
+            return
+
+        try:
+            self._flush_buffer(final=True)
+            self._pipe.finish()
+            self._upload_thread.join()
+        finally:
+            super().close()
+
+        if self._error is not None:
+            raise self._error
+
+        _BYTES.inc(self._pipe.tell(), operation='open_artifact',
+                   direction='upload')
+
+    def abort(self):
+        """Stop the upload without creating the object."""
+        if self.closed:
+            return
+
+        self._pipe.finish(IOError('The artifact writer was aborted.'))
+        self._upload_thread.join()
+        super().close()
+
+
+def _part_uploaded(blob: storage.Blob, part: memoryview) -> bool:
+    """
+    Check whether a part of a composite upload was already uploaded by an
+    earlier, interrupted, call.
+
+    Args:
+        blob (storage.Blob): The part object, with its properties loaded.
+        part (memoryview): The content of the part.
+
+    Returns:
+        bool: True if the object holds exactly the content of the part.
+    """
+    if blob is None or blob.size != len(part):
+        return False
+    if blob.crc32c and google_crc32c is not None:
+        return _buffer_checksum(part, 'crc32c') == blob.crc32c
+    if blob.md5_hash:
+        return _buffer_checksum(part, 'md5') == blob.md5_hash
+
+    return False
+
+
+def _composite_upload(bucket: storage.Bucket,
+                      object_name: str,
+                      file_path: str,
+                      metadata: Dict[str, Any] = None,
+                      max_workers: int = MAX_WORKERS) -> int:
+    """
+    Upload a file as parts on a thread pool and compose them into a single
+    object. The parts are read straight from a memory map of the file.
+    The parts are uploaded under COMPOSITE_PARTS_PREFIX and deleted once
+    they are composed. Parts left by an interrupted upload are not uploaded
+    again by the next upload of the same file, and abandoned parts are left
+    to the lifecycle rules of the bucket.
+
+    Args:
+        bucket (storage.Bucket): The destination bucket.
+        object_name (str): The name of the composed object.
+        file_path (str): The file to upload.
+        metadata (Dict[str, Any], optional): The metadata of the object.
+        Defaults to None.
+        max_workers (int, optional): The number of parts to upload
+        concurrently. Defaults to MAX_WORKERS.
+
+    Returns:
+        int: The number of parts.
+    """
+    file_size = os.path.getsize(file_path)
+    part_count = min(_MAX_COMPOSE_COMPONENTS,
+                     math.ceil(file_size / PARALLEL_UPLOAD_PART_SIZE))
+    part_size = math.ceil(file_size / part_count)
+    part_names = [f'{COMPOSITE_PARTS_PREFIX}{object_name}/'
+                  f'part-{i:02d}-of-{part_count:02d}'
+                  for i in range(part_count)]
+
+    with open(file_path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            memoryview(mm) as view:
+
+        def upload_part(index: int) -> storage.Blob:
+            part = view[index * part_size:(index + 1) * part_size]
+            name = part_names[index]
+
+            try:
+                if not _part_uploaded(bucket.get_blob(name), part):
+                    blob = bucket.blob(name, chunk_size=UPLOAD_CHUNK_SIZE)
+                    blob.upload_from_file(_BufferReader(part),
+                                          size=len(part))
+            finally:
+                part.release()
+
+            return bucket.blob(name)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            parts = list(executor.map(upload_part, range(part_count)))
+
+    blob = bucket.blob(object_name)
+    blob.metadata = metadata
+    blob.compose(parts)
+
+    for part in parts:
+        try:
+            part.delete()
+        except (NotFound, GoogleCloudError):
+            # The object is composed, a stray part is only left to the
+            # lifecycle rules of the bucket.
+            pass
+
+    return part_count
+
+
+def _upload_compressed(bucket: storage.Bucket,
+                       object_name: str,
+                       file_path: str,
+                       metadata: Dict[str, Any],
+                       compression: str,
+                       max_workers: int = MAX_WORKERS) -> int:
+    """
+    Upload a file compressed with gzip or zstd, compressing on a background
+    thread while the compressed stream is uploaded.
+    The object gets the codec as its content encoding, and the codec and the
+    uncompressed size in its metadata.
+
+    Returns:
+        int: The uploaded (compressed) size.
+    """
+    blob = bucket.blob(object_name, chunk_size=UPLOAD_CHUNK_SIZE)
+    blob.metadata = dict(metadata or {},
+                         uncompressedSize=str(os.path.getsize(file_path)))
+    _set_content_encoding(blob, compression)
+    pipe = _ChunkPipe()
+    chunks = _compress_file(file_path, compression, max_workers=max_workers)
+    producer = threading.Thread(target=pipe.feed, args=(chunks,), daemon=True)
+    producer.start()
+
+    try:
+        # Errors of the compression are raised by the reads of the upload.
+        blob.upload_from_file(pipe)
+    finally:
+        pipe.close()
+        producer.join()
+
+    return pipe.tell()
+
+
+def _upload_file(bucket: storage.Bucket,
+                 object_name: str,
+                 file_path: str,
+                 metadata: Dict[str, Any] = None,
+                 parallel_threshold: int = PARALLEL_UPLOAD_THRESHOLD,
+                 max_workers: int = MAX_WORKERS,
+                 compression: str = None) -> int:
+    """
+    Upload a file, compressed as a single stream if a compression is given,
+    or else as parallel composite parts if it is larger than the threshold.
+
+    Returns:
+        int: The number of uploaded parts.
+    """
+    if compression is not None:
+        _upload_compressed(bucket, object_name, file_path, metadata,
+                           compression, max_workers)
+        return 1
+    if os.path.getsize(file_path) > parallel_threshold:
+        return _composite_upload(bucket, object_name, file_path, metadata,
+                                 max_workers)
+
+    blob = bucket.blob(object_name, chunk_size=UPLOAD_CHUNK_SIZE)
+    blob.metadata = metadata
+
+    with open(file_path, 'rb') as f:
+        blob.upload_from_file(f)
+
+    return 1
+
+
+@instrument(_OPERATIONS, _LATENCY, 'create_bucket')
+def create_bucket(bucket_name: str, app_name: str,
+                  storage_class: StorageClasses = StorageClasses.STANDARD,
+                  ) -> bool:
+    """
+     Create a new bucket in Google Cloud Storage.
+
+     Args:
+         bucket_name (str): The name of the bucket.
+         app_name (str): The name of the application using this function.
+         This name is used to create a unique name for the bucket.
+         storage_class (str): The storage class of the bucket.
+         Possible options are: STANDARD, NEARLINE, COLDLINE.
+         Defaults to StorageClasses.STANDARD.
+
+     Returns:
+         bool: True if the bucket was created, false otherwise.
+     """
+    unique_name = app_name + '_' + bucket_name
+    log_metadata = {
+        'bucketName': unique_name,
+        'funcName': 'create_bucket',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+    }
+
+    try:
+        new_bucket = _gcs_client.bucket(unique_name)
+        new_bucket.storage_class(storage_class.name.upper())
+        _gcs_client.create_bucket(new_bucket)
+        log_event(event_name='Bucket Created',
+                  message='A new bucket was created',
+                  storageClass=storage_class.name.lower(),
+                  **log_metadata)
+
+        return True
+    except Conflict as ce:
+        log_event(event_name='Bucket Error',
+                  message=str(ce),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+
+        return False
+
+
+@instrument(_OPERATIONS, _LATENCY, 'upload_artifact')
+def upload_artifact(bucket_name: str,
+                    object_name: str,
+                    file_path: str,
+                    metadata: Dict[str, Any] = None,
+                    parallel_threshold: int = PARALLEL_UPLOAD_THRESHOLD,
+                    max_workers: int = MAX_WORKERS,
+                    compression: str = COMPRESSION) -> bool:
+    """
+    Upload an artifact to Google Cloud Storage under.
+    An "artifact" can be any type of file in any size.
+    Each artifact can be saved with its own metadata.
+
+    Args:
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): An 'object' is a place holder for the file itself.
+        In general the object name is the path of the artifact inside GCS.
+        It can be a directory-like name (e.g my/gcp/object) or a file-like name
+        (e.g my_object).
+        file_path (str): The location of the file to upload in the file system.
+        metadata (Dict[str, Any], optional): The metadata of the artifact.
+        Defaults to None.
+        parallel_threshold (int, optional): Files larger than this size (in
+        bytes) are uploaded as parts on a thread pool and composed into the
+        artifact. Re-uploading a file after an interrupted upload skips the
+        parts that were already uploaded. Defaults to
+        PARALLEL_UPLOAD_THRESHOLD.
+        max_workers (int, optional): The number of parts to upload
+        concurrently, or of compression threads. Defaults to MAX_WORKERS.
+        compression (str, optional): 'gzip' or 'zstd' for compressing the
+        artifact while it is uploaded. The object gets the codec as its
+        content encoding and `download_artifact` decompresses it.
+        Compressed artifacts are uploaded as a single stream. Defaults to
+        COMPRESSION (None, unless configured).
+
+    Returns:
+         bool: True if the file was uploaded, false otherwise.
+    """
+    log_metadata = {
+        'funcName': 'upload_artifact',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+    }
+
+    if compression is not None and compression not in COMPRESSIONS:
+        log_event(event_name='Artifact Uploading Error',
+                  message=f'Unsupported compression: {compression}. '
+                  f'Supported compressions: {COMPRESSIONS}.',
+                  severity=LogSeverities.ERROR,
+                  objectName=object_name,
+                  **log_metadata)
+
+        return False
+
+    try:
+        bucket = _get_bucket(bucket_name)
+        upload_details = {}
+
+        if compression is not None:
+            upload_details['compression'] = compression
+            upload_details['compressedBytes'] = _upload_compressed(
+                bucket, object_name, file_path, metadata, compression,
+                max_workers)
+            uploaded_bytes = upload_details['compressedBytes']
+        else:
+            upload_details['partCount'] = _upload_file(
+                bucket, object_name, file_path, metadata, parallel_threshold,
+                max_workers)
+            uploaded_bytes = os.path.getsize(file_path)
+
+        _BYTES.inc(uploaded_bytes, operation='upload_artifact',
+                   direction='upload')
+
+        log_event(event_name='Artifact Upload',
+                  message='Artifact uploading completed successfully.',
+                  bucketName=bucket_name,
+                  objectName=object_name,
+                  **upload_details,
+                  **log_metadata)
+
+        return True
+    except NotFound as nfe:
+        msg = 'The requested bucket was not found.'
+        log_event(event_name='Artifact Uploading Error',
+                  message=msg,
+                  description=str(nfe),
+                  severity=LogSeverities.ERROR,
+                  bucketName=bucket_name,
+                  **log_metadata)
+
+        return False
+    except GoogleCloudError as gce:
+        msg = 'An error accrued while trying to upload the file.'
+        log_event(event_name='Artifact Uploading Error',
+                  message=msg,
+                  description=str(gce),
+                  severity=LogSeverities.ERROR,
+                  objectName=object_name,
+                  **log_metadata)
+
+        return False
+    except FileNotFoundError as fnfe:
+        log_event(event_name='Artifact Uploading Error',
+                  message=str(fnfe),
+                  severity=LogSeverities.ERROR,
+                  filePath=file_path,
+                  **log_metadata)
+
+        return False
+
+
+@instrument(_OPERATIONS, _LATENCY, 'download_artifact')
+def download_artifact(bucket_name: str,
+                      object_name: str,
+                      generation: int,
+                      dest_dir: str,
+                      dest_file_name: str,
+                      use_cache: bool = True,
+                      decompress: bool = True) -> bool:
+    """
+    Download an object from Google Cloud Storage and save it as a local file.
+    When a cache directory is configured, an object generation is downloaded
+    only once and later calls are served from the local cache. Files served
+    from the cache are read-only hard links to the cache entries and must not
+    be modified in place: bypass the cache for a file that will be modified.
+    Objects with a gzip or zstd content encoding (e.g uploaded with
+    compression) are decompressed while they are downloaded.
+
+    Args:
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): An 'object' is a place holder for the file itself.
+        In general the object name is the path of the artifact inside GCS.
+        It can be a directory-like name (e.g my/gcp/object) or a file-like name
+        (e.g my_object).
+        generation (int): The generation of the object.
+        For more information see [object versioning](https://cloud.google.com/storage/docs/object-versioning).
+        dest_dir (str): The local directory that will contain the artifact.
+        dest_file_name (str): The artifact name on the local file system.
+        use_cache (bool, optional): False for bypassing the artifact cache.
+        Defaults to True.
+        decompress (bool, optional): False for saving compressed objects as
+        is. The cache holds decompressed artifacts, so it is bypassed.
+        Defaults to True.
+
+    Returns:
+        bool: True if the artifact was downloaded, false otherwise.
+    """
+    dest_full_path = os.path.abspath(os.path.join(dest_dir, dest_file_name))
+    server_ip = socket.gethostbyname(socket.gethostname())
+    log_metadata = {
+        'funcName': 'download_artifact',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+    }
+
+    try:
+        bucket = _get_bucket(bucket_name)
+
+        def download(path: str) -> bool:
+            blob = bucket.get_blob(object_name, generation=generation)
+
+            if blob is None:
+                return False
+
+            _download_to_path(blob, path, decompress)
+            _BYTES.inc(os.path.getsize(path), operation='download_artifact',
+                       direction='download')
+
+            return True
+
+        cache_hit = False
+
+        if use_cache and decompress and _artifact_cache is not None and \
+                generation is not None:
+            def fill(path: str):
+                if not download(path):
+                    raise NotFound('The requested object does not exist.')
+
+            cache_hit = _artifact_cache.get_file(bucket_name, object_name,
+                                                 generation, dest_full_path,
+                                                 fill)
+        elif not download(dest_full_path):
+            log_event(event_name='Artifact Downloading Error',
+                      message='The requested object does not exist.',
+                      severity=LogSeverities.WARNING,
+                      objectName=object_name,
+                      **log_metadata)
+
+            return False
+
+        log_event(event_name='Artifact Download',
+                  message='Artifact downloading completed successfully.',
+                  objectName=object_name,
+                  bucketName=bucket_name,
+                  objectGeneration=generation,
+                  localFileLocation=dest_full_path,
+                  localServerIP=server_ip,
+                  cacheHit=cache_hit,
+                  ** log_metadata)
+
+        return True
+    except NotFound as nfe:
+        msg = 'Could not download the artifact.'
+        log_event(event_name='Artifact Downloading Error',
+                  message=msg,
+                  description=str(nfe),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+
+        return False
+    except ValueError as ve:
+        msg = 'Could not decompress the artifact.'
+        log_event(event_name='Artifact Downloading Error',
+                  message=msg,
+                  description=str(ve),
+                  severity=LogSeverities.ERROR,
+                  objectName=object_name,
+                  **log_metadata)
+
+        return False
+
+
+# Returning None (no cache directory) is not a failure, only raising is.
+@instrument(_OPERATIONS, _LATENCY, 'get_cached_artifact_path',
+            is_failure=lambda path: False)
+def get_cached_artifact_path(bucket_name: str,
+                             object_name: str,
+                             generation: int) -> Union[str, None]:
+    """
+    Get the path of an artifact generation in the local artifact cache,
+    downloading it into the cache if it is not cached yet.
+    The file is read-only and should be opened (or memory mapped) right away,
+    since it may be evicted by a later download.
+
+    Args:
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): The name of the artifact inside the bucket.
+        generation (int): The generation of the artifact.
+
+    Raises:
+        NotFound: If the artifact generation does not exist.
+
+    Returns:
+        Union[str, None]: The path of the cached artifact, or None if no cache
+        directory is configured.
+    """
+    if _artifact_cache is None:
+        return None
+
+    bucket = _get_bucket(bucket_name)
+
+    def download(path: str):
+        blob = bucket.get_blob(object_name, generation=generation)
+
+        if blob is None:
+            raise NotFound('The requested object does not exist.')
+
+        _download_to_path(blob, path)
+
+    return _artifact_cache.get_path(bucket_name, object_name, generation,
+                                    download)
+
+
+def get_cache_stats() -> Dict[str, int]:
+    """
+    Get the statistics of the artifact cache of this process.
+
+    Returns:
+        Dict[str, int]: The number of cache hits and misses and the number of
+        bytes that were not downloaded thanks to the cache. Empty if no cache
+        directory is configured.
+    """
+    if _artifact_cache is None:
+        return {}
+
+    return _artifact_cache.stats
+
+
+@instrument(_OPERATIONS, _LATENCY, 'download_artifacts_bunch')
+def download_artifacts_bunch(bucket_name: str,
+                             local_directory_path: str,
+                             data_cloud_path: str = None,
+                             activate_recursive_download: bool = False,
+                             activate_parallel_download: bool = False,
+                             max_workers: int = MAX_WORKERS,
+                             skip_unchanged: bool = True) -> TransferReport:
+    """
+    Download a bunch of artifact form Google Cloud Storage.
+    Each artifact is saved under the local directory by its path relative to
+    the directory of the cloud path, e.g downloading 'data/*.csv' saves
+    'data/a.csv' as 'a.csv' and downloading 'data' saves 'data/raw/b.csv' as
+    'raw/b.csv'.
+
+    Args:
+        bucket_name (str): The bucket that stores the artifacts.
+        local_directory_path (str): The local directory that will contain the
+        downloaded artifacts. If not exists, automatically created.
+        data_cloud_path (str, optional): A path to a subdirectory of the
+        bucket or a wild card path for a group of files.
+        For example:
+        * /folder/to/download
+        * /*.txt
+        If not supplied all files under the requested bucket will be
+        downloaded. Defaults to None.
+        activate_recursive_download (bool, optional): True for downloading the
+        artifacts of subfolders of the specified cloud path or bucket.
+        Defaults to False.
+        activate_parallel_download (bool, optional): True for downloading the
+        artifacts concurrently on a thread pool. Defaults to False.
+        max_workers (int, optional): The size of the thread pool of a parallel
+        download. Defaults to MAX_WORKERS.
+        skip_unchanged (bool, optional): True for skipping artifacts whose
+        local copy already has the same checksum. Defaults to True.
+
+    Returns:
+        TransferReport: The downloaded, skipped and failed artifacts.
+        The report is falsy if any artifact failed.
+    """
+    log_metadata = {
+        'funcName': 'download_artifacts_bunch',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+    }
+    server_ip = socket.gethostbyname(socket.gethostname())
+    report = TransferReport()
+    start_time = time.perf_counter()
+
+    try:
+        os.makedirs(local_directory_path, exist_ok=True)
+    except OSError as ose:
+        log_event(event_name='Directory Creation Error',
+                  message='Could not create the destination directory',
+                  description=str(ose),
+                  severity=LogSeverities.ERROR,
+                  localDirectoryPath=local_directory_path,
+                  **log_metadata)
+        report.add_failure(local_directory_path, str(ose))
+
+        return report
+
+    log_metadata.update({
+        'bucketName': bucket_name,
+        'dataCloudLocation': data_cloud_path,
+        'isRecursiveDownload': activate_recursive_download,
+        'isParallelDownload': activate_parallel_download
+    })
+
+    try:
+        artifacts = _list_artifacts(bucket_name, data_cloud_path,
+                                    activate_recursive_download)
+    except (NotFound, GoogleCloudError) as gce:
+        msg = 'Could not list the artifacts to download.'
+        log_event(event_name='Artifacts Downloading Error',
+                  message=msg,
+                  description=str(gce),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+        report.add_failure(bucket_name, str(gce))
+
+        return report
+
+    def download(blob: storage.Blob, relative_path: str):
+        try:
+            dest_path = _local_path(local_directory_path, relative_path)
+
+            if skip_unchanged and _checksum_matches(dest_path, blob):
+                report.add_skipped(dest_path)
+                return
+
+            os.makedirs(os.path.dirname(dest_path) or '.', exist_ok=True)
+            _download_to_path(blob, dest_path)
+            report.add_file(dest_path, os.path.getsize(dest_path))
+        except Exception as e:
+            report.add_failure(blob.name, str(e))
+
+    workers = max_workers if activate_parallel_download else 1
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for blob, relative_path in artifacts:
+            executor.submit(download, blob, relative_path)
+
+    report.elapsed = time.perf_counter() - start_time
+    _BYTES.inc(report.bytes, operation='download_artifacts_bunch',
+               direction='download')
+
+    if report.failures:
+        msg = f'{len(report.failures)} artifacts could not be downloaded.'
+        log_event(event_name='Artifacts Downloading Error',
+                  message=msg,
+                  description=str(report.failures),
+                  severity=LogSeverities.ERROR,
+                  localDirectoryPath=local_directory_path,
+                  **log_metadata)
+    else:
+        log_event(event_name='Artifacts Bunch Download',
+                  message='Artifacts downloading completed successfully.',
+                  localDirectoryPath=local_directory_path,
+                  localServerIP=server_ip,
+                  **report.as_dict(),
+                  **log_metadata)
+
+    return report
+
+
+@instrument(_OPERATIONS, _LATENCY, 'upload_artifacts_bunch')
+def upload_artifacts_bunch(bucket_name: str,
+                           artifacts: Union[str, Mapping[str, Any]],
+                           object_prefix: str = '',
+                           metadata: Dict[str, Any] = None,
+                           max_workers: int = MAX_WORKERS,
+                           compression: str = COMPRESSION) -> TransferReport:
+    """
+    Upload a bunch of artifacts to Google Cloud Storage on a thread pool.
+
+    Args:
+        bucket_name (str): The bucket that will contain the artifacts.
+        artifacts (Union[str, Mapping[str, Any]]): Either a local directory,
+        whose files are uploaded recursively by their relative path, or a
+        mapping of object names to file paths. A mapping value can also be a
+        (file path, metadata) tuple for metadata of a specific artifact.
+        object_prefix (str, optional): A prefix for all the object names,
+        e.g 'models/v2/'. Defaults to ''.
+        metadata (Dict[str, Any], optional): Metadata for all the artifacts.
+        Metadata of a specific artifact is merged into it. Defaults to None.
+        max_workers (int, optional): The number of concurrent uploads.
+        Defaults to MAX_WORKERS.
+        compression (str, optional): 'gzip' or 'zstd' for compressing the
+        artifacts, see `upload_artifact`. Defaults to COMPRESSION.
+
+    Returns:
+        TransferReport: The uploaded and failed files.
+        The report is falsy if any file failed.
+    """
+    log_metadata = {
+        'funcName': 'upload_artifacts_bunch',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectPrefix': object_prefix
+    }
+    report = TransferReport()
+    start_time = time.perf_counter()
+
+    if compression is not None and compression not in COMPRESSIONS:
+        msg = f'Unsupported compression: {compression}. ' \
+            f'Supported compressions: {COMPRESSIONS}.'
+        log_event(event_name='Artifacts Uploading Error',
+                  message=msg,
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+        report.add_failure(bucket_name, msg)
+
+        return report
+
+    if isinstance(artifacts, str):
+        local_directory_path = artifacts
+        artifacts = {}
+
+        for root, _, file_names in os.walk(local_directory_path):
+            for file_name in file_names:
+                file_path = os.path.join(root, file_name)
+                relative_path = os.path.relpath(file_path,
+                                                local_directory_path)
+                object_name = relative_path.replace(os.sep, '/')
+                artifacts[object_name] = file_path
+
+    bucket = _get_bucket(bucket_name)
+
+    def upload(object_name: str, artifact: Any):
+        file_path, artifact_metadata = artifact if \
+            isinstance(artifact, tuple) else (artifact, None)
+        object_metadata = dict(metadata or {})
+        object_metadata.update(artifact_metadata or {})
+
+        try:
+            _upload_file(bucket, object_prefix + object_name, file_path,
+                         object_metadata or None, compression=compression)
+            report.add_file(file_path, os.path.getsize(file_path))
+        except Exception as e:
+            report.add_failure(file_path, str(e))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for object_name, artifact in artifacts.items():
+            executor.submit(upload, object_name, artifact)
+
+    report.elapsed = time.perf_counter() - start_time
+    _BYTES.inc(report.bytes, operation='upload_artifacts_bunch',
+               direction='upload')
+
+    if report.failures:
+        msg = f'{len(report.failures)} artifacts could not be uploaded.'
+        log_event(event_name='Artifacts Uploading Error',
+                  message=msg,
+                  description=str(report.failures),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+    else:
+        log_event(event_name='Artifacts Bunch Upload',
+                  message='Artifacts uploading completed successfully.',
+                  **report.as_dict(),
+                  **log_metadata)
+
+    return report
+
+
+@instrument(_OPERATIONS, _LATENCY, 'sync_directory')
+def sync_directory(local_dir: str,
+                   bucket_name: str,
+                   prefix: str = '',
+                   direction: str = 'up',
+                   delete_extra: bool = False,
+                   max_workers: int = MAX_WORKERS,
+                   compression: str = COMPRESSION) -> TransferReport:
+    """
+    Mirror a local directory to a bucket prefix ('up') or a bucket prefix to
+    a local directory ('down'), transferring only the files whose content
+    differs.
+    Files are compared by checksum (crc32c, or md5 without the crc32c
+    extension) with the checksums of the object listing. The size,
+    modification time and checksum of the local files are kept in a manifest
+    file in the directory (SYNC_MANIFEST_NAME), so a file is hashed again only
+    if it has changed since the last sync.
+    Compressed objects are downloaded decompressed. Uploaded files are
+    compressed with the given compression, and the checksum of their
+    content is kept in the metadata of the object for the next syncs.
 
-     Args:
-         bucket_name (str): The name of the bucket.
-         app_name (str): The name of the application using this function.
-         This name is used to create a unique name for the bucket.
-         storage_class (str): The storage class of the bucket.
-         Possible options are: STANDARD, NEARLINE, COLDLINE.
-         Defaults to StorageClasses.STANDARD.
+    Args:
+        local_dir (str): The local directory. Created if not exists when
+        syncing down.
+        bucket_name (str): The bucket to sync with.
+        prefix (str, optional): The directory-like prefix of the objects,
+        e.g 'models/v2'. Defaults to '' (the whole bucket).
+        direction (str, optional): 'up' for uploading the local directory,
+        'down' for downloading the prefix. Defaults to 'up'.
+        delete_extra (bool, optional): True for deleting the objects (when
+        syncing up) or the local files (when syncing down) that do not exist
+        on the source side. Defaults to False.
+        max_workers (int, optional): The number of concurrent transfers.
+        Defaults to MAX_WORKERS.
+        compression (str, optional): 'gzip' or 'zstd' for compressing the
+        uploaded files, see `upload_artifact`. Defaults to COMPRESSION.
 
-     Returns:
-         bool: True if the bucket was created, false otherwise.
-     """
-    unique_name = app_name + '_' + bucket_name
+    Returns:
+        TransferReport: The transferred, skipped (unchanged), deleted and
+        failed files. The report is falsy if any file failed.
+    """
     log_metadata = {
-        'bucketName': unique_name,
-        'funcName': 'create_bucket',
+        'funcName': 'sync_directory',
         'eventGroup': 'Google Cloud Storage',
         'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectPrefix': prefix,
+        'localDirectoryPath': local_dir,
+        'direction': direction
     }
+    report = TransferReport()
+    start_time = time.perf_counter()
+
+    if direction not in ('up', 'down') or \
+            (compression is not None and compression not in COMPRESSIONS):
+        msg = f'Unsupported sync options. Directions: up, down, ' \
+            f'compressions: {COMPRESSIONS}.'
+        log_event(event_name='Directory Sync Error',
+                  message=msg,
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+        report.add_failure(local_dir, msg)
+
+        return report
+
+    prefix = prefix.strip('/')
+    object_prefix = prefix + '/' if prefix else ''
 
     try:
-        new_bucket = _gcs_client.bucket(unique_name)
-        new_bucket.storage_class(storage_class.name.upper())
-        _gcs_client.create_bucket(new_bucket)
-        log_event(event_name='Bucket Created',
-                  message='A new bucket was created',
-                  storageClass=storage_class.name.lower(),
+        if direction == 'down':
+            os.makedirs(local_dir, exist_ok=True)
+        elif not os.path.isdir(local_dir):
+            raise NotADirectoryError(f'No such directory: {local_dir}')
+
+        remote = {relative_path: blob for blob, relative_path in
+                  _list_artifacts(bucket_name, prefix, recursive=True)}
+    except (OSError, NotFound, GoogleCloudError) as e:
+        log_event(event_name='Directory Sync Error',
+                  message='Could not list the files to sync.',
+                  description=str(e),
+                  severity=LogSeverities.ERROR,
                   **log_metadata)
+        report.add_failure(local_dir, str(e))
 
-        return True
-    except Conflict as ce:
-        log_event(event_name='Bucket Error',
-                  message=str(ce),
+        return report
+
+    local = _local_files(local_dir)
+    manifest = _load_sync_manifest(local_dir)
+    # Entries of deleted files are dropped.
+    manifest = {relative_path: manifest.get(relative_path, {})
+                for relative_path in local}
+    bucket = _get_bucket(bucket_name)
+
+    def is_unchanged(relative_path: str) -> bool:
+        blob = remote.get(relative_path)
+        file_path = local.get(relative_path)
+
+        if blob is None or file_path is None or \
+                os.path.getsize(file_path) != _content_size(blob):
+            return False
+
+        entry = manifest[relative_path]
+        algorithm = _sync_algorithm(blob)
+
+        if algorithm is None:
+            # The content checksum of the object is not known (e.g it was
+            # compressed by upload_artifact), but the file may still be the
+            # unmodified download of this generation.
+            stat = os.stat(file_path)
+            return entry.get('generation') == blob.generation and \
+                entry.get('size') == stat.st_size and \
+                entry.get('mtime') == stat.st_mtime_ns
+
+        return _sync_checksum(file_path, entry, algorithm) == \
+            _content_checksum(blob, algorithm)
+
+    def upload(relative_path: str):
+        file_path = local[relative_path]
+
+        try:
+            if is_unchanged(relative_path):
+                report.add_skipped(file_path)
+                return
+
+            # Hashed before the upload, so the next sync can compare the
+            # file without reading it.
+            algorithm = _sync_algorithm()
+            checksum = _sync_checksum(file_path, manifest[relative_path],
+                                      algorithm)
+            metadata = None
+
+            if compression is not None:
+                metadata = {_UNCOMPRESSED_CHECKSUM_KEYS[algorithm]: checksum}
+
+            _upload_file(bucket, object_prefix + relative_path, file_path,
+                         metadata, compression=compression)
+            report.add_file(file_path, os.path.getsize(file_path))
+        except Exception as e:
+            report.add_failure(file_path, str(e))
+
+    def download(relative_path: str):
+        blob = remote[relative_path]
+
+        try:
+            file_path = local.get(relative_path) or \
+                _local_path(local_dir, relative_path)
+
+            if is_unchanged(relative_path):
+                report.add_skipped(file_path)
+                return
+
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            _download_to_path(blob, file_path)
+            stat = os.stat(file_path)
+            entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                     'generation': blob.generation}
+
+            for algorithm in ('crc32c', 'md5'):
+                checksum = _content_checksum(blob, algorithm)
+
+                if checksum:
+                    entry[algorithm] = checksum
+
+            manifest[relative_path] = entry
+            report.add_file(file_path, stat.st_size)
+        except Exception as e:
+            report.add_failure(blob.name, str(e))
+
+    def delete_object(relative_path: str):
+        blob = remote[relative_path]
+
+        try:
+            blob.delete()
+            report.add_deleted(blob.name)
+        except (NotFound, GoogleCloudError) as gce:
+            report.add_failure(blob.name, str(gce))
+
+    def delete_file(relative_path: str):
+        file_path = local[relative_path]
+
+        try:
+            os.remove(file_path)
+            del manifest[relative_path]
+            report.add_deleted(file_path)
+        except OSError as ose:
+            report.add_failure(file_path, str(ose))
+
+    if direction == 'up':
+        transfer, delete = upload, delete_object
+        sources, targets = local, remote
+    else:
+        transfer, delete = download, delete_file
+        sources, targets = remote, local
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for relative_path in sources:
+            executor.submit(transfer, relative_path)
+
+        if delete_extra:
+            for relative_path in targets:
+                if relative_path not in sources:
+                    executor.submit(delete, relative_path)
+
+    try:
+        _save_sync_manifest(local_dir, manifest)
+    except OSError as ose:
+        # The sync itself succeeded, the next one will only rehash.
+        log_event(event_name='Directory Sync Warning',
+                  message='Could not save the sync manifest.',
+                  description=str(ose),
+                  severity=LogSeverities.WARNING,
+                  **log_metadata)
+
+    report.elapsed = time.perf_counter() - start_time
+    _BYTES.inc(report.bytes, operation='sync_directory',
+               direction='upload' if direction == 'up' else 'download')
+
+    if report.failures:
+        msg = f'{len(report.failures)} files could not be synced.'
+        log_event(event_name='Directory Sync Error',
+                  message=msg,
+                  description=str(report.failures),
                   severity=LogSeverities.ERROR,
                   **log_metadata)
+    else:
+        log_event(event_name='Directory Sync',
+                  message='Directory syncing completed successfully.',
+                  **report.as_dict(),
+                  **log_metadata)
 
-        return False
+    return report
 
 
-def upload_artifact(bucket_name: str,
-                    object_name: str,
-                    file_path: str,
-                    metadata: Dict[str, Any] = None) -> bool:
+@instrument(_OPERATIONS, _LATENCY, 'upload_artifact_stream')
+def upload_artifact_stream(bucket_name: str,
+                           object_name: str,
+                           chunks: Iterable[bytes],
+                           metadata: Dict[str, Any] = None,
+                           content_type: str = None,
+                           compression: str = None) -> bool:
     """
-    Upload an artifact to Google Cloud Storage under.
-    An "artifact" can be any type of file in any size.
-    Each artifact can be saved with its own metadata.
+    Upload an artifact to Google Cloud Storage from a stream of bytes chunks,
+    without writing it to the local file system.
+    The chunks are produced on a background thread while the artifact is sent
+    as a resumable upload, so producing and uploading overlap and only a
+    bounded number of chunks are held in memory.
 
     Args:
-        bucket_name (str): The bucket that contains the artifact.
-        object_name (str): An 'object' is a place holder for the file itself.
-        In general the object name is the path of the artifact inside GCS.
-        It can be a directory-like name (e.g my/gcp/object) or a file-like name
-        (e.g my_object).
-        file_path (str): The location of the file to upload in the file system.
+        bucket_name (str): The bucket that will contain the artifact.
+        object_name (str): The name of the artifact inside the bucket.
+        chunks (Iterable[bytes]): The content of the artifact. Can be a lazy
+        generator.
         metadata (Dict[str, Any], optional): The metadata of the artifact.
         Defaults to None.
+        content_type (str, optional): The content type of the artifact.
+        Defaults to None.
+        compression (str, optional): 'gzip' or 'zstd' for compressing the
+        stream, see `upload_artifact`. Defaults to None.
 
     Returns:
-         bool: True if the file was uploaded, false otherwise.
+         bool: True if the artifact was uploaded, false otherwise.
     """
     log_metadata = {
-        'funcName': 'upload_artifact',
+        'funcName': 'upload_artifact_stream',
         'eventGroup': 'Google Cloud Storage',
         'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectName': object_name
     }
 
+    if compression is not None and compression not in COMPRESSIONS:
+        log_event(event_name='Artifact Uploading Error',
+                  message=f'Unsupported compression: {compression}. '
+                  f'Supported compressions: {COMPRESSIONS}.',
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+
+        return False
+
+    if compression is not None:
+        chunks = _compress_chunks(chunks, compression)
+
+    pipe = _ChunkPipe()
+    producer = threading.Thread(target=pipe.feed, args=(chunks,), daemon=True)
+
     try:
-        bucket = _gcs_client.get_bucket(bucket_name)
-        blob = bucket.blob(object_name)
-        blob.metadata(metadata)
+        bucket = _get_bucket(bucket_name)
+        blob = bucket.blob(object_name, chunk_size=UPLOAD_CHUNK_SIZE)
+        blob.metadata = metadata
+
+        if compression is not None:
+            _set_content_encoding(blob, compression)
 
-        with open(file_path, 'rb') as f:
-            blob.upload_from_file(f)
+        producer.start()
+        blob.upload_from_file(pipe, content_type=content_type)
 
+        _BYTES.inc(pipe.tell(), operation='upload_artifact_stream',
+                   direction='upload')
         log_event(event_name='Artifact Upload',
                   message='Artifact uploading completed successfully.',
-                  bucketName=bucket_name,
-                  objectName=object_name,
+                  uploadedBytes=pipe.tell(),
                   **log_metadata)
 
         return True
@@ -108,179 +2015,313 @@ def upload_artifact(bucket_name: str,
                   message=msg,
                   description=str(nfe),
                   severity=LogSeverities.ERROR,
-                  bucketName=bucket_name,
                   **log_metadata)
 
         return False
     except GoogleCloudError as gce:
-        msg = 'An error accrued while trying to upload the file.'
+        msg = 'An error accrued while trying to upload the stream.'
         log_event(event_name='Artifact Uploading Error',
                   message=msg,
                   description=str(gce),
                   severity=LogSeverities.ERROR,
-                  objectName=object_name,
                   **log_metadata)
 
         return False
-    except FileNotFoundError as fnfe:
+    except Exception as e:
+        if pipe.error is not e:
+            raise
+
+        msg = 'An error accrued while producing the artifact content.'
         log_event(event_name='Artifact Uploading Error',
-                  message=str(fnfe),
+                  message=msg,
+                  description=str(e),
                   severity=LogSeverities.ERROR,
-                  filePath=file_path,
                   **log_metadata)
 
         return False
+    finally:
+        pipe.close()
+        if producer.is_alive():
+            producer.join()
 
 
-def download_artifact(bucket_name: str,
-                      object_name: str,
-                      generation: int,
-                      dest_dir: str,
-                      dest_file_name: str) -> bool:
+@instrument(_OPERATIONS, _LATENCY, 'update_artifact_metadata')
+def update_artifact_metadata(bucket_name: str,
+                             object_name: str,
+                             metadata: Dict[str, Any]) -> bool:
     """
-    Download an object from Google Cloud Storage and save it as a local file.
+    Update the metadata of an existing artifact. Existing keys that do not
+    appear in the new metadata are kept.
 
     Args:
         bucket_name (str): The bucket that contains the artifact.
-        object_name (str): An 'object' is a place holder for the file itself.
-        In general the object name is the path of the artifact inside GCS.
-        It can be a directory-like name (e.g my/gcp/object) or a file-like name
-        (e.g my_object).
-        generation (int): The generation of the object.
-        For more information see [object versioning](https://cloud.google.com/storage/docs/object-versioning).
-        dest_dir (str): The local directory that will contain the artifact.
-        dest_file_name (str): The artifact name on the local file system.
+        object_name (str): The name of the artifact inside the bucket.
+        metadata (Dict[str, Any]): The metadata to set.
 
     Returns:
-        bool: True if the artifact was downloaded, false otherwise.
+        bool: True if the metadata was updated, false otherwise.
     """
-    dest_full_path = os.path.abspath(os.path.join(dest_dir, dest_file_name))
-    server_ip = socket.gethostbyname(socket.gethostname())
     log_metadata = {
-        'funcName': 'download_artifact',
+        'funcName': 'update_artifact_metadata',
         'eventGroup': 'Google Cloud Storage',
         'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectName': object_name
     }
 
     try:
-        bucket = _gcs_client.get_bucket(bucket_name)
-        blob = bucket.get_blob(object_name=object_name, generation=generation)
-
-        if blob is None:
-            log_event(event_name='Artifact Downloading Error',
-                      message='The requested object does not exist.',
-                      severity=LogSeverities.WARNING,
-                      objectName=object_name,
-                      **log_metadata)
-
-            return False
+        blob = _get_bucket(bucket_name).blob(object_name)
+        blob.metadata = metadata
+        blob.patch()
 
-        blob.download_to_filename(dest_full_path)
-        log_event(event_name='Artifact Download',
-                  message='Artifact downloading completed successfully.',
-                  objectName=object_name,
-                  bucketName=bucket_name,
-                  objectGeneration=generation,
-                  localFileLocation=dest_full_path,
-                  localServerIP=server_ip,
-                  ** log_metadata)
+        log_event(event_name='Artifact Metadata Update',
+                  message='Artifact metadata was updated.',
+                  severity=LogSeverities.DEBUG,
+                  **log_metadata)
 
         return True
-    except NotFound as nfe:
-        msg = 'Could not download the artifact.'
-        log_event(event_name='Artifact Downloading Error',
-                  message=msg,
-                  description=str(nfe),
+    except (NotFound, GoogleCloudError) as gce:
+        log_event(event_name='Artifact Metadata Error',
+                  message='Could not update the artifact metadata.',
+                  description=str(gce),
                   severity=LogSeverities.ERROR,
                   **log_metadata)
 
+        return False
 
-def download_artifacts_bunch(bucket_name: str,
-                             local_directory_path: str,
-                             data_cloud_path: str = None,
-                             activate_recursive_download: bool = False,
-                             activate_parallel_download: bool = False) -> bool:
+
+def open_artifact(bucket_name: str,
+                  object_name: str,
+                  mode: str = 'rb',
+                  generation: int = None,
+                  metadata: Dict[str, Any] = None,
+                  content_type: str = None,
+                  buffer_size: int = None,
+                  compression: str = None) -> BinaryIO:
     """
-    Download a bunch of artifact form Google Cloud Storage.
+    Open an artifact as a binary file-like object, for reading parts of it or
+    writing it without using the local file system.
+    Ranges of compressed artifacts (with a gzip or zstd content encoding)
+    can not be read on their own, so they are downloaded and decompressed
+    into a temporary file instead.
 
     Args:
-        bucket_name (str): The bucket that stores the artifacts.
-        local_directory_path (str): The local directory that will contain the
-        downloaded artifacts. If not exists, automatically created.
-        data_cloud_path (str, optional): A path to a subdirectory of the
-        bucket or a wild card path for a group of files.
-        For example:
-        * /folder/to/download
-        * /*.txt
-        If not supplied all files under the requested bucket will be
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): The name of the artifact inside the bucket.
+        mode (str, optional): 'rb' for reading or 'wb' for writing.
+        Defaults to 'rb'.
+        generation (int, optional): The generation to read.
+        Defaults to None (the latest).
+        metadata (Dict[str, Any], optional): The metadata of a written
+        artifact. Defaults to None.
+        content_type (str, optional): The content type of a written
+        artifact. Defaults to None.
+        buffer_size (int, optional): The read-ahead size of a reader or the
+        chunk size of a writer. Defaults to READ_AHEAD_SIZE or
+        WRITE_BUFFER_SIZE.
+        compression (str, optional): 'gzip' or 'zstd' for compressing a
+        written artifact, which is decompressed when it is read or
         downloaded. Defaults to None.
-        activate_recursive_download (bool, optional): True for downloading the
-        artifacts of subfolders of the specified cloud path or bucket.
-        Defaults to False.
-        activate_parallel_download (bool, optional): True for using
-        multithreaded download. Use this only if there is a large amount of
-        artifacts to download. Defaults to False.
+
+    Raises:
+        ValueError: If the mode or the compression is not supported.
+        NotFound: If the artifact to read does not exist.
+
+    Returns:
+        BinaryIO: An `io.BufferedReader` over an `ArtifactReader` (or a
+        temporary file for compressed artifacts) in 'rb' mode, an
+        `ArtifactWriter` in 'wb' mode.
+    """
+    bucket = _get_bucket(bucket_name)
+
+    if mode == 'rb':
+        blob = bucket.get_blob(object_name, generation=generation)
+
+        if blob is None:
+            raise NotFound(f'The artifact {object_name} does not exist in '
+                           f'{bucket_name}.')
+
+        if blob.content_encoding in COMPRESSIONS:
+            tmp_file = tempfile.TemporaryFile()
+
+            try:
+                _download_decompressed(blob, tmp_file)
+            except BaseException:
+                tmp_file.close()
+                raise
+
+            _BYTES.inc(blob.size, operation='open_artifact',
+                       direction='download')
+            tmp_file.seek(0)
+
+            return tmp_file
+
+        return io.BufferedReader(ArtifactReader(blob),
+                                 buffer_size=buffer_size or READ_AHEAD_SIZE)
+    if mode == 'wb':
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f'Unsupported compression: {compression}. '
+                             f'Supported compressions: {COMPRESSIONS}.')
+
+        blob = bucket.blob(object_name, chunk_size=UPLOAD_CHUNK_SIZE)
+        blob.metadata = metadata
+
+        return ArtifactWriter(blob, content_type,
+                              buffer_size or WRITE_BUFFER_SIZE, compression)
+
+    raise ValueError(f"Unsupported mode '{mode}', use 'rb' or 'wb'.")
+
+
+@instrument(_OPERATIONS, _LATENCY, 'upload_bytes')
+def upload_bytes(bucket_name: str,
+                 object_name: str,
+                 data: Union[bytes, bytearray, memoryview],
+                 metadata: Dict[str, Any] = None,
+                 content_type: str = None,
+                 compression: str = None) -> bool:
+    """
+    Upload an in-memory content as an artifact, without copying it unless it
+    is compressed.
+
+    Args:
+        bucket_name (str): The bucket that will contain the artifact.
+        object_name (str): The name of the artifact inside the bucket.
+        data (Union[bytes, bytearray, memoryview]): The artifact content.
+        metadata (Dict[str, Any], optional): The metadata of the artifact.
+        Defaults to None.
+        content_type (str, optional): The content type of the artifact.
+        Defaults to None.
+        compression (str, optional): 'gzip' or 'zstd' for compressing the
+        content, see `upload_artifact`. Defaults to None.
 
     Returns:
-        bool: True if the artifacts were downloaded, false otherwise.
+        bool: True if the artifact was uploaded, false otherwise.
     """
     log_metadata = {
-        'funcName': 'download_artifacts_bunch',
+        'funcName': 'upload_bytes',
         'eventGroup': 'Google Cloud Storage',
         'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectName': object_name
     }
-    server_ip = socket.gethostbyname(socket.gethostname())
 
-    if not os.path.exists(local_directory_path):
-        try:
-            os.mkdir(local_directory_path)
-        except OSError as ose:
-            log_event(event_name='Directory Creation Error',
-                      message='Could not create the destination directory',
-                      description=str(ose),
-                      severity=LogSeverities.ERROR,
-                      localDirectoryPath=local_directory_path,
-                      **log_metadata)
+    if compression is not None and compression not in COMPRESSIONS:
+        log_event(event_name='Artifact Uploading Error',
+                  message=f'Unsupported compression: {compression}. '
+                  f'Supported compressions: {COMPRESSIONS}.',
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
 
         return False
 
-    url = f'gs://{bucket_name}'
+    try:
+        blob = _get_bucket(bucket_name).blob(object_name,
+                                             chunk_size=UPLOAD_CHUNK_SIZE)
+        blob.metadata = metadata
+
+        if compression is not None:
+            _set_content_encoding(blob, compression)
+            data = b''.join(_compress_chunks([data], compression))
 
-    if data_cloud_path:
-        url = url + f'/{data_cloud_path}'
+        with memoryview(data) as view, view.cast('B') as content:
+            size = len(content)
+            blob.upload_from_file(_BufferReader(content), size=size,
+                                  content_type=content_type)
 
-    download_command = ['gsutil', 'cp', url, local_directory_path]
+        _BYTES.inc(size, operation='upload_bytes', direction='upload')
+        log_event(event_name='Artifact Upload',
+                  message='Artifact uploading completed successfully.',
+                  severity=LogSeverities.DEBUG,
+                  uploadedBytes=size,
+                  **log_metadata)
+
+        return True
+    except (NotFound, GoogleCloudError) as gce:
+        msg = 'An error accrued while trying to upload the content.'
+        log_event(event_name='Artifact Uploading Error',
+                  message=msg,
+                  description=str(gce),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
 
-    if activate_parallel_download:
-        index = download_command.index('gsutil', 0, len(download_command))
-        download_command.insert(index+1, '-m')
-    if activate_recursive_download:
-        index = download_command.index('cp', 0, len(download_command))
-        download_command.insert(index+1, '-r')
+        return False
 
-    log_metadata.update({
+
+@instrument(_OPERATIONS, _LATENCY, 'download_bytes')
+def download_bytes(bucket_name: str,
+                   object_name: str,
+                   generation: int = None,
+                   start: int = None,
+                   end: int = None) -> Union[bytes, None]:
+    """
+    Download an artifact, or a byte range of it, into memory.
+    Compressed artifacts (with a gzip or zstd content encoding) are
+    decompressed, and the range is of the decompressed content.
+
+    Args:
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): The name of the artifact inside the bucket.
+        generation (int, optional): The generation of the artifact.
+        Defaults to None (the latest).
+        start (int, optional): The first byte to download. Defaults to None
+        (the beginning of the artifact).
+        end (int, optional): The last byte to download (inclusive).
+        Defaults to None (the end of the artifact).
+
+    Returns:
+        Union[bytes, None]: The content, or None if it could not be
+        downloaded.
+    """
+    log_metadata = {
+        'funcName': 'download_bytes',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
         'bucketName': bucket_name,
-        'dataCloudLocation': data_cloud_path,
-        'isRecursiveDownload': activate_recursive_download,
-        'isParallelDownload': activate_parallel_download
-    })
+        'objectName': object_name,
+        'objectGeneration': generation
+    }
 
     try:
-        subprocess.run(download_command)
-        log_event(event_name='Artifacts Bunch Download',
-                  message='Artifacts downloading completed successfully.',
-                  localDirectoryPath=local_directory_path,
-                  localServerIP=server_ip,
+        bucket = _get_bucket(bucket_name)
+
+        if start is None and end is None:
+            blob = bucket.blob(object_name, generation=generation)
+            # The content encoding is set by the download response.
+            content = blob.download_as_bytes(raw_download=True)
+        else:
+            # A range of a compressed artifact is a range of its decompressed
+            # content, so the encoding is needed before the download.
+            blob = bucket.get_blob(object_name, generation=generation)
+
+            if blob is None:
+                raise NotFound(f'The artifact {object_name} does not exist '
+                               f'in {bucket_name}.')
+
+            content = blob.download_as_bytes(raw_download=True) \
+                if blob.content_encoding in COMPRESSIONS else \
+                blob.download_as_bytes(start=start, end=end)
+
+        _BYTES.inc(len(content), operation='download_bytes',
+                   direction='download')
+
+        if blob.content_encoding in COMPRESSIONS:
+            content = _decompress_bytes(content, blob.content_encoding)
+            content = content[start:None if end is None else end + 1]
+
+        return content
+    except (NotFound, GoogleCloudError) as gce:
+        log_event(event_name='Artifact Downloading Error',
+                  message='Could not download the artifact.',
+                  description=str(gce),
+                  severity=LogSeverities.ERROR,
                   **log_metadata)
 
-        return True
-    except Exception as e:
-        msg = 'An unexpected error occurred while trying to download the ' +\
-            'artifacts.'
-        log_event(event_name='Artifacts Downloading Error',
-                  message=msg,
-                  description=str(e),
+        return None
+    except ValueError as ve:
+        log_event(event_name='Artifact Downloading Error',
+                  message='Could not decompress the artifact.',
+                  description=str(ve),
                   severity=LogSeverities.ERROR,
                   **log_metadata)
 
-        return False
+        return None
@@ -0,0 +1,465 @@
+"""
+This module contains an asyncio client of Google Cloud Storage, for workloads
+of many small artifacts (e.g reading thousands of feature objects per
+request), where a thread per transfer caps out long before the network does.
+The client talks to the JSON API over a shared aiohttp session and limits the
+concurrent requests with a semaphore. Requires the aiohttp package.
+
+Set the STORAGE_EMULATOR_HOST environment variable (as for the synchronous
+client) or the base_url argument to use a local fake GCS server.
+"""
+import asyncio
+import functools
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Union
+from urllib.parse import quote
+
+from configuration.config import config
+from infra.core.enums import Environments, LogSeverities
+# The metrics of the synchronous client, recorded with 'async_' operations.
+from infra.core.gcp.gcs import (COMPRESSIONS, _BYTES, _LATENCY, _OPERATIONS,
+                                _decompress_bytes)
+from infra.core.logging import log_event
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+_gcs_conf: Dict[str, Any] = config.get('gcs', {})
+ASYNC_MAX_CONCURRENCY = _gcs_conf.get('async_max_concurrency', 64)
+ASYNC_MAX_RETRIES = _gcs_conf.get('async_max_retries', 3)
+GCS_API_URL = 'https://storage.googleapis.com'
+_SCOPES = ('https://www.googleapis.com/auth/devstorage.read_write',)
+# Responses that are worth retrying, as the synchronous client does.
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_LOG_METADATA = {
+    'eventGroup': 'Google Cloud Storage',
+    'environment': Environments.INFRA
+}
+
+
+class AsyncGCSError(Exception):
+    """An error response of the storage API."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class AsyncGCSClient():
+    """
+    An asyncio client of Google Cloud Storage. Use it as an async context
+    manager, or call `close` when done:
+
+        async with AsyncGCSClient() as client:
+            contents = await asyncio.gather(
+                *(client.download(bucket_name, name) for name in names))
+
+    Failed operations are logged and return None or False, like the
+    synchronous methods of infra.core.gcp.gcs. Logging runs on the default
+    executor, so it never blocks the event loop.
+    """
+
+    def __init__(self, max_concurrency: int = ASYNC_MAX_CONCURRENCY,
+                 base_url: str = None,
+                 credentials: Any = None,
+                 max_retries: int = ASYNC_MAX_RETRIES):
+        """
+        Args:
+            max_concurrency (int, optional): The maximal number of concurrent
+            requests, which is also the size of the connection pool.
+            Defaults to ASYNC_MAX_CONCURRENCY.
+            base_url (str, optional): The storage API url. Defaults to None
+            (STORAGE_EMULATOR_HOST if set, GCS_API_URL otherwise).
+            credentials (Any, optional): google.auth credentials. Defaults to
+            None (the application default credentials, or anonymous access
+            for an emulator).
+            max_retries (int, optional): The number of retries of a request
+            that failed with a transient error. Defaults to
+            ASYNC_MAX_RETRIES.
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncGCSClient requires the aiohttp package.')
+
+        emulator_host = os.environ.get('STORAGE_EMULATOR_HOST')
+        self.base_url = (base_url or emulator_host or GCS_API_URL).rstrip('/')
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+
+        if credentials is None and base_url is None and emulator_host:
+            from google.auth.credentials import AnonymousCredentials
+            credentials = AnonymousCredentials()
+
+        self._credentials = credentials
+        # Loop bound objects are created on first use, inside the loop.
+        self._session = None
+        self._semaphore = None
+        self._auth_lock = None
+        self._pending_logs = set()
+
+    async def __aenter__(self) -> 'AsyncGCSClient':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the HTTP session and wait for the pending log events."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+        if self._pending_logs:
+            await asyncio.wait(list(self._pending_logs))
+
+    def _log(self, **kwargs):
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(
+            None, functools.partial(log_event, **_LOG_METADATA, **kwargs))
+        self._pending_logs.add(future)
+        future.add_done_callback(self._pending_logs.discard)
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._auth_lock = asyncio.Lock()
+
+        return self._session
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        headers = {}
+
+        async with self._auth_lock:
+            if self._credentials is None:
+                import google.auth
+                loop = asyncio.get_event_loop()
+                self._credentials, _ = await loop.run_in_executor(
+                    None, functools.partial(google.auth.default,
+                                            scopes=_SCOPES))
+
+            if not self._credentials.valid:
+                # Refreshing is a blocking HTTP call of google.auth.
+                import google.auth.transport.requests
+                request = google.auth.transport.requests.Request()
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self._credentials.refresh,
+                                           request)
+
+        self._credentials.apply(headers)
+
+        return headers
+
+    async def _request(self, method: str, path: str,
+                       params: Dict[str, Any] = None,
+                       data: bytes = None,
+                       headers: Dict[str, str] = None,
+                       decompress: bool = False) -> bytes:
+        """
+        Send a request, retrying transient errors with exponential backoff.
+
+        Args:
+            decompress (bool, optional): True for decompressing a gzip or
+            zstd response body by its content encoding, the way the
+            synchronous downloads do, instead of by aiohttp (which depends on
+            its version for zstd). Defaults to False.
+
+        Returns:
+            bytes: The response body.
+
+        Raises:
+            AsyncGCSError: For an error response.
+            aiohttp.ClientError: If the request could not be sent.
+            ValueError: If a compressed body is invalid or truncated.
+        """
+        session = self._get_session()
+        params = {key: str(value) for key, value in (params or {}).items()
+                  if value is not None}
+        options = {'auto_decompress': False} if decompress else {}
+
+        for attempt in range(self.max_retries + 1):
+            request_headers = dict(headers or {})
+            request_headers.update(await self._auth_headers())
+
+            try:
+                async with self._semaphore:
+                    async with session.request(method,
+                                               self.base_url + path,
+                                               params=params,
+                                               data=data,
+                                               headers=request_headers,
+                                               **options) as response:
+                        body = await response.read()
+
+                if response.status < 400:
+                    encoding = response.headers.get('Content-Encoding')
+
+                    if decompress and encoding in COMPRESSIONS:
+                        body = _decompress_bytes(body, encoding)
+
+                    return body
+
+                error = AsyncGCSError(response.status,
+                                      body.decode('utf-8', 'replace'))
+                if response.status not in _RETRY_STATUSES:
+                    raise error
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if attempt == self.max_retries:
+                    raise error
+
+            await asyncio.sleep(2 ** attempt * 0.1 + random.random() * 0.1)
+
+    @staticmethod
+    def _record(operation: str, start_time: float, ok: bool):
+        _LATENCY.observe(time.perf_counter() - start_time,
+                         operation=operation)
+        _OPERATIONS.inc(operation=operation, status='ok' if ok else 'error')
+
+    @staticmethod
+    def _object_path(bucket_name: str, object_name: str) -> str:
+        return f'/b/{quote(bucket_name, safe="")}/o/' \
+            f'{quote(object_name, safe="")}'
+
+    async def upload(self, bucket_name: str,
+                     object_name: str,
+                     data: bytes,
+                     metadata: Dict[str, Any] = None,
+                     content_type: str = None) -> bool:
+        """
+        Upload an in-memory content as an artifact, in a single request.
+
+        Args:
+            bucket_name (str): The bucket that will contain the artifact.
+            object_name (str): The name of the artifact inside the bucket.
+            data (bytes): The artifact content.
+            metadata (Dict[str, Any], optional): The metadata of the
+            artifact. Defaults to None.
+            content_type (str, optional): The content type of the artifact.
+            Defaults to None (application/octet-stream).
+
+        Returns:
+            bool: True if the artifact was uploaded, false otherwise.
+        """
+        log_metadata = {
+            'funcName': 'AsyncGCSClient.upload',
+            'bucketName': bucket_name,
+            'objectName': object_name
+        }
+        resource = {'name': object_name}
+
+        if metadata:
+            resource['metadata'] = metadata
+
+        content_type = content_type or 'application/octet-stream'
+        boundary = uuid.uuid4().hex
+        # A multipart upload sends the object resource and the content in
+        # one request.
+        body = b''.join([
+            f'--{boundary}\r\n'.encode('ascii'),
+            b'Content-Type: application/json; charset=UTF-8\r\n\r\n',
+            json.dumps(resource).encode('utf-8'),
+            f'\r\n--{boundary}\r\n'.encode('ascii'),
+            f'Content-Type: {content_type}\r\n\r\n'.encode('ascii'),
+            bytes(data),
+            f'\r\n--{boundary}--\r\n'.encode('ascii')
+        ])
+        headers = {'Content-Type': f'multipart/related; boundary={boundary}'}
+        start_time = time.perf_counter()
+
+        try:
+            await self._request('POST', '/upload/storage/v1/b/'
+                                f'{quote(bucket_name, safe="")}/o',
+                                params={'uploadType': 'multipart'},
+                                data=body, headers=headers)
+            self._record('async_upload', start_time, True)
+            _BYTES.inc(len(data), operation='async_upload',
+                       direction='upload')
+            self._log(event_name='Artifact Upload',
+                      message='Artifact uploading completed successfully.',
+                      severity=LogSeverities.DEBUG,
+                      uploadedBytes=len(data),
+                      **log_metadata)
+
+            return True
+        except (AsyncGCSError, aiohttp.ClientError,
+                asyncio.TimeoutError) as e:
+            self._record('async_upload', start_time, False)
+            self._log(event_name='Artifact Uploading Error',
+                      message='An error accrued while trying to upload the '
+                      'content.',
+                      description=str(e),
+                      severity=LogSeverities.ERROR,
+                      **log_metadata)
+
+            return False
+
+    async def download(self, bucket_name: str,
+                       object_name: str,
+                       generation: int = None) -> Union[bytes, None]:
+        """
+        Download an artifact into memory.
+
+        Args:
+            bucket_name (str): The bucket that contains the artifact.
+            object_name (str): The name of the artifact inside the bucket.
+            generation (int, optional): The generation of the artifact.
+            Defaults to None (the latest).
+
+        Returns:
+            Union[bytes, None]: The content, decompressed if the artifact has
+            a gzip or zstd content encoding, or None if it could not be
+            downloaded.
+        """
+        log_metadata = {
+            'funcName': 'AsyncGCSClient.download',
+            'bucketName': bucket_name,
+            'objectName': object_name,
+            'objectGeneration': generation
+        }
+
+        start_time = time.perf_counter()
+
+        try:
+            content = await self._request(
+                'GET', '/download/storage/v1' +
+                self._object_path(bucket_name, object_name),
+                params={'alt': 'media', 'generation': generation},
+                decompress=True)
+            self._record('async_download', start_time, True)
+            _BYTES.inc(len(content), operation='async_download',
+                       direction='download')
+
+            return content
+        except (AsyncGCSError, aiohttp.ClientError, asyncio.TimeoutError,
+                ValueError) as e:
+            self._record('async_download', start_time, False)
+            self._log(event_name='Artifact Downloading Error',
+                      message='Could not download the artifact.',
+                      description=str(e),
+                      severity=LogSeverities.ERROR,
+                      **log_metadata)
+
+            return None
+
+    async def list(self, bucket_name: str,
+                   prefix: str = None,
+                   delimiter: str = None
+                   ) -> Union[List[Dict[str, Any]], None]:
+        """
+        List the artifacts of a bucket, following all the result pages.
+
+        Args:
+            bucket_name (str): The bucket to list.
+            prefix (str, optional): List only objects whose names start with
+            it. Defaults to None.
+            delimiter (str, optional): e.g '/' for listing only the objects
+            directly under the prefix. Defaults to None.
+
+        Returns:
+            Union[List[Dict[str, Any]], None]: The object resources (name,
+            size, generation, crc32c, metadata, etc.), or None if the bucket
+            could not be listed.
+        """
+        log_metadata = {
+            'funcName': 'AsyncGCSClient.list',
+            'bucketName': bucket_name,
+            'objectPrefix': prefix
+        }
+        items = []
+        params = {'prefix': prefix, 'delimiter': delimiter}
+        start_time = time.perf_counter()
+
+        try:
+            while True:
+                body = await self._request(
+                    'GET', f'/storage/v1/b/{quote(bucket_name, safe="")}/o',
+                    params=params)
+                page = json.loads(body)
+                items.extend(page.get('items', []))
+
+                if not page.get('nextPageToken'):
+                    self._record('async_list', start_time, True)
+                    return items
+
+                params['pageToken'] = page['nextPageToken']
+        except (AsyncGCSError, aiohttp.ClientError,
+                asyncio.TimeoutError) as e:
+            self._record('async_list', start_time, False)
+            self._log(event_name='Artifacts Listing Error',
+                      message='Could not list the artifacts.',
+                      description=str(e),
+                      severity=LogSeverities.ERROR,
+                      **log_metadata)
+
+            return None
+
+    async def delete(self, bucket_name: str,
+                     object_name: str,
+                     generation: int = None) -> bool:
+        """
+        Delete an artifact.
+
+        Args:
+            bucket_name (str): The bucket that contains the artifact.
+            object_name (str): The name of the artifact inside the bucket.
+            generation (int, optional): The generation to delete. Defaults to
+            None (the latest).
+
+        Returns:
+            bool: True if the artifact was deleted, false otherwise.
+        """
+        log_metadata = {
+            'funcName': 'AsyncGCSClient.delete',
+            'bucketName': bucket_name,
+            'objectName': object_name,
+            'objectGeneration': generation
+        }
+
+        start_time = time.perf_counter()
+
+        try:
+            await self._request('DELETE', '/storage/v1' +
+                                self._object_path(bucket_name, object_name),
+                                params={'generation': generation})
+            self._record('async_delete', start_time, True)
+
+            return True
+        except (AsyncGCSError, aiohttp.ClientError,
+                asyncio.TimeoutError) as e:
+            self._record('async_delete', start_time, False)
+            self._log(event_name='Artifact Deletion Error',
+                      message='Could not delete the artifact.',
+                      description=str(e),
+                      severity=LogSeverities.ERROR,
+                      **log_metadata)
+
+            return False
+
+    async def download_many(self, bucket_name: str,
+                            object_names: List[str]
+                            ) -> Dict[str, Union[bytes, None]]:
+        """
+        Download artifacts concurrently (up to the client concurrency).
+
+        Args:
+            bucket_name (str): The bucket that contains the artifacts.
+            object_names (List[str]): The names of the artifacts.
+
+        Returns:
+            Dict[str, Union[bytes, None]]: The content of each artifact, None
+            for artifacts that could not be downloaded.
+        """
+        contents = await asyncio.gather(
+            *(self.download(bucket_name, name) for name in object_names))
+
+        return dict(zip(object_names, contents))
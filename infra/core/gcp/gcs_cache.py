@@ -0,0 +1,284 @@
+"""
+This module contains a local, size bounded cache of Google Cloud Storage
+artifacts. The cache is keyed by (bucket, object, generation), and since an
+object generation is immutable, a cached artifact never has to be validated.
+The cache directory can be shared by several processes.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from typing import Any, Callable, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+_ENTRY_SUFFIX = '.artifact'
+
+
+class _FileLock():
+    """An exclusive, cross-process lock based on a lock file."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self._path, 'a+b')
+
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+        self._file.close()
+        self._file = None
+
+
+class ArtifactCache():
+    """
+    A content-addressed on-disk cache of artifacts with least recently used
+    eviction.
+
+    Cached files are read-only. `get_file` serves them by a hard link when
+    the destination is on the same file system, so the served file shares
+    its inode, and its read-only mode, with the cache entry: making it
+    writable and modifying it in place would corrupt the entry. Ask for a
+    writable file to get a private copy instead.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        Args:
+            cache_dir (str): The cache directory. Created if not exists.
+            max_bytes (int): The maximal total size of the cached artifacts.
+            The least recently used artifacts are evicted above it.
+        """
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'bytesSaved': 0}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Dict[str, int]: The hits, misses and saved download bytes of this
+        process."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def entry_path(self, bucket_name: str, object_name: str,
+                   generation: int) -> str:
+        """
+        Get the path of an artifact in the cache.
+
+        Args:
+            bucket_name (str): The bucket that contains the artifact.
+            object_name (str): The object name of the artifact.
+            generation (int): The generation of the object.
+
+        Returns:
+            str: The path of the cached artifact, which may not exist.
+        """
+        key = f'{bucket_name}/{object_name}#{generation}'.encode('utf-8')
+        digest = hashlib.sha256(key).hexdigest()
+
+        return os.path.join(self.cache_dir, digest[:2],
+                            digest + _ENTRY_SUFFIX)
+
+    def get_path(self, bucket_name: str,
+                 object_name: str,
+                 generation: int,
+                 download: Callable[[str], Any]) -> str:
+        """
+        Get the path of a cached artifact, downloading it into the cache first
+        if it is not cached yet. Concurrent calls for the same artifact,
+        including calls of other processes, download it once.
+
+        The returned file is read-only and may be evicted by a later call, so
+        it should be opened (or memory mapped) right away.
+
+        Args:
+            bucket_name (str): The bucket that contains the artifact.
+            object_name (str): The object name of the artifact.
+            generation (int): The generation of the object.
+            download (Callable[[str], Any]): Downloads the artifact into the
+            given path.
+
+        Returns:
+            str: The path of the cached artifact.
+        """
+        return self._get_entry(bucket_name, object_name, generation,
+                               download)[0]
+
+    def get_file(self, bucket_name: str,
+                 object_name: str,
+                 generation: int,
+                 dest_path: str,
+                 download: Callable[[str], Any],
+                 writable: bool = False) -> bool:
+        """
+        Place a cached artifact in the destination path, downloading it into
+        the cache first if it is not cached yet. Concurrent calls for the
+        same artifact, including calls of other processes, download it once.
+
+        Args:
+            bucket_name (str): The bucket that contains the artifact.
+            object_name (str): The object name of the artifact.
+            generation (int): The generation of the object.
+            dest_path (str): The local path of the artifact.
+            download (Callable[[str], Any]): Downloads the artifact into the
+            given path.
+            writable (bool, optional): True for a writable copy of the
+            artifact. Defaults to False (a read-only hard link to the cache
+            entry, when possible).
+
+        Returns:
+            bool: True for a cache hit, False if the artifact was downloaded.
+        """
+        entry_path, hit = self._get_entry(bucket_name, object_name,
+                                          generation, download)
+
+        try:
+            self._serve(entry_path, dest_path, writable)
+        except FileNotFoundError:
+            if not os.path.exists(entry_path):
+                # Evicted by another process since it was found.
+                return self.get_file(bucket_name, object_name, generation,
+                                     dest_path, download, writable)
+            raise
+
+        return hit
+
+    def _get_entry(self, bucket_name: str,
+                   object_name: str,
+                   generation: int,
+                   download: Callable[[str], Any]) -> Tuple[str, bool]:
+        entry_path = self.entry_path(bucket_name, object_name, generation)
+        hit = os.path.exists(entry_path)
+
+        if hit:
+            try:
+                # The modification time of an entry is its last use time.
+                os.utime(entry_path)
+            except FileNotFoundError:
+                hit = False
+
+        if not hit:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+
+            with _FileLock(entry_path + '.lock'):
+                hit = os.path.exists(entry_path)
+
+                if not hit:
+                    self._fill(entry_path, download)
+
+        size = os.path.getsize(entry_path)
+
+        with self._stats_lock:
+            if hit:
+                self._stats['hits'] += 1
+                self._stats['bytesSaved'] += size
+            else:
+                self._stats['misses'] += 1
+
+        if not hit:
+            self.evict(keep=entry_path)
+
+        return entry_path, hit
+
+    def evict(self, keep: str = None):
+        """
+        Delete the least recently used artifacts, along with their lock
+        files, until the total size of the cache is below its maximal size.
+
+        Args:
+            keep (str, optional): The path of an entry that must not be
+            evicted, e.g one that was just added. Defaults to None.
+        """
+        with _FileLock(os.path.join(self.cache_dir, '.evict.lock')):
+            entries = []
+            total_size = 0
+
+            for root, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if not file_name.endswith(_ENTRY_SUFFIX):
+                        continue
+
+                    path = os.path.join(root, file_name)
+                    if path == keep:
+                        continue
+
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total_size += stat.st_size
+
+            if keep is not None and os.path.exists(keep):
+                total_size += os.path.getsize(keep)
+
+            entries.sort()
+
+            for _, size, path in entries:
+                if total_size <= self.max_bytes:
+                    break
+
+                try:
+                    os.remove(path)
+                    total_size -= size
+                except FileNotFoundError:
+                    continue
+
+                try:
+                    # A fill that races with the removal may download the
+                    # artifact twice, which is harmless since entries are
+                    # replaced atomically.
+                    os.remove(path + '.lock')
+                except OSError:
+                    pass
+
+    def _fill(self, entry_path: str, download: Callable[[str], Any]):
+        tmp_path = f'{entry_path}.{uuid.uuid4().hex}.tmp'
+
+        try:
+            download(tmp_path)
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, entry_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _serve(self, entry_path: str, dest_path: str, writable: bool):
+        tmp_path = f'{dest_path}.{uuid.uuid4().hex}.part'
+
+        try:
+            if writable:
+                # A copy gets the default mode of new files.
+                shutil.copyfile(entry_path, tmp_path)
+            else:
+                try:
+                    os.link(entry_path, tmp_path)
+                except OSError:
+                    shutil.copyfile(entry_path, tmp_path)
+
+            os.replace(tmp_path, dest_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
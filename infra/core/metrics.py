@@ -0,0 +1,455 @@
+"""
+This module contains a lightweight, in-process registry of metrics (counters,
+gauges and fixed-bucket histograms) and an optional HTTP endpoint that serves
+them in the Prometheus text exposition format.
+
+The infra modules register their metrics in the default registry, REGISTRY:
+    * infra_gcs_* - Google Cloud Storage operations, bytes and latency.
+    * infra_gcl_* - Google Cloud Logging events.
+    * infra_db_* - MongoDB operations.
+
+Call `start_metrics_server` to expose them for scraping.
+"""
+import bisect
+import functools
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from configuration.config import config
+
+_metrics_conf: Dict[str, Any] = config.get('metrics', {})
+METRICS_PORT = _metrics_conf.get('port', 8000)
+# Latency buckets in seconds, from a fast metadata call to a large transfer.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0, 300.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+
+    pairs = ','.join(f'{name}="{_escape(value)}"'
+                     for name, value in zip(names, values))
+
+    return '{' + pairs + '}'
+
+
+class _Metric():
+    """The base of the metric types: a value per combination of labels."""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = ()):
+        """
+        Args:
+            name (str): The metric name, e.g infra_gcs_bytes_total.
+            documentation (str): A description of the metric.
+            label_names (Sequence[str], optional): The names of the labels
+            every update of the metric must supply. Defaults to ().
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.label_names):
+            raise ValueError(f'{self.name} expects the labels '
+                             f'{self.label_names}, got {tuple(labels)}.')
+        try:
+            return tuple(str(labels[name]) for name in self.label_names)
+        except KeyError:
+            raise ValueError(f'{self.name} expects the labels '
+                             f'{self.label_names}, got {tuple(labels)}.')
+
+    def clear(self):
+        """Remove the values of all the label combinations."""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """
+        Yields:
+            Tuple[str, str, float]: The sample name, its formatted labels and
+            its value.
+        """
+        with self._lock:
+            values = dict(self._values)
+
+        for key in sorted(values):
+            yield self.name, _format_labels(self.label_names, key), \
+                values[key]
+
+    def exposition(self) -> str:
+        """str: The metric in the Prometheus text format."""
+        lines = [f'# HELP {self.name} {_escape(self.documentation)}',
+                 f'# TYPE {self.name} {self.type_name}']
+        lines.extend(f'{name}{labels} {_format_value(value)}'
+                     for name, labels, value in self.samples())
+
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g a number of operations or bytes."""
+
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        """
+        Increase the counter.
+
+        Args:
+            amount (float, optional): A non negative amount. Defaults to 1.
+            **labels: The value of each label of the metric.
+        """
+        if amount < 0:
+            raise ValueError('A counter can only be increased.')
+
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """float: The value of the counter for the labels."""
+        key = self._key(labels)
+
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, e.g a number of running transfers."""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        """float: The value of the gauge for the labels."""
+        key = self._key(labels)
+
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values (e.g latencies) in fixed buckets, along
+    with their count and sum.
+    """
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Args:
+            name (str): The metric name, e.g infra_gcs_operation_seconds.
+            documentation (str): A description of the metric.
+            label_names (Sequence[str], optional): The names of the labels
+            every observation must supply. Defaults to ().
+            buckets (Sequence[float], optional): The upper bounds of the
+            buckets. Defaults to DEFAULT_BUCKETS.
+        """
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(float(bound) for bound in buckets
+                                    if bound != math.inf))
+
+    def observe(self, value: float, **labels):
+        """
+        Add an observation.
+
+        Args:
+            value (float): The observed value.
+            **labels: The value of each label of the metric.
+        """
+        key = self._key(labels)
+        # The last count is of the +Inf bucket.
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            state = self._values.get(key)
+
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                             0.0, 0]
+
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> '_Timer':
+        """
+        Time a block of code:
+
+            with histogram.time(operation='upload'):
+                ...
+
+        Args:
+            **labels: The value of each label of the metric.
+        """
+        return _Timer(self, labels)
+
+    def get(self, **labels) -> Dict[str, Any]:
+        """Dict[str, Any]: The cumulative bucket counts, count and sum of the
+        labels."""
+        key = self._key(labels)
+
+        with self._lock:
+            state = self._values.get(key)
+            counts, total, count = (list(state[0]), state[1], state[2]) \
+                if state else ([0] * (len(self.buckets) + 1), 0.0, 0)
+
+        cumulative = []
+        running = 0
+
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+
+        return {'buckets': dict(zip(self.buckets + (math.inf,), cumulative)),
+                'count': count, 'sum': total}
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        with self._lock:
+            keys = sorted(self._values)
+
+        for key in keys:
+            values = self.get(**dict(zip(self.label_names, key)))
+            names = self.label_names + ('le',)
+
+            for bound, count in values['buckets'].items():
+                yield f'{self.name}_bucket', \
+                    _format_labels(names, key + (_format_value(bound),)), \
+                    count
+
+            labels = _format_labels(self.label_names, key)
+            yield f'{self.name}_count', labels, values['count']
+            yield f'{self.name}_sum', labels, values['sum']
+
+
+class _Timer():
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self._histogram = histogram
+        self._labels = labels
+        self._start_time = None
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start_time,
+                                **self._labels)
+
+
+class MetricsRegistry():
+    """A thread safe collection of metrics, by name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, metric_type: type, name: str, *args,
+                       **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+
+            if metric is None:
+                metric = self._metrics[name] = metric_type(name, *args,
+                                                           **kwargs)
+            elif type(metric) is not metric_type:
+                raise ValueError(f'The metric {name} is already registered '
+                                 f'as a {metric.type_name}.')
+
+            return metric
+
+    def counter(self, name: str, documentation: str,
+                label_names: Sequence[str] = ()) -> Counter:
+        """Get a registered counter, registering it first if it does not
+        exist."""
+        return self._get_or_create(Counter, name, documentation, label_names)
+
+    def gauge(self, name: str, documentation: str,
+              label_names: Sequence[str] = ()) -> Gauge:
+        """Get a registered gauge, registering it first if it does not
+        exist."""
+        return self._get_or_create(Gauge, name, documentation, label_names)
+
+    def histogram(self, name: str, documentation: str,
+                  label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Get a registered histogram, registering it first if it does not
+        exist."""
+        return self._get_or_create(Histogram, name, documentation,
+                                   label_names, buckets)
+
+    def get(self, name: str) -> Any:
+        """Get a registered metric by its name, or None."""
+        with self._lock:
+            return self._metrics.get(name)
+
+    def metrics(self) -> List[_Metric]:
+        """List[_Metric]: The registered metrics, sorted by name."""
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def clear(self):
+        """Reset the values of all the registered metrics."""
+        for metric in self.metrics():
+            metric.clear()
+
+    def exposition(self) -> str:
+        """str: All the metrics in the Prometheus text format."""
+        return ''.join(metric.exposition() for metric in self.metrics())
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _is_failure(result: Any) -> bool:
+    # The infra methods report failures by returning False or None, or an
+    # object that is falsy on failure (e.g TransferReport).
+    if result is None or result is False:
+        return True
+
+    return getattr(type(result), '__bool__', None) is not None and \
+        not isinstance(result, (int, float)) and not result
+
+
+def instrument(operations: Counter, latency: Histogram,
+               operation: str,
+               is_failure: Callable[[Any], bool] = _is_failure) -> Callable:
+    """
+    Count the calls of the decorated function by status (ok or error) and
+    observe their duration. A call that raises, or returns False, None or a
+    falsy report, is an error.
+    The counter must have the labels (operation, status) and the histogram
+    the label (operation).
+
+    Args:
+        operations (Counter): The operations counter.
+        latency (Histogram): The duration histogram.
+        operation (str): The operation label of the function.
+        is_failure (Callable[[Any], bool], optional): Whether a result of the
+        function is a failure, for functions whose None or False results are
+        not failures. Defaults to treating False, None and falsy reports as
+        failures.
+
+    Returns:
+        Callable: The decorator.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_time = time.perf_counter()
+            status = 'error'
+
+            try:
+                result = func(*args, **kwargs)
+
+                if not is_failure(result):
+                    status = 'ok'
+
+                return result
+            finally:
+                latency.observe(time.perf_counter() - start_time,
+                                operation=operation)
+                operations.inc(operation=operation, status=status)
+
+        return wrapper
+
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args):
+        # Scrapes are too frequent to be logged.
+        pass
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_metrics_server(port: int = METRICS_PORT,
+                         addr: str = '',
+                         registry: MetricsRegistry = REGISTRY
+                         ) -> HTTPServer:
+    """
+    Serve the metrics of a registry in the Prometheus text format (on / and
+    /metrics) from a daemon thread.
+
+    Args:
+        port (int, optional): The port to listen on, 0 for any free port.
+        Defaults to METRICS_PORT.
+        addr (str, optional): The address to bind. Defaults to '' (all
+        interfaces).
+        registry (MetricsRegistry, optional): The registry to serve.
+        Defaults to REGISTRY.
+
+    Returns:
+        HTTPServer: The running server. Its `server_port` is the bound port
+        and `shutdown` stops it.
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,),
+                   {'registry': registry})
+    server = _MetricsServer((addr, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name='infra-metrics-server')
+    thread.start()
+
+    return server
@@ -2,21 +2,87 @@
 This module contains extension methods to the basic methods of the
 infrastructure.
 """
-import tempfile as tmpf
-from typing import Any, Dict
+import importlib.util
+import io
+import json
+import operator
+import os
+import time
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from typing import (Any, BinaryIO, Dict, Iterable, Iterator, List, Sequence,
+                    Tuple, Union)
 
+from bson import json_util
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from google.cloud.exceptions import GoogleCloudError, NotFound
+
+from infra.core.db import MongoHandler
 from infra.core.enums import Environments, LogSeverities
-from infra.core.gcp.gcs import upload_artifact
+from infra.core.gcp.gcs import (COMPRESSIONS, MAX_WORKERS, TransferReport,
+                                get_cached_artifact_path, open_artifact,
+                                update_artifact_metadata,
+                                upload_artifact_stream, upload_bytes)
 from infra.core.logging import log_event
 
+EXPORT_FORMATS = ('ndjson', 'parquet')
+DATAFRAME_FORMATS = ('csv', 'parquet', 'feather')
+DATAFRAME_CHUNK_ROWS = 100000
+PARTITION_MAX_ROWS = 1000000
+MANIFEST_NAME = '_manifest.json'
+# The hive name of a partition whose key is null.
+HIVE_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+_CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+    'feather': 'application/vnd.apache.arrow.file'
+}
+_FILE_EXTENSIONS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather'
+}
+_FORMAT_EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather'
+}
+_COMPRESSION_EXTENSIONS = {
+    '.gz': 'gzip',
+    '.zst': 'zstd'
+}
+_COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'zstd': b'\x28\xb5\x2f\xfd'
+}
+_FILTER_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
 
 def upload_dataframe_to_gcs(dataframe: Any,
                             bucket_name: str,
                             object_name: str,
                             metadata: Dict[str, Any] = None,
+                            file_format: str = 'csv',
+                            compression: str = None,
+                            chunk_rows: int = DATAFRAME_CHUNK_ROWS,
+                            schema: Any = None,
                             **kwargs) -> bool:
     """
-    Upload dataframe to Google Cloud Storage as csv file artifact.
+    Upload dataframe to Google Cloud Storage as a csv, parquet or feather
+    file artifact.
+    The dataframe is encoded in chunks of rows that are streamed straight into
+    the upload, without temporary files, so only one encoded chunk at a time
+    is held in memory.
 
     Args:
         dataframe (Any): The data frame to upload.
@@ -24,6 +90,18 @@ def upload_dataframe_to_gcs(dataframe: Any,
         object_name (str): The name of the artifact.
         metadata (Dict[str, Any], optional): The metadata of the artifact.
         Defaults to None.
+        file_format (str, optional): 'csv', 'parquet' or 'feather'.
+        Parquet and feather require pyarrow. Defaults to 'csv'.
+        compression (str, optional): 'gzip' or 'zstd'. For parquet and feather
+        this is the compression codec of the file (feather supports only
+        zstd), for csv the whole artifact is compressed and gets the codec
+        as its content encoding. Defaults to None.
+        chunk_rows (int, optional): The number of rows to encode at a time.
+        Defaults to DATAFRAME_CHUNK_ROWS.
+        schema (Any, optional): The pyarrow schema of a parquet or feather
+        artifact. Without it, the schema is inferred from the first chunk of
+        rows. Defaults to None.
+        **kwargs: Options of `DataFrame.to_csv` for csv artifacts.
 
     Returns:
         bool: True if the dataframe was uploaded, false otherwise.
@@ -31,20 +109,48 @@ def upload_dataframe_to_gcs(dataframe: Any,
     log_metadata = {
         'funcName': 'upload_dataframe_to_gcs',
         'eventGroup': 'Google Cloud Storage',
-        'environment': Environments.INFRA
+        'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectName': object_name,
+        'fileFormat': file_format,
+        'compression': compression
     }
 
+    if file_format not in DATAFRAME_FORMATS or \
+            (compression is not None and compression not in COMPRESSIONS) or \
+            (file_format == 'feather' and compression == 'gzip'):
+        msg = f'Unsupported upload options. Formats: {DATAFRAME_FORMATS}, ' \
+            f'compressions: {COMPRESSIONS} (feather supports only zstd).'
+        log_event(event_name='Artifact Uploading Error',
+                  message=msg,
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+
+        return False
+
     try:
-        with tmpf.NamedTemporaryFile(mode='r+', suffix='.csv') as tf:
-            dataframe.to_csv(tf, **kwargs)
-            result = upload_artifact(
-                bucket_name, object_name, tf.name, metadata)
+        content_encoding = compression if file_format == 'csv' else None
 
-        return result
-    except (AttributeError, OSError) as e:
-        log_event(event_name='File Creation Error',
-                  message='Could not create the csv file.',
-                  description=str(e),
+        with open_artifact(bucket_name, object_name, 'wb', metadata=metadata,
+                           content_type=_CONTENT_TYPES[file_format],
+                           compression=content_encoding) as writer:
+            if file_format == 'csv':
+                for chunk in _encode_csv(dataframe, chunk_rows, **kwargs):
+                    writer.write(chunk)
+            else:
+                _write_arrow(dataframe, writer, file_format, compression,
+                             chunk_rows, schema)
+
+        log_event(event_name='Artifact Upload',
+                  message='Data frame uploading completed successfully.',
+                  rowCount=len(dataframe),
+                  **log_metadata)
+
+        return True
+    except (NotFound, GoogleCloudError) as gce:
+        log_event(event_name='Artifact Uploading Error',
+                  message='Could not upload the data frame.',
+                  description=str(gce),
                   severity=LogSeverities.ERROR,
                   **log_metadata)
 
@@ -55,8 +161,1011 @@ def upload_dataframe_to_gcs(dataframe: Any,
                   message=msg,
                   description=str(ex),
                   severity=LogSeverities.ERROR,
-                  bucketName=bucket_name,
-                  objectName=object_name,
                   **log_metadata)
 
         return False
+
+
+def read_dataframe_from_gcs(bucket_name: str,
+                            object_name: str,
+                            columns: Sequence[str] = None,
+                            filters: Sequence[Tuple[str, str, Any]] = None,
+                            chunksize: int = None,
+                            file_format: str = None,
+                            generation: int = None,
+                            use_threads: bool = True,
+                            **kwargs) -> Union[Any, Iterator[Any], None]:
+    """
+    Read a csv, parquet or feather artifact into a data frame.
+
+    Parquet and feather artifacts are read with range requests, so only the
+    requested columns and, for parquet, only the row groups whose statistics
+    may match the filters are downloaded. When a generation is given and an
+    artifact cache is configured, the artifact is read from a memory map of
+    the cached copy instead.
+
+    Args:
+        bucket_name (str): The bucket that contains the artifact.
+        object_name (str): The name of the artifact.
+        columns (Sequence[str], optional): The columns to read.
+        Defaults to None (all columns).
+        filters (Sequence[Tuple[str, str, Any]], optional): Row filters as
+        (column, operator, value) tuples that must all match. Operators are
+        '==', '!=', '<', '<=', '>', '>=', 'in' and 'not in'.
+        Defaults to None.
+        chunksize (int, optional): Read the artifact as an iterator of data
+        frames with up to this number of rows. Defaults to None.
+        file_format (str, optional): 'csv', 'parquet' or 'feather'.
+        Defaults to None (inferred from the object name, csv by default).
+        generation (int, optional): The generation of the artifact.
+        Defaults to None (the latest).
+        use_threads (bool, optional): Decode on multiple threads.
+        Defaults to True.
+        **kwargs: Options of `pandas.read_csv` for csv artifacts.
+
+    Returns:
+        Union[Any, Iterator[Any], None]: The data frame, or an iterator of
+        data frames if a chunk size was given. None if the artifact could not
+        be read.
+    """
+    log_metadata = {
+        'funcName': 'read_dataframe_from_gcs',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectName': object_name,
+        'objectGeneration': generation
+    }
+    file_format = file_format or _infer_file_format(object_name)
+    filters = list(filters or [])
+    invalid_filters = [f for f in filters if f[1] not in _FILTER_OPERATORS and
+                       f[1] not in ('in', 'not in')]
+
+    if file_format not in DATAFRAME_FORMATS or invalid_filters:
+        msg = f'Unsupported read options. Formats: {DATAFRAME_FORMATS}, ' \
+            f'filter operators: {list(_FILTER_OPERATORS)} + in, not in.'
+        log_event(event_name='Artifact Reading Error',
+                  message=msg,
+                  description=str(invalid_filters),
+                  severity=LogSeverities.ERROR,
+                  fileFormat=file_format,
+                  **log_metadata)
+
+        return None
+
+    try:
+        cached_path = None
+
+        if generation is not None:
+            cached_path = get_cached_artifact_path(bucket_name, object_name,
+                                                   generation)
+
+        source = cached_path or open_artifact(bucket_name, object_name,
+                                              generation=generation)
+
+        if file_format == 'parquet':
+            result = _read_parquet(source, columns, filters, chunksize,
+                                   use_threads)
+        elif file_format == 'feather':
+            result = _read_feather(source, columns, filters, chunksize,
+                                   use_threads)
+        else:
+            compression = _stored_compression(source, object_name)
+            result = _read_csv(source, columns, filters, chunksize,
+                               use_threads, compression, **kwargs)
+
+        log_event(event_name='Data Frame Read',
+                  message='A data frame was read from an artifact.',
+                  severity=LogSeverities.DEBUG,
+                  fileFormat=file_format,
+                  isCached=cached_path is not None,
+                  **log_metadata)
+
+        return result
+    except (NotFound, GoogleCloudError) as gce:
+        log_event(event_name='Artifact Reading Error',
+                  message='Could not read the data frame.',
+                  description=str(gce),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+
+        return None
+    except (KeyError, ValueError, EOFError, OSError) as ex:
+        # A corrupt or truncated artifact, or a missing column: pyarrow's
+        # ArrowInvalid and pandas' ParserError are ValueErrors, truncated
+        # compressed streams raise EOFError or OSError.
+        log_event(event_name='Artifact Reading Error',
+                  message='Could not decode the data frame.',
+                  description=f'{type(ex).__name__}: {ex}',
+                  severity=LogSeverities.ERROR,
+                  fileFormat=file_format,
+                  **log_metadata)
+
+        return None
+
+
+def _extension(object_name: str) -> str:
+    return '.' + object_name.rpartition('/')[2].rpartition('.')[2].lower()
+
+
+def _stored_compression(source: Union[str, BinaryIO],
+                        object_name: str) -> Union[str, None]:
+    """
+    Get the compression of an artifact that is still compressed when it is
+    read: named with a compression extension, but without a content
+    encoding (which is decompressed by the download).
+    """
+    compression = _COMPRESSION_EXTENSIONS.get(_extension(object_name))
+
+    if compression is None:
+        return None
+
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            head = f.read(4)
+    else:
+        head = source.peek(4)[:4]
+
+    return compression if head.startswith(_COMPRESSION_MAGIC[compression]) \
+        else None
+
+
+def _infer_file_format(object_name: str) -> str:
+    name = object_name.lower()
+
+    if _extension(name) in _COMPRESSION_EXTENSIONS:
+        name = name.rpartition('.')[0]
+
+    return _FORMAT_EXTENSIONS.get(_extension(name), 'csv')
+
+
+def _read_columns(columns: Sequence[str] = None,
+                  filters: Sequence[Tuple[str, str, Any]] = None
+                  ) -> Union[List[str], None]:
+    # Filtered columns are read even if they were not requested.
+    if columns is None:
+        return None
+
+    read_columns = list(columns)
+
+    for column, _, _ in filters or []:
+        if column not in read_columns:
+            read_columns.append(column)
+
+    return read_columns
+
+
+def _apply_filters(dataframe: Any,
+                   filters: Sequence[Tuple[str, str, Any]] = None,
+                   columns: Sequence[str] = None) -> Any:
+    if filters:
+        mask = None
+
+        for column, op, value in filters:
+            series = dataframe[column]
+
+            if op == 'in':
+                column_mask = series.isin(value)
+            elif op == 'not in':
+                column_mask = ~series.isin(value)
+            else:
+                column_mask = _FILTER_OPERATORS[op](series, value)
+
+            mask = column_mask if mask is None else mask & column_mask
+
+        dataframe = dataframe[mask]
+
+    if columns is not None:
+        dataframe = dataframe[list(columns)]
+
+    return dataframe
+
+
+def _range_may_match(low: Any, high: Any, op: str, value: Any) -> bool:
+    if op in ('=', '=='):
+        return low <= value <= high
+    if op == '<':
+        return low < value
+    if op == '<=':
+        return low <= value
+    if op == '>':
+        return high > value
+    if op == '>=':
+        return high >= value
+    if op == 'in':
+        return any(low <= v <= high for v in value)
+
+    return True
+
+
+def _row_group_may_match(row_group: Any,
+                         filters: Sequence[Tuple[str, str, Any]] = None
+                         ) -> bool:
+    """
+    Check by the column statistics of a parquet row group whether any of its
+    rows may match the filters.
+    """
+    if not filters:
+        return True
+
+    statistics = {}
+
+    for i in range(row_group.num_columns):
+        column = row_group.column(i)
+        statistics[column.path_in_schema] = column.statistics
+
+    for column, op, value in filters:
+        stats = statistics.get(column)
+
+        if stats is None or not stats.has_min_max:
+            continue
+
+        try:
+            if not _range_may_match(stats.min, stats.max, op, value):
+                return False
+        except TypeError:
+            continue
+
+    return True
+
+
+def _continue_index(chunks: Iterable[Any]) -> Iterator[Any]:
+    # Numbers the rows of arrow chunks across the artifact, like the chunks
+    # of pandas.read_csv.
+    import pandas as pd
+
+    offset = 0
+
+    for chunk in chunks:
+        if isinstance(chunk.index, pd.RangeIndex):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+
+        yield chunk
+
+
+def _close_after(chunks: Iterator[Any], source: Any) -> Iterator[Any]:
+    try:
+        yield from chunks
+    finally:
+        if not isinstance(source, str):
+            source.close()
+
+
+def _read_parquet(source: Union[str, BinaryIO],
+                  columns: Sequence[str] = None,
+                  filters: Sequence[Tuple[str, str, Any]] = None,
+                  chunksize: int = None,
+                  use_threads: bool = True) -> Union[Any, Iterator[Any]]:
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source,
+                                  memory_map=isinstance(source, str))
+    row_groups = [i for i in range(parquet_file.num_row_groups)
+                  if _row_group_may_match(parquet_file.metadata.row_group(i),
+                                          filters)]
+    read_columns = _read_columns(columns, filters)
+
+    if chunksize is None:
+        try:
+            table = parquet_file.read_row_groups(row_groups,
+                                                 columns=read_columns,
+                                                 use_threads=use_threads,
+                                                 use_pandas_metadata=True)
+        finally:
+            if not isinstance(source, str):
+                source.close()
+
+        return _apply_filters(table.to_pandas(use_threads=use_threads),
+                              filters, columns)
+
+    batches = parquet_file.iter_batches(batch_size=chunksize,
+                                        row_groups=row_groups,
+                                        columns=read_columns,
+                                        use_threads=use_threads)
+    frames = _continue_index(batch.to_pandas(use_threads=use_threads)
+                             for batch in batches)
+    chunks = (_apply_filters(frame, filters, columns) for frame in frames)
+
+    return _close_after(chunks, source)
+
+
+def _read_feather(source: Union[str, BinaryIO],
+                  columns: Sequence[str] = None,
+                  filters: Sequence[Tuple[str, str, Any]] = None,
+                  chunksize: int = None,
+                  use_threads: bool = True) -> Union[Any, Iterator[Any]]:
+    import pyarrow as pa
+
+    if isinstance(source, str):
+        source = pa.memory_map(source)
+
+    read_columns = _read_columns(columns, filters)
+    options = None
+
+    if read_columns:
+        # Only the requested columns of each batch are decoded.
+        schema = pa.ipc.open_file(source).schema
+        options = pa.ipc.IpcReadOptions(included_fields=[
+            schema.get_field_index(column) for column in read_columns
+            if schema.get_field_index(column) >= 0])
+
+    reader = pa.ipc.open_file(source, options=options)
+
+    def read_batch(i: int) -> Any:
+        batch = reader.get_batch(i)
+        # Restores the requested order, and fails on unknown columns.
+        return batch.select(read_columns) if read_columns else batch
+
+    if chunksize is None:
+        try:
+            batches = [read_batch(i)
+                       for i in range(reader.num_record_batches)]
+            table = pa.Table.from_batches(batches, schema=batches[0].schema) \
+                if batches else reader.read_all()
+        finally:
+            source.close()
+
+        return _apply_filters(table.to_pandas(use_threads=use_threads),
+                              filters, columns)
+
+    frames = _continue_index(chunk.to_pandas(use_threads=use_threads)
+                             for i in range(reader.num_record_batches)
+                             for chunk in pa.Table.from_batches(
+                                 [read_batch(i)]).to_batches(
+                                     max_chunksize=chunksize))
+    chunks = (_apply_filters(frame, filters, columns) for frame in frames)
+
+    return _close_after(chunks, source)
+
+
+def _read_csv(source: Union[str, BinaryIO],
+              columns: Sequence[str] = None,
+              filters: Sequence[Tuple[str, str, Any]] = None,
+              chunksize: int = None,
+              use_threads: bool = True,
+              compression: str = None,
+              **kwargs) -> Union[Any, Iterator[Any]]:
+    import pandas as pd
+
+    read_columns = _read_columns(columns, filters)
+
+    if chunksize is None:
+        # The pyarrow engine decodes on multiple threads.
+        use_pyarrow = use_threads and 'engine' not in kwargs and \
+            importlib.util.find_spec('pyarrow') is not None
+
+        try:
+            try:
+                dataframe = pd.read_csv(source, usecols=read_columns,
+                                        compression=compression,
+                                        **(dict(kwargs, engine='pyarrow')
+                                           if use_pyarrow else kwargs))
+            except ValueError:
+                if not use_pyarrow:
+                    raise
+
+                # An option the pyarrow engine does not support, the default
+                # engine reads the artifact instead.
+                if not isinstance(source, str):
+                    source.seek(0)
+
+                dataframe = pd.read_csv(source, usecols=read_columns,
+                                        compression=compression, **kwargs)
+        finally:
+            if not isinstance(source, str):
+                source.close()
+
+        return _apply_filters(dataframe, filters, columns)
+
+    reader = pd.read_csv(source, usecols=read_columns, chunksize=chunksize,
+                         compression=compression, **kwargs)
+    chunks = (_apply_filters(chunk, filters, columns) for chunk in reader)
+
+    return _close_after(chunks, source)
+
+
+def _iter_row_chunks(dataframe: Any, chunk_rows: int) -> Iterator[Any]:
+    # An empty data frame still yields one (empty) chunk for the header.
+    for start in range(0, max(len(dataframe), 1), chunk_rows):
+        yield dataframe.iloc[start:start + chunk_rows]
+
+
+def _encode_csv(dataframe: Any, chunk_rows: int, **kwargs) -> Iterator[bytes]:
+    header = kwargs.pop('header', True)
+    encoding = kwargs.pop('encoding', 'utf-8')
+
+    for i, chunk in enumerate(_iter_row_chunks(dataframe, chunk_rows)):
+        text = chunk.to_csv(header=header if i == 0 else False, **kwargs)
+        yield text.encode(encoding)
+
+
+def _write_arrow(dataframe: Any,
+                 sink: BinaryIO,
+                 file_format: str,
+                 compression: str = None,
+                 chunk_rows: int = DATAFRAME_CHUNK_ROWS,
+                 schema: Any = None):
+    """
+    Write a data frame into a parquet or feather (arrow IPC) file, converting
+    one chunk of rows at a time. Unless a schema is given, it is inferred from
+    the first chunk, with the columns that are all null in it typed by their
+    first values. Later chunks are promoted to it, since a file has a single
+    schema.
+
+    Args:
+        dataframe (Any): The data frame to write.
+        sink (BinaryIO): The file to write into. It is not closed.
+        file_format (str): 'parquet' or 'feather'.
+        compression (str, optional): The compression codec of the file.
+        Defaults to None.
+        chunk_rows (int, optional): The number of rows to convert at a time.
+        Defaults to DATAFRAME_CHUNK_ROWS.
+        schema (Any, optional): The pyarrow schema of the file.
+        Defaults to None.
+
+    Raises:
+        ValueError: If a chunk has types that do not fit the schema.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # A default index is restored on read, any other index is kept as
+    # columns.
+    preserve_index = not isinstance(dataframe.index, pd.RangeIndex)
+    writer = None
+
+    try:
+        for chunk in _iter_row_chunks(dataframe, chunk_rows):
+            table = pa.Table.from_pandas(chunk, preserve_index=preserve_index)
+
+            if schema is None:
+                schema = _infer_null_fields(table.schema, dataframe,
+                                            chunk_rows)
+
+            table = _conform_table(table, schema)
+
+            if writer is None:
+                if file_format == 'parquet':
+                    writer = pq.ParquetWriter(
+                        sink, schema, compression=compression or 'snappy')
+                else:
+                    options = pa.ipc.IpcWriteOptions(compression=compression)
+                    writer = pa.ipc.new_file(sink, schema, options=options)
+
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _infer_null_fields(schema: Any, dataframe: Any, chunk_rows: int) -> Any:
+    """Type the null fields of a schema inferred from the first chunk of a
+    data frame by the first non-null values of their columns."""
+    import pyarrow as pa
+
+    for i, field in enumerate(schema):
+        if field.type != pa.null() or field.name not in dataframe.columns:
+            continue
+
+        values = dataframe[field.name].dropna().iloc[:chunk_rows]
+
+        if len(values):
+            field_type = pa.array(values, from_pandas=True).type
+            schema = schema.set(i, field.with_type(field_type))
+
+    return schema
+
+
+def write_partitioned_dataframe(dataframe: Any,
+                                bucket_name: str,
+                                prefix: str,
+                                partition_cols: Sequence[str] = None,
+                                max_rows_per_file: int = PARTITION_MAX_ROWS,
+                                file_format: str = 'parquet',
+                                compression: str = None,
+                                max_workers: int = None,
+                                upload_workers: int = MAX_WORKERS
+                                ) -> TransferReport:
+    """
+    Upload a data frame as a dataset of files, split into hive-style
+    partitions (e.g prefix/year=2019/part-00000.parquet) and into files of
+    up to a maximal number of rows.
+    The files are encoded in parallel on a process pool and uploaded
+    concurrently while the next ones are encoded. A manifest object
+    (prefix/_manifest.json) lists the files with their partition values and
+    row counts and the schema of the data frame, so readers can select files
+    without listing the bucket. It is written only if all the files were
+    uploaded.
+
+    Args:
+        dataframe (Any): The data frame to upload.
+        bucket_name (str): The bucket that will contain the dataset.
+        prefix (str): The object name prefix of the dataset.
+        partition_cols (Sequence[str], optional): The columns to partition
+        by. They are not written to the files. Defaults to None.
+        max_rows_per_file (int, optional): The maximal number of rows in a
+        file. Defaults to PARTITION_MAX_ROWS.
+        file_format (str, optional): 'csv', 'parquet' or 'feather'.
+        Defaults to 'parquet'.
+        compression (str, optional): 'gzip' or 'zstd', see
+        `upload_dataframe_to_gcs`. Defaults to None.
+        max_workers (int, optional): The number of encoding processes.
+        Defaults to None (the number of CPUs).
+        upload_workers (int, optional): The number of concurrent uploads.
+        Defaults to MAX_WORKERS.
+
+    Returns:
+        TransferReport: The uploaded and failed object names.
+        The report is falsy if any file failed.
+    """
+    log_metadata = {
+        'funcName': 'write_partitioned_dataframe',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+        'bucketName': bucket_name,
+        'objectPrefix': prefix,
+        'fileFormat': file_format,
+        'compression': compression
+    }
+    report = TransferReport()
+    start_time = time.perf_counter()
+
+    if file_format not in DATAFRAME_FORMATS or \
+            (compression is not None and compression not in COMPRESSIONS) or \
+            (file_format == 'feather' and compression == 'gzip'):
+        msg = f'Unsupported upload options. Formats: {DATAFRAME_FORMATS}, ' \
+            f'compressions: {COMPRESSIONS} (feather supports only zstd).'
+        log_event(event_name='Dataset Uploading Error',
+                  message=msg,
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+        report.add_failure(prefix, msg)
+
+        return report
+
+    prefix = prefix.rstrip('/')
+    partition_cols = list(partition_cols or [])
+    extension = _FILE_EXTENSIONS[file_format]
+    content_encoding = compression if file_format == 'csv' else None
+    files = []
+
+    def upload(object_name: str, data: bytes, entry: Dict[str, Any]):
+        if upload_bytes(bucket_name, object_name, data,
+                        content_type=_CONTENT_TYPES[file_format],
+                        compression=content_encoding):
+            report.add_file(object_name, len(data))
+            entry['bytes'] = len(data)
+            files.append(entry)
+        else:
+            report.add_failure(object_name, 'The upload has failed.')
+
+    encode_workers = max_workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(max_workers=encode_workers) as encoders, \
+            ThreadPoolExecutor(max_workers=upload_workers) as uploaders:
+        # Encoded files are held in memory until their upload ends, so the
+        # encodes and the uploads share a window that bounds the number of
+        # encoded files at once.
+        window = encode_workers + upload_workers
+        pending = {}
+
+        def dispatch(futures: Iterable[Any]):
+            for future in futures:
+                object_name, entry = pending.pop(future)
+
+                try:
+                    data = future.result()
+                except Exception as e:
+                    report.add_failure(object_name, str(e))
+                    continue
+
+                # Uploads are tracked in the window without an entry.
+                if entry is not None:
+                    upload_future = uploaders.submit(upload, object_name,
+                                                     data, entry)
+                    pending[upload_future] = (object_name, None)
+
+        pieces = _partition_pieces(dataframe, partition_cols,
+                                   max_rows_per_file)
+
+        for partition_path, partition, index, frame in pieces:
+            while len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                dispatch(done)
+
+            object_name = '/'.join(p for p in (prefix, partition_path) if p) \
+                + f'/part-{index:05d}{extension}'
+            entry = {'path': object_name, 'partition': partition,
+                     'rows': len(frame)}
+            future = encoders.submit(_encode_file, frame, file_format,
+                                     compression)
+            pending[future] = (object_name, entry)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            dispatch(done)
+
+    if not report.failures:
+        manifest = {
+            'fileFormat': file_format,
+            'compression': compression,
+            'partitionColumns': partition_cols,
+            'schema': {str(column): str(dtype)
+                       for column, dtype in dataframe.dtypes.items()},
+            'rowCount': len(dataframe),
+            'files': sorted(files, key=lambda entry: entry['path'])
+        }
+        manifest_name = '/'.join(p for p in (prefix, MANIFEST_NAME) if p)
+        data = json.dumps(manifest, indent=2).encode('utf-8')
+
+        if not upload_bytes(bucket_name, manifest_name, data,
+                            content_type='application/json'):
+            report.add_failure(manifest_name, 'The upload has failed.')
+
+    report.elapsed = time.perf_counter() - start_time
+
+    if report.failures:
+        msg = f'{len(report.failures)} dataset files could not be uploaded.'
+        log_event(event_name='Dataset Uploading Error',
+                  message=msg,
+                  description=str(report.failures),
+                  severity=LogSeverities.ERROR,
+                  **log_metadata)
+    else:
+        log_event(event_name='Dataset Upload',
+                  message='Data frame dataset uploading completed '
+                  'successfully.',
+                  partitionColumns=partition_cols,
+                  **report.as_dict(),
+                  **log_metadata)
+
+    return report
+
+
+def _partition_value(value: Any) -> Any:
+    # Numpy scalars are converted to python values for the manifest.
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _partition_pieces(dataframe: Any,
+                      partition_cols: Sequence[str],
+                      max_rows_per_file: int
+                      ) -> Iterator[Tuple[str, Dict[str, Any], int, Any]]:
+    """
+    Split a data frame into hive-style partitions and each partition into
+    pieces of up to a maximal number of rows.
+
+    Yields:
+        Tuple[str, Dict[str, Any], int, Any]: The partition path, the
+        partition values, the piece index in the partition and the piece
+        (without the partition columns).
+    """
+    import pandas as pd
+    from urllib.parse import quote
+
+    if partition_cols:
+        groups = dataframe.groupby(partition_cols, sort=True, dropna=False,
+                                   observed=True)
+    else:
+        groups = [((), dataframe)]
+
+    for key, group in groups:
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        partition = {}
+        path_parts = []
+
+        for column, value in zip(partition_cols, key):
+            if pd.isna(value):
+                partition[column] = None
+                path_parts.append(f'{column}={HIVE_NULL_PARTITION}')
+            else:
+                partition[column] = _partition_value(value)
+                path_parts.append(f'{column}={quote(str(value), safe="")}')
+
+        rows = group.drop(columns=partition_cols)
+
+        for index, start in enumerate(range(0, max(len(rows), 1),
+                                            max_rows_per_file)):
+            yield ('/'.join(path_parts), partition, index,
+                   rows.iloc[start:start + max_rows_per_file])
+
+
+def _encode_file(dataframe: Any, file_format: str,
+                 compression: str = None) -> bytes:
+    """Encode a data frame into the content of a file. Runs in the encoding
+    processes of `write_partitioned_dataframe`. Csv files are compressed by
+    their upload."""
+    if file_format == 'csv':
+        chunks = _encode_csv(dataframe, DATAFRAME_CHUNK_ROWS, index=False)
+        return b''.join(chunks)
+
+    sink = io.BytesIO()
+    _write_arrow(dataframe, sink, file_format, compression,
+                 DATAFRAME_CHUNK_ROWS)
+
+    return sink.getvalue()
+
+
+def export_collection_to_gcs(mongo_handler: MongoHandler,
+                             col_name: str,
+                             bucket_name: str,
+                             object_name: str,
+                             query: Dict[str, Any] = None,
+                             projection: Dict[str, Any] = None,
+                             file_format: str = 'ndjson',
+                             compression: str = None,
+                             batch_size: int = 1000,
+                             metadata: Dict[str, Any] = None,
+                             schema: Any = None) -> bool:
+    """
+    Export the documents of a collection to a Google Cloud Storage artifact.
+    The cursor batches are encoded and uploaded while they are read, without
+    temporary files, so the memory in use is bounded by the batch size.
+
+    Args:
+        mongo_handler (MongoHandler): The handler of the db that contains the
+        collection.
+        col_name (str): The collection name.
+        bucket_name (str): The bucket that will contain the artifact.
+        object_name (str): The name of the artifact.
+        query (Dict[str, Any], optional): A filter for the exported documents.
+        Defaults to None (all documents).
+        projection (Dict[str, Any], optional): The fields to export.
+        Defaults to None (all fields).
+        file_format (str, optional): The artifact format, one of 'ndjson' or
+        'parquet'. Parquet requires pyarrow. Defaults to 'ndjson'.
+        compression (str, optional): 'gzip' or 'zstd'. For parquet this is the
+        compression codec of the file, otherwise the whole artifact is
+        compressed and gets the codec as its content encoding. zstd requires
+        the zstandard package. Defaults to None.
+        batch_size (int, optional): The number of documents to read and encode
+        at a time. Defaults to 1000.
+        metadata (Dict[str, Any], optional): The metadata of the artifact.
+        The export query and the number of exported documents are added to it.
+        Defaults to None.
+        schema (Any, optional): The pyarrow schema of a parquet export.
+        Without it, the schema is inferred from the first batch, and the
+        export fails (without creating the artifact) if a later batch has
+        fields or types that do not fit it. Defaults to None.
+
+    Returns:
+        bool: True if the collection was exported, false otherwise.
+    """
+    log_metadata = {
+        'funcName': 'export_collection_to_gcs',
+        'eventGroup': 'Google Cloud Storage',
+        'environment': Environments.INFRA,
+        'collName': col_name,
+        'bucketName': bucket_name,
+        'objectName': object_name
+    }
+
+    if file_format not in EXPORT_FORMATS or \
+            (compression is not None and compression not in COMPRESSIONS):
+        msg = f'Unsupported export options. Formats: {EXPORT_FORMATS}, ' \
+            f'compressions: {COMPRESSIONS}.'
+        log_event(event_name='Collection Export Error',
+                  message=msg,
+                  severity=LogSeverities.ERROR,
+                  fileFormat=file_format,
+                  compression=compression,
+                  **log_metadata)
+
+        return False
+
+    collection = mongo_handler.get_collection(col_name)
+    cursor = collection.find(query, projection, batch_size=batch_size)
+    counter = {'docCount': 0}
+    batches = _count_docs(_iter_batches(cursor, batch_size), counter)
+
+    if file_format == 'parquet':
+        chunks = _encode_parquet(batches, compression, schema)
+        content_type = 'application/vnd.apache.parquet'
+    else:
+        chunks = _encode_ndjson(batches)
+        content_type = 'application/x-ndjson'
+
+    export_metadata = dict(metadata or {})
+    export_metadata.update({
+        'sourceDB': mongo_handler.dbName,
+        'sourceCollection': col_name,
+        'query': json_util.dumps(query or {}),
+        'fileFormat': file_format,
+        'compression': compression or 'none'
+    })
+
+    try:
+        result = upload_artifact_stream(
+            bucket_name, object_name, chunks, export_metadata, content_type,
+            compression=compression if file_format == 'ndjson' else None)
+    finally:
+        cursor.close()
+
+    if not result:
+        return False
+
+    export_metadata['docCount'] = str(counter['docCount'])
+    result = update_artifact_metadata(bucket_name, object_name,
+                                      export_metadata)
+
+    log_event(event_name='Collection Export',
+              message='Collection was exported to an artifact.',
+              docCount=counter['docCount'],
+              fileFormat=file_format,
+              compression=compression,
+              **log_metadata)
+
+    return result
+
+
+def _iter_batches(cursor: Iterable[Dict[str, Any]],
+                  batch_size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _count_docs(batches: Iterable[List[Dict[str, Any]]],
+                counter: Dict[str, int]) -> Iterator[List[Dict[str, Any]]]:
+    for batch in batches:
+        counter['docCount'] += len(batch)
+        yield batch
+
+
+def _encode_ndjson(batches: Iterable[List[Dict[str, Any]]]
+                   ) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json_util.dumps(doc) for doc in batch]
+        lines.append('')
+        yield '\n'.join(lines).encode('utf-8')
+
+
+def _to_arrow_value(value: Any) -> Any:
+    if isinstance(value, (ObjectId, Decimal128)):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _to_arrow_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_to_arrow_value(v) for v in value]
+
+    return value
+
+
+class _BytesSink():
+    """A write-only file-like object that collects the written bytes."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._parts)
+        self._parts = []
+
+        return data
+
+
+def _encode_parquet(batches: Iterable[List[Dict[str, Any]]],
+                    compression: str = None,
+                    schema: Any = None) -> Iterator[bytes]:
+    """
+    Encode batches of documents into a parquet file, one row group per batch.
+    Unless a schema is given, it is inferred from the first batch. Later
+    batches are promoted to it (e.g int to double, and missing fields to
+    nulls), since a parquet file has a single schema.
+
+    Args:
+        batches (Iterable[List[Dict[str, Any]]]): The documents to encode.
+        compression (str, optional): The parquet compression codec.
+        Defaults to None (snappy).
+        schema (Any, optional): The pyarrow schema of the file.
+        Defaults to None.
+
+    Raises:
+        ValueError: If a batch has fields or types that do not fit the schema.
+        Raised while the file is streamed, it stops the upload before the
+        artifact is created.
+
+    Yields:
+        bytes: The parquet file content.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _BytesSink()
+    writer = None
+
+    try:
+        for batch in batches:
+            rows = [{k: _to_arrow_value(v) for k, v in doc.items()}
+                    for doc in batch]
+            table = pa.Table.from_pylist(rows)
+
+            if schema is None:
+                schema = table.schema
+
+            table = _conform_table(table, schema)
+
+            if writer is None:
+                writer = pq.ParquetWriter(sink, schema,
+                                          compression=compression or 'snappy')
+
+            writer.write_table(table)
+            yield sink.drain()
+
+        if writer is None:
+            # An empty export is still a valid, schema only, parquet file.
+            writer = pq.ParquetWriter(sink, schema or pa.schema([]),
+                                      compression=compression or 'snappy')
+    finally:
+        if writer is not None:
+            writer.close()
+
+    yield sink.drain()
+
+
+def _conform_table(table: Any, schema: Any) -> Any:
+    """
+    Cast a table to a schema, adding null columns for the missing fields.
+
+    Raises:
+        ValueError: If the table has fields that are not in the schema or
+        types that cannot be promoted to the schema types.
+    """
+    import pyarrow as pa
+
+    extra = [name for name in table.schema.names
+             if schema.get_field_index(name) < 0]
+
+    if extra:
+        raise ValueError(f'The fields {extra} are not in the file schema '
+                         f'{schema.names}. Pass an explicit schema.')
+
+    for field in table.schema:
+        expected = schema.field(field.name).type
+
+        try:
+            promoted = pa.unify_schemas(
+                [pa.schema([field.with_type(expected)]), pa.schema([field])],
+                promote_options='permissive').field(field.name).type
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            promoted = None
+
+        if promoted is None or not promoted.equals(expected):
+            raise ValueError(f'The field {field.name} is {field.type}, which '
+                             f'does not fit its file type {expected}. Pass '
+                             f'an explicit schema.')
+
+    columns = [table.column(field.name).cast(field.type)
+               if field.name in table.schema.names
+               else pa.nulls(table.num_rows, field.type)
+               for field in schema]
+
+    return pa.Table.from_arrays(columns, schema=schema)
@@ -1,3 +1,17 @@
 import os
 
 os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = '/Users/archy/.secrets/gcp-infra-owner.json'
+
+import pytest
+
+from tests.fake_gcs import FakeClient
+
+
+@pytest.fixture(scope='function')
+def fake_gcs(monkeypatch):
+    import infra.core.gcp.gcs as gcs
+
+    client = FakeClient(bucket_names=['infra-test'])
+    monkeypatch.setattr(gcs, '_gcs_client', client)
+
+    return client
@@ -0,0 +1,316 @@
+"""
+An in-memory stand-in for the parts of the google cloud storage client that
+the infra library uses. Replace `infra.core.gcp.gcs._gcs_client` with a
+`FakeClient` to test the storage methods without a real bucket.
+"""
+import base64
+import hashlib
+import itertools
+import json
+from typing import Any, Dict, List
+
+from google.cloud.exceptions import NotFound
+
+_generations = itertools.count(1)
+
+
+def _md5(data: bytes) -> str:
+    return base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+
+def _crc32c(data: bytes) -> str:
+    import google_crc32c
+    checksum = google_crc32c.value(data)
+
+    return base64.b64encode(checksum.to_bytes(4, 'big')).decode('ascii')
+
+
+class FakeBlob():
+    def __init__(self, bucket: 'FakeBucket', name: str, chunk_size=None,
+                 generation: int = None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+        self.generation = generation
+        self.metadata = None
+        self.content_type = None
+        self.content_encoding = None
+        self.size = None
+        self.md5_hash = None
+        self.crc32c = None
+        self.updated = None
+
+    def _stored(self) -> 'FakeBlob':
+        versions = self.bucket.objects.get(self.name)
+
+        if not versions:
+            raise NotFound(f'No such object: {self.bucket.name}/{self.name}')
+        if self.generation is None:
+            return versions[-1]
+
+        for version in versions:
+            if version.generation == self.generation:
+                return version
+
+        raise NotFound(f'No such object: {self.bucket.name}/{self.name}#'
+                       f'{self.generation}')
+
+    def _data(self) -> bytes:
+        return self.bucket.data[(self.name, self._stored().generation)]
+
+    def _store(self, data: bytes, composite: bool = False):
+        self.bucket.check_exists()
+        self.generation = next(_generations)
+        self.size = len(data)
+        self.md5_hash = None if composite else _md5(data)
+        self.crc32c = _crc32c(data)
+        stored = FakeBlob(self.bucket, self.name, generation=self.generation)
+        stored.metadata = dict(self.metadata) if self.metadata else None
+        stored.content_type = self.content_type
+        stored.content_encoding = self.content_encoding
+        stored.size = self.size
+        stored.md5_hash = self.md5_hash
+        stored.crc32c = self.crc32c
+        self.bucket.objects.setdefault(self.name, []).append(stored)
+        self.bucket.data[(self.name, self.generation)] = data
+        self.bucket.client.uploads += 1
+
+    def upload_from_file(self, file_obj, content_type=None, size=None,
+                         **kwargs):
+        self.content_type = content_type or self.content_type
+        chunks = []
+
+        chunk_size = self.chunk_size or 1024 ** 2
+
+        # Like a resumable upload, a short read marks the end of the file.
+        while True:
+            chunk = file_obj.read(chunk_size)
+            chunks.append(chunk)
+            if len(chunk) < chunk_size:
+                break
+            if size is not None and sum(map(len, chunks)) >= size:
+                break
+
+        data = b''.join(chunks)
+        self._store(data[:size] if size is not None else data)
+
+    def upload_from_string(self, data, content_type=None, **kwargs):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.content_type = content_type or self.content_type
+        self._store(bytes(data))
+
+    def upload_from_filename(self, filename, content_type=None, **kwargs):
+        with open(filename, 'rb') as f:
+            self.upload_from_file(f, content_type=content_type)
+
+    def download_as_bytes(self, start=None, end=None, raw_download=False,
+                          **kwargs) -> bytes:
+        data = self._data()
+        start = start or 0
+        end = len(data) - 1 if end is None else end
+        self.bucket.client.downloads += 1
+        # Like the headers of a download response.
+        self.content_encoding = self._stored().content_encoding
+
+        return data[start:end + 1]
+
+    download_as_string = download_as_bytes
+
+    def download_to_file(self, file_obj, start=None, end=None,
+                         raw_download=False, **kwargs):
+        file_obj.write(self.download_as_bytes(start, end))
+
+    def download_to_filename(self, filename, **kwargs):
+        with open(filename, 'wb') as f:
+            self.download_to_file(f, **kwargs)
+
+    def reload(self, **kwargs):
+        stored = self._stored()
+        for attr in ('generation', 'metadata', 'content_type',
+                     'content_encoding', 'size', 'md5_hash', 'crc32c'):
+            setattr(self, attr, getattr(stored, attr))
+
+    def exists(self, **kwargs) -> bool:
+        try:
+            self._stored()
+            return True
+        except NotFound:
+            return False
+
+    def patch(self, **kwargs):
+        stored = self._stored()
+        stored.metadata = dict(stored.metadata or {})
+        stored.metadata.update(self.metadata or {})
+        self.metadata = dict(stored.metadata)
+
+    def delete(self, **kwargs):
+        self._stored()
+        del self.bucket.objects[self.name]
+
+    def compose(self, sources: List['FakeBlob'], **kwargs):
+        data = b''.join(source._data() for source in sources)
+        self._store(data, composite=True)
+
+
+class FakeBucket():
+    def __init__(self, client: 'FakeClient', name: str):
+        self.client = client
+        self.name = name
+        self.objects: Dict[str, List[FakeBlob]] = {}
+        self.data: Dict[Any, bytes] = {}
+
+    def check_exists(self):
+        if self.name not in self.client.buckets:
+            raise NotFound(f'No such bucket: {self.name}')
+
+    def blob(self, blob_name: str, chunk_size=None, generation=None,
+             **kwargs) -> FakeBlob:
+        return FakeBlob(self, blob_name, chunk_size, generation)
+
+    def get_blob(self, blob_name: str, generation=None, **kwargs):
+        self.check_exists()
+        blob = FakeBlob(self, blob_name, generation=generation)
+
+        try:
+            blob.reload()
+        except NotFound:
+            return None
+
+        return blob
+
+    def list_blobs(self, prefix=None, delimiter=None, **kwargs):
+        return self.client.list_blobs(self, prefix=prefix,
+                                      delimiter=delimiter)
+
+
+class FakeClient():
+    def __init__(self, bucket_names=()):
+        self.buckets: Dict[str, FakeBucket] = {}
+        self.bucket_gets = 0
+        self.uploads = 0
+        self.downloads = 0
+
+        for name in bucket_names:
+            self.buckets[name] = FakeBucket(self, name)
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return self.buckets.get(bucket_name) or FakeBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name: str) -> FakeBucket:
+        self.bucket_gets += 1
+        bucket = self.bucket(bucket_name)
+        bucket.check_exists()
+
+        return bucket
+
+    def list_blobs(self, bucket_or_name, prefix=None, delimiter=None,
+                   **kwargs) -> List[FakeBlob]:
+        name = getattr(bucket_or_name, 'name', bucket_or_name)
+        bucket = self.bucket(name)
+        bucket.check_exists()
+        blobs = []
+
+        for object_name in sorted(bucket.objects):
+            if prefix and not object_name.startswith(prefix):
+                continue
+            rest = object_name[len(prefix or ''):]
+            if delimiter and delimiter in rest:
+                continue
+            blobs.append(bucket.objects[object_name][-1])
+
+        return blobs
+
+    def read(self, bucket_name: str, object_name: str) -> bytes:
+        return FakeBlob(self.buckets[bucket_name], object_name)._data()
+
+
+def _resource(blob: FakeBlob) -> Dict[str, Any]:
+    return {'name': blob.name, 'bucket': blob.bucket.name,
+            'generation': str(blob.generation), 'size': str(blob.size),
+            'md5Hash': blob.md5_hash, 'crc32c': blob.crc32c,
+            'contentType': blob.content_type, 'metadata': blob.metadata}
+
+
+def fake_gcs_app(client: FakeClient, page_size: int = 2):
+    """
+    Create an aiohttp application that serves the JSON API endpoints the
+    asyncio client uses, backed by a `FakeClient`.
+    """
+    from aiohttp import web
+
+    def not_found(error: NotFound):
+        return web.json_response({'error': {'message': str(error)}},
+                                 status=404)
+
+    async def upload(request):
+        boundary = request.content_type == 'multipart/related' and \
+            request.headers['Content-Type'].split('boundary=')[1]
+        body = await request.read()
+        parts = body.split(f'--{boundary}'.encode('ascii'))[1:-1]
+        resource, data = [part.split(b'\r\n\r\n', 1)[1][:-2]
+                          for part in parts]
+        resource = json.loads(resource)
+        blob = client.bucket(request.match_info['bucket']).blob(
+            resource['name'])
+        blob.metadata = resource.get('metadata')
+
+        try:
+            blob.upload_from_string(data)
+        except NotFound as e:
+            return not_found(e)
+
+        return web.json_response(_resource(blob))
+
+    async def download(request):
+        generation = request.query.get('generation')
+        blob = client.bucket(request.match_info['bucket']).blob(
+            request.match_info['object'],
+            generation=int(generation) if generation else None)
+
+        try:
+            data = blob.download_as_bytes()
+        except NotFound as e:
+            return not_found(e)
+
+        # Like GCS, compressed objects are served as stored.
+        headers = {'Content-Encoding': blob.content_encoding} \
+            if blob.content_encoding else None
+
+        return web.Response(body=data, headers=headers)
+
+    async def list_objects(request):
+        try:
+            blobs = client.list_blobs(request.match_info['bucket'],
+                                      prefix=request.query.get('prefix'),
+                                      delimiter=request.query.get('delimiter'))
+        except NotFound as e:
+            return not_found(e)
+
+        start = int(request.query.get('pageToken', 0))
+        page = {'items': [_resource(blob)
+                          for blob in blobs[start:start + page_size]]}
+        if start + page_size < len(blobs):
+            page['nextPageToken'] = str(start + page_size)
+
+        return web.json_response(page)
+
+    async def delete(request):
+        blob = client.bucket(request.match_info['bucket']).blob(
+            request.match_info['object'])
+
+        try:
+            blob.delete()
+        except NotFound as e:
+            return not_found(e)
+
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.router.add_post('/upload/storage/v1/b/{bucket}/o', upload)
+    app.router.add_get('/download/storage/v1/b/{bucket}/o/{object:.+}',
+                       download)
+    app.router.add_get('/storage/v1/b/{bucket}/o', list_objects)
+    app.router.add_delete('/storage/v1/b/{bucket}/o/{object:.+}', delete)
+
+    return app
@@ -1,12 +1,80 @@
 import json
-from typing import Any, Dict, Tuple
+from typing import Any, Dict, NamedTuple, Tuple
 
+import bson
+import mongomock
 import pytest
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from pymongo import MongoClient
 from pymongo.database import Database
 from pymongo.errors import WriteError
 
 from infra.core.db import MongoHandler
+from infra.core.metrics import REGISTRY
+
+
+class YearRecord(NamedTuple):
+    name: str
+    year: int
+
+
+class SlotsYearRecord():
+    __slots__ = ('name', 'year')
+
+
+class _RawMongoMockCollection():
+    """Returns the documents of a mongomock collection as raw BSON, which
+    mongomock does not support."""
+
+    def __init__(self, collection: mongomock.Collection,
+                 codec_options: CodecOptions):
+        self._collection = collection
+        self.codec_options = codec_options
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._collection, name)
+
+    def find(self, *args, **kwargs):
+        return (RawBSONDocument(bson.encode(doc))
+                for doc in self._collection.find(*args, **kwargs))
+
+    def find_one(self, *args, **kwargs):
+        doc = self._collection.find_one(*args, **kwargs)
+        return None if doc is None else RawBSONDocument(bson.encode(doc))
+
+
+class _RawMongoMockDatabase():
+    def __init__(self, database: mongomock.Database):
+        self._database = database
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._database, name)
+
+    def get_collection(self, name: str, codec_options: CodecOptions = None,
+                       **kwargs):
+        collection = self._database.get_collection(name, **kwargs)
+
+        if codec_options is not None and \
+                codec_options.document_class is RawBSONDocument:
+            return _RawMongoMockCollection(collection, codec_options)
+
+        return collection
+
+
+class _RawMongoMockClient(mongomock.MongoClient):
+    def get_database(self, *args, **kwargs):
+        return _RawMongoMockDatabase(super().get_database(*args, **kwargs))
+
+
+@pytest.fixture(scope='function')
+def mock_mongo_handler(monkeypatch, scheme_and_data):
+    monkeypatch.setattr('infra.core.db.MongoClient', _RawMongoMockClient)
+    handler = MongoHandler('mongodb://localhost', 'infra-test', 'Infra-Test')
+    _, valid_data, _ = scheme_and_data
+    handler.get_collection('records').insert_one(dict(valid_data))
+
+    return handler
 
 
 @pytest.fixture(scope='module')
@@ -122,3 +190,43 @@ def test_update_collection_schema(mongo_handler: MongoHandler,
     col_name = "imaginary"
     result = mongo_handler.update_collection_schema(col_name, valid_scheme)
     assert not result
+
+
+def test_get_raw_collection(mock_mongo_handler: MongoHandler,
+                            scheme_and_data: Tuple[Dict[str, Any]]):
+    _, valid_data, _ = scheme_and_data
+
+    collection = mock_mongo_handler.get_collection('records', raw_bson=True)
+    doc = collection.find_one()
+    assert isinstance(doc, RawBSONDocument)
+    assert doc['name'] == valid_data['name']
+
+    codec_options = CodecOptions(document_class=RawBSONDocument)
+    collection = mock_mongo_handler.get_collection(
+        'records', codec_options=codec_options)
+    assert collection.codec_options is codec_options
+
+
+def test_find_records(mock_mongo_handler: MongoHandler,
+                      scheme_and_data: Tuple[Dict[str, Any]]):
+    _, valid_data, _ = scheme_and_data
+    latency = REGISTRY.get('infra_db_operation_seconds')
+    observed = latency.get(operation='find_records')['count']
+
+    records = list(mock_mongo_handler.find_records('records', YearRecord))
+    assert records == [YearRecord(valid_data['name'], valid_data['year'])]
+    assert latency.get(operation='find_records')['count'] == observed + 1
+
+    records = list(mock_mongo_handler.find_records('records',
+                                                   SlotsYearRecord))
+    assert len(records) == 1
+    assert records[0].name == valid_data['name']
+    assert records[0].year == valid_data['year']
+
+    records = list(mock_mongo_handler.find_records(
+        'records', YearRecord, {'name': 'imaginary'}))
+    assert records == []
+
+    # Raised by the call itself, before any record is read.
+    with pytest.raises(TypeError):
+        mock_mongo_handler.find_records('records', dict)
@@ -0,0 +1,323 @@
+import gzip
+import io
+import json
+
+import mongomock
+import pytest
+from bson import json_util
+
+from infra.core.db import MongoHandler
+from infra.core.gcp import gcs
+from infra.core.gcp.gcs_cache import ArtifactCache
+from infra.extensions.gcp import (export_collection_to_gcs,
+                                 read_dataframe_from_gcs,
+                                 upload_dataframe_to_gcs,
+                                 write_partitioned_dataframe)
+
+
+@pytest.fixture(scope='function')
+def mock_mongo_handler(monkeypatch):
+    monkeypatch.setattr('infra.core.db.MongoClient', mongomock.MongoClient)
+    handler = MongoHandler('mongodb://localhost', 'infra-test', 'Infra-Test')
+    docs = [{'name': f'doc {i}', 'year': 2000 + i % 20} for i in range(250)]
+    handler.get_collection('exported').insert_many(docs)
+
+    return handler
+
+
+def test_export_collection_to_gcs(mock_mongo_handler, fake_gcs):
+    query = {'year': {'$gte': 2010}}
+    result = export_collection_to_gcs(mock_mongo_handler, 'exported',
+                                      'infra-test', 'export.ndjson.gz',
+                                      query=query,
+                                      projection={'_id': 0},
+                                      compression='gzip',
+                                      batch_size=32)
+    assert result
+
+    lines = gzip.decompress(fake_gcs.read('infra-test', 'export.ndjson.gz'))
+    docs = [json_util.loads(line) for line in lines.splitlines()]
+    assert len(docs) == 120
+    assert all(doc['year'] >= 2010 for doc in docs)
+
+    blob = fake_gcs.bucket('infra-test').get_blob('export.ndjson.gz')
+    assert blob.content_encoding == 'gzip'
+    assert blob.metadata['docCount'] == '120'
+    assert json_util.loads(blob.metadata['query']) == query
+
+
+def test_export_collection_to_gcs_parquet(mock_mongo_handler, fake_gcs):
+    pq = pytest.importorskip('pyarrow.parquet')
+    result = export_collection_to_gcs(mock_mongo_handler, 'exported',
+                                      'infra-test', 'export.parquet',
+                                      file_format='parquet',
+                                      batch_size=100)
+    assert result
+
+    data = fake_gcs.read('infra-test', 'export.parquet')
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 250
+    assert set(table.column_names) == {'_id', 'name', 'year'}
+
+
+def test_export_collection_to_gcs_parquet_schema(mock_mongo_handler,
+                                                 fake_gcs):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    collection = mock_mongo_handler.get_collection('drifting')
+    collection.insert_many([{'a': i} for i in range(3)] +
+                           [{'a': i + 0.5, 'extra': 'x'} for i in range(3)])
+
+    assert not export_collection_to_gcs(mock_mongo_handler, 'drifting',
+                                        'infra-test', 'drift.parquet',
+                                        projection={'_id': 0},
+                                        file_format='parquet', batch_size=3)
+    assert not fake_gcs.bucket('infra-test').get_blob('drift.parquet')
+
+    schema = pa.schema([('a', pa.float64()), ('extra', pa.string())])
+    assert export_collection_to_gcs(mock_mongo_handler, 'drifting',
+                                    'infra-test', 'drift.parquet',
+                                    projection={'_id': 0},
+                                    file_format='parquet', batch_size=3,
+                                    schema=schema)
+    table = pq.read_table(io.BytesIO(fake_gcs.read('infra-test',
+                                                   'drift.parquet')))
+    assert table.to_pydict() == {'a': [0, 1, 2, 0.5, 1.5, 2.5],
+                                 'extra': [None] * 3 + ['x'] * 3}
+
+
+def test_export_empty_collection_to_gcs_parquet(mock_mongo_handler,
+                                                fake_gcs):
+    pq = pytest.importorskip('pyarrow.parquet')
+    assert export_collection_to_gcs(mock_mongo_handler, 'exported',
+                                    'infra-test', 'empty.parquet',
+                                    query={'year': 1900},
+                                    file_format='parquet')
+
+    table = pq.read_table(io.BytesIO(fake_gcs.read('infra-test',
+                                                   'empty.parquet')))
+    assert table.num_rows == 0
+
+
+def test_export_collection_to_missing_bucket(mock_mongo_handler, fake_gcs):
+    result = export_collection_to_gcs(mock_mongo_handler, 'exported',
+                                      'imaginary', 'export.ndjson')
+    assert not result
+
+
+@pytest.fixture(scope='module')
+def dataframe():
+    pd = pytest.importorskip('pandas')
+
+    return pd.DataFrame({'name': [f'row {i}' for i in range(1000)],
+                         'year': [2000 + i % 20 for i in range(1000)],
+                         'score': [i / 7 for i in range(1000)]})
+
+
+def test_upload_dataframe_to_gcs_csv(dataframe, fake_gcs):
+    pd = pytest.importorskip('pandas')
+    assert upload_dataframe_to_gcs(dataframe, 'infra-test', 'df.csv.gz',
+                                   compression='gzip', chunk_rows=300,
+                                   index=False)
+
+    data = gzip.decompress(fake_gcs.read('infra-test', 'df.csv.gz'))
+    pd.testing.assert_frame_equal(pd.read_csv(io.BytesIO(data)), dataframe)
+    blob = fake_gcs.bucket('infra-test').get_blob('df.csv.gz')
+    assert blob.content_encoding == 'gzip'
+
+
+def test_read_dataframe_from_gcs_content_encoding(dataframe, fake_gcs):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('zstandard')
+    assert upload_dataframe_to_gcs(dataframe, 'infra-test', 'df.csv',
+                                   compression='zstd', chunk_rows=300,
+                                   index=False)
+
+    result = read_dataframe_from_gcs('infra-test', 'df.csv')
+    pd.testing.assert_frame_equal(result, dataframe)
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'feather'])
+def test_upload_dataframe_to_gcs_arrow(dataframe, fake_gcs, file_format):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    assert upload_dataframe_to_gcs(dataframe, 'infra-test', 'df',
+                                   file_format=file_format,
+                                   compression='zstd', chunk_rows=300)
+
+    data = io.BytesIO(fake_gcs.read('infra-test', 'df'))
+    result = pd.read_parquet(data) if file_format == 'parquet' \
+        else pd.read_feather(data)
+    pd.testing.assert_frame_equal(result, dataframe)
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'feather'])
+def test_upload_dataframe_to_gcs_late_values(fake_gcs, file_format):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    dataframe = pd.DataFrame({'id': range(6),
+                              'note': [None, None, None, 'a', None, 'b']})
+    assert upload_dataframe_to_gcs(dataframe, 'infra-test', 'df',
+                                   file_format=file_format, chunk_rows=3)
+
+    data = io.BytesIO(fake_gcs.read('infra-test', 'df'))
+    result = pd.read_parquet(data) if file_format == 'parquet' \
+        else pd.read_feather(data)
+    assert result['note'].fillna('-').tolist() == \
+        ['-', '-', '-', 'a', '-', 'b']
+
+
+def test_upload_dataframe_to_missing_bucket(dataframe, fake_gcs):
+    assert not upload_dataframe_to_gcs(dataframe, 'imaginary', 'df.csv')
+
+
+@pytest.mark.parametrize('file_format, object_name', [
+    ('csv', 'df.csv.gz'), ('parquet', 'df.parquet'), ('feather', 'df.arrow')])
+def test_read_dataframe_from_gcs(dataframe, fake_gcs, file_format,
+                                 object_name):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    compression = 'gzip' if file_format == 'csv' else None
+    assert upload_dataframe_to_gcs(dataframe, 'infra-test', object_name,
+                                   file_format=file_format,
+                                   compression=compression, chunk_rows=100,
+                                   index=False)
+
+    result = read_dataframe_from_gcs('infra-test', object_name)
+    pd.testing.assert_frame_equal(result, dataframe)
+
+    filters = [('year', '>=', 2015), ('name', '!=', 'row 19')]
+    expected = dataframe[(dataframe['year'] >= 2015) &
+                         (dataframe['name'] != 'row 19')][['score']]
+    result = read_dataframe_from_gcs('infra-test', object_name,
+                                     columns=['score'], filters=filters)
+    pd.testing.assert_frame_equal(result, expected)
+
+    chunks = list(read_dataframe_from_gcs('infra-test', object_name,
+                                          columns=['score'], filters=filters,
+                                          chunksize=250))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected,
+                                  check_index_type=False)
+
+
+def test_read_dataframe_from_gcs_feather_projection(dataframe, fake_gcs):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    upload_dataframe_to_gcs(dataframe, 'infra-test', 'df.arrow',
+                            file_format='feather', chunk_rows=100)
+
+    result = read_dataframe_from_gcs('infra-test', 'df.arrow',
+                                     columns=['score', 'name'])
+    pd.testing.assert_frame_equal(result, dataframe[['score', 'name']])
+
+
+def test_read_dataframe_from_gcs_csv_engine_fallback(dataframe, fake_gcs):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    upload_dataframe_to_gcs(dataframe, 'infra-test', 'df.csv', index=False)
+
+    # The pyarrow engine does not support converters.
+    result = read_dataframe_from_gcs('infra-test', 'df.csv',
+                                     converters={'name': str.upper})
+    pd.testing.assert_frame_equal(
+        result, dataframe.assign(name=dataframe['name'].str.upper()))
+
+
+def test_read_dataframe_from_gcs_prunes_row_groups(dataframe, fake_gcs):
+    pytest.importorskip('pyarrow')
+    sorted_df = dataframe.sort_values('year', ignore_index=True)
+    upload_dataframe_to_gcs(sorted_df, 'infra-test', 'df.parquet',
+                            file_format='parquet', chunk_rows=100)
+    downloads = fake_gcs.downloads
+
+    result = read_dataframe_from_gcs('infra-test', 'df.parquet',
+                                     filters=[('year', '==', 2019)])
+    assert len(result) == 50
+    # The footer and one row group, instead of ten row groups.
+    assert fake_gcs.downloads - downloads < 5
+
+
+def test_read_dataframe_from_gcs_cached(dataframe, fake_gcs, monkeypatch,
+                                        tmp_path):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(gcs, '_artifact_cache',
+                        ArtifactCache(str(tmp_path), 1024 ** 3))
+    upload_dataframe_to_gcs(dataframe, 'infra-test', 'df.parquet',
+                            file_format='parquet')
+    generation = fake_gcs.bucket('infra-test').get_blob(
+        'df.parquet').generation
+
+    for _ in range(2):
+        result = read_dataframe_from_gcs('infra-test', 'df.parquet',
+                                         generation=generation)
+        pd.testing.assert_frame_equal(result, dataframe)
+
+    assert gcs.get_cache_stats() == {'hits': 1, 'misses': 1,
+                                     'bytesSaved': fake_gcs.bucket(
+                                         'infra-test').get_blob(
+                                             'df.parquet').size}
+
+
+@pytest.mark.parametrize('file_format, object_name', [
+    ('csv', 'df.csv.gz'), ('parquet', 'df.parquet'), ('feather', 'df.arrow')])
+def test_read_dataframe_from_truncated_artifact(dataframe, fake_gcs,
+                                                file_format, object_name):
+    pytest.importorskip('pyarrow')
+    compression = 'gzip' if file_format == 'csv' else None
+    upload_dataframe_to_gcs(dataframe, 'infra-test', object_name,
+                            file_format=file_format, compression=compression,
+                            index=False)
+
+    data = fake_gcs.read('infra-test', object_name)
+    fake_gcs.bucket('infra-test').blob(object_name).upload_from_string(
+        data[:len(data) // 2])
+
+    assert read_dataframe_from_gcs('infra-test', object_name) is None
+
+
+def test_read_dataframe_from_missing_artifact(fake_gcs):
+    assert read_dataframe_from_gcs('infra-test', 'imaginary.csv') is None
+
+
+def test_write_partitioned_dataframe(dataframe, fake_gcs):
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    frame = dataframe.assign(kind=[None if i % 10 == 0 else 'a/b' * (i % 2)
+                                   for i in range(1000)])
+    report = write_partitioned_dataframe(frame, 'infra-test', 'dataset/',
+                                         partition_cols=['kind'],
+                                         max_rows_per_file=200,
+                                         max_workers=2)
+    assert report and len(report.files) == 6
+
+    manifest = json.loads(fake_gcs.read('infra-test',
+                                        'dataset/_manifest.json'))
+    assert manifest['rowCount'] == 1000
+    assert manifest['partitionColumns'] == ['kind']
+    assert [f['path'] for f in manifest['files']] == [
+        'dataset/kind=/part-00000.parquet',
+        'dataset/kind=/part-00001.parquet',
+        'dataset/kind=__HIVE_DEFAULT_PARTITION__/part-00000.parquet',
+        'dataset/kind=a%2Fb/part-00000.parquet',
+        'dataset/kind=a%2Fb/part-00001.parquet',
+        'dataset/kind=a%2Fb/part-00002.parquet']
+    assert manifest['files'][0]['partition'] == {'kind': ''}
+    assert manifest['files'][2]['partition'] == {'kind': None}
+    assert manifest['files'][-1]['partition'] == {'kind': 'a/b'}
+
+    parts = [read_dataframe_from_gcs('infra-test', f['path'])
+             for f in manifest['files']]
+    assert [len(part) for part in parts] == [f['rows']
+                                             for f in manifest['files']]
+    result = pd.concat(parts).sort_values('score', ignore_index=True)
+    pd.testing.assert_frame_equal(result, dataframe)
+
+
+def test_write_partitioned_dataframe_to_missing_bucket(dataframe, fake_gcs):
+    pytest.importorskip('pyarrow')
+    report = write_partitioned_dataframe(dataframe, 'imaginary-bucket',
+                                         'dataset', max_rows_per_file=500,
+                                         max_workers=1)
+    assert not report and len(report.failures) == 2
@@ -0,0 +1,489 @@
+import gzip
+import os
+
+import pytest
+
+from infra.core.gcp import gcs
+from infra.core.gcp.gcs_cache import ArtifactCache
+
+
+@pytest.fixture(scope='function')
+def artifacts(fake_gcs):
+    bucket = fake_gcs.bucket('infra-test')
+    contents = {
+        'data/a.csv': b'a,b\n1,2\n',
+        'data/b.csv': b'a,b\n3,4\n',
+        'data/notes.txt': b'notes',
+        'data/raw/c.csv': b'a,b\n5,6\n',
+        'other/d.csv': b'a,b\n7,8\n'
+    }
+
+    for name, data in contents.items():
+        bucket.blob(name).upload_from_string(data)
+
+    return contents
+
+
+def test_download_artifacts_bunch_wildcard(artifacts, fake_gcs, tmp_path):
+    report = gcs.download_artifacts_bunch('infra-test', str(tmp_path),
+                                          'data/*.csv')
+    assert report
+    assert sorted(os.listdir(tmp_path)) == ['a.csv', 'b.csv']
+    assert (tmp_path / 'a.csv').read_bytes() == artifacts['data/a.csv']
+    assert report.bytes == len(artifacts['data/a.csv']) + \
+        len(artifacts['data/b.csv'])
+
+
+def test_download_artifacts_bunch_recursive(artifacts, fake_gcs, tmp_path):
+    report = gcs.download_artifacts_bunch('infra-test', str(tmp_path),
+                                          '/data',
+                                          activate_recursive_download=True,
+                                          activate_parallel_download=True,
+                                          max_workers=4)
+    assert report
+    assert len(report.files) == 4
+    assert (tmp_path / 'raw' / 'c.csv').read_bytes() == \
+        artifacts['data/raw/c.csv']
+    assert not any(gcs.SYNC_TMP_SUFFIX in name
+                   for name in os.listdir(tmp_path))
+
+
+def test_download_artifacts_bunch_wildcard_segments(artifacts, fake_gcs,
+                                                    tmp_path):
+    report = gcs.download_artifacts_bunch('infra-test', str(tmp_path),
+                                          'data/*.csv',
+                                          activate_recursive_download=True)
+    assert report
+    assert sorted(os.listdir(tmp_path)) == ['a.csv', 'b.csv']
+
+
+def test_download_artifacts_bunch_outside_destination(fake_gcs, tmp_path):
+    bucket = fake_gcs.bucket('infra-test')
+    bucket.blob('data/../../escaped.csv').upload_from_string(b'escaped')
+    bucket.blob('data/kept.csv').upload_from_string(b'kept')
+    dest_dir = tmp_path / 'dest'
+
+    report = gcs.download_artifacts_bunch('infra-test', str(dest_dir), 'data',
+                                          activate_recursive_download=True)
+    assert not report
+    assert list(report.failures) == ['data/../../escaped.csv']
+    assert os.listdir(dest_dir) == ['kept.csv']
+    assert not (tmp_path / 'escaped.csv').exists()
+
+    report = gcs.sync_directory(str(dest_dir), 'infra-test', 'data',
+                                direction='down')
+    assert list(report.failures) == ['data/../../escaped.csv']
+    assert not (tmp_path / 'escaped.csv').exists()
+
+
+def test_download_artifacts_bunch_skips_unchanged(artifacts, fake_gcs,
+                                                   tmp_path):
+    gcs.download_artifacts_bunch('infra-test', str(tmp_path), 'data')
+    (tmp_path / 'b.csv').write_bytes(b'changed')
+    downloads = fake_gcs.downloads
+
+    report = gcs.download_artifacts_bunch('infra-test', str(tmp_path), 'data')
+    assert report
+    assert len(report.skipped) == 2
+    assert report.files == [str(tmp_path / 'b.csv')]
+    assert fake_gcs.downloads == downloads + 1
+
+
+def test_download_artifacts_bunch_missing_bucket(fake_gcs, tmp_path):
+    report = gcs.download_artifacts_bunch('imaginary', str(tmp_path))
+    assert not report
+    assert 'imaginary' in report.failures
+
+
+def test_upload_artifact_composite(fake_gcs, monkeypatch, tmp_path):
+    monkeypatch.setattr(gcs, 'PARALLEL_UPLOAD_PART_SIZE', 1000)
+    data = os.urandom(4500)
+    file_path = tmp_path / 'model.bin'
+    file_path.write_bytes(data)
+
+    result = gcs.upload_artifact('infra-test', 'models/model.bin',
+                                 str(file_path), {'version': '1'},
+                                 parallel_threshold=1024)
+    assert result
+    assert fake_gcs.read('infra-test', 'models/model.bin') == data
+
+    blob = fake_gcs.bucket('infra-test').get_blob('models/model.bin')
+    assert blob.metadata == {'version': '1'}
+    names = [b.name for b in fake_gcs.list_blobs('infra-test')]
+    assert names == ['models/model.bin']
+
+
+def test_upload_artifact_composite_resume(fake_gcs, monkeypatch, tmp_path):
+    monkeypatch.setattr(gcs, 'PARALLEL_UPLOAD_PART_SIZE', 1000)
+    data = os.urandom(3000)
+    file_path = tmp_path / 'model.bin'
+    file_path.write_bytes(data)
+    bucket = fake_gcs.bucket('infra-test')
+    parts_prefix = gcs.COMPOSITE_PARTS_PREFIX + 'model.bin/'
+    bucket.blob(parts_prefix + 'part-00-of-03').upload_from_string(
+        data[:1000])
+    bucket.blob(parts_prefix + 'part-01-of-03').upload_from_string(b'stale')
+    uploads = fake_gcs.uploads
+
+    result = gcs.upload_artifact('infra-test', 'model.bin', str(file_path),
+                                 parallel_threshold=1024)
+    assert result
+    assert fake_gcs.read('infra-test', 'model.bin') == data
+    # Two parts and the composed object.
+    assert fake_gcs.uploads == uploads + 3
+    assert [b.name for b in fake_gcs.list_blobs('infra-test')] == \
+        ['model.bin']
+
+
+def test_upload_artifact_composite_interrupted(fake_gcs, monkeypatch,
+                                               tmp_path):
+    monkeypatch.setattr(gcs, 'PARALLEL_UPLOAD_PART_SIZE', 1000)
+    data = os.urandom(3000)
+    file_path = tmp_path / 'model.bin'
+    file_path.write_bytes(data)
+    blob_class = type(fake_gcs.bucket('infra-test').blob('model.bin'))
+    upload_from_file = blob_class.upload_from_file
+
+    def failing_upload(self, file_obj, **kwargs):
+        if self.name.endswith('part-02-of-03'):
+            raise gcs.GoogleCloudError('connection reset')
+        upload_from_file(self, file_obj, **kwargs)
+
+    monkeypatch.setattr(blob_class, 'upload_from_file', failing_upload)
+    assert not gcs.upload_artifact('infra-test', 'model.bin', str(file_path),
+                                   parallel_threshold=1024, max_workers=1)
+    assert fake_gcs.bucket('infra-test').get_blob('model.bin') is None
+    assert len(list(fake_gcs.list_blobs('infra-test'))) == 2
+
+    monkeypatch.setattr(blob_class, 'upload_from_file', upload_from_file)
+    uploads = fake_gcs.uploads
+    assert gcs.upload_artifact('infra-test', 'model.bin', str(file_path),
+                               parallel_threshold=1024, max_workers=1)
+    assert fake_gcs.read('infra-test', 'model.bin') == data
+    # The missing part and the composed object.
+    assert fake_gcs.uploads == uploads + 2
+    assert [b.name for b in fake_gcs.list_blobs('infra-test')] == \
+        ['model.bin']
+
+
+def test_upload_artifact(fake_gcs, tmp_path):
+    file_path = tmp_path / 'artifact.txt'
+    file_path.write_bytes(b'artifact')
+
+    assert gcs.upload_artifact('infra-test', 'artifact.txt', str(file_path),
+                               {'owner': 'infra'})
+    blob = fake_gcs.bucket('infra-test').get_blob('artifact.txt')
+    assert blob.metadata == {'owner': 'infra'}
+    assert fake_gcs.read('infra-test', 'artifact.txt') == b'artifact'
+
+    assert not gcs.upload_artifact('imaginary', 'artifact.txt',
+                                   str(file_path))
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+@pytest.mark.parametrize('parallel', [False, True])
+def test_upload_artifact_compressed(fake_gcs, monkeypatch, tmp_path,
+                                    compression, parallel):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    if parallel:
+        monkeypatch.setattr(gcs, 'PARALLEL_COMPRESSION_THRESHOLD', 1024)
+        monkeypatch.setattr(gcs, 'COMPRESSION_BLOCK_SIZE', 4096)
+
+    content = b''.join(b'line %d\n' % i for i in range(10000))
+    file_path = tmp_path / 'artifact.txt'
+    file_path.write_bytes(content)
+
+    assert gcs.upload_artifact('infra-test', 'artifact.txt', str(file_path),
+                               {'owner': 'infra'}, compression=compression)
+    blob = fake_gcs.bucket('infra-test').get_blob('artifact.txt')
+    assert blob.content_encoding == compression
+    assert blob.metadata == {'owner': 'infra', 'compression': compression,
+                             'uncompressedSize': str(len(content))}
+    assert blob.size < len(content) / 3
+
+    assert gcs.download_artifact('infra-test', 'artifact.txt', None,
+                                 str(tmp_path), 'downloaded.txt')
+    assert (tmp_path / 'downloaded.txt').read_bytes() == content
+
+    assert gcs.download_artifact('infra-test', 'artifact.txt', None,
+                                 str(tmp_path), 'raw.txt', decompress=False)
+    assert (tmp_path / 'raw.txt').read_bytes() == \
+        fake_gcs.read('infra-test', 'artifact.txt')
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_compressed_artifact_download_paths(fake_gcs, monkeypatch, tmp_path,
+                                            compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    monkeypatch.setattr(gcs, '_artifact_cache',
+                        ArtifactCache(str(tmp_path / 'cache'), 1024 ** 2))
+    content = b''.join(b'line %d\n' % i for i in range(1000))
+    file_path = tmp_path / 'artifact.txt'
+    file_path.write_bytes(content)
+    report = gcs.upload_artifacts_bunch('infra-test',
+                                        {'data/artifact.txt': str(file_path)},
+                                        compression=compression)
+    assert report
+    blob = fake_gcs.bucket('infra-test').get_blob('data/artifact.txt')
+    assert blob.content_encoding == compression
+
+    cached_path = gcs.get_cached_artifact_path('infra-test',
+                                               'data/artifact.txt',
+                                               blob.generation)
+    assert open(cached_path, 'rb').read() == content
+    assert gcs.download_artifact('infra-test', 'data/artifact.txt',
+                                 blob.generation, str(tmp_path), 'cached.txt')
+    assert (tmp_path / 'cached.txt').read_bytes() == content
+
+    report = gcs.download_artifacts_bunch('infra-test',
+                                          str(tmp_path / 'bunch'), 'data')
+    assert report
+    assert (tmp_path / 'bunch' / 'artifact.txt').read_bytes() == content
+
+    assert gcs.download_bytes('infra-test', 'data/artifact.txt') == content
+    assert gcs.download_bytes('infra-test', 'data/artifact.txt',
+                              start=7, end=13) == content[7:14]
+
+    with gcs.open_artifact('infra-test', 'data/artifact.txt') as reader:
+        reader.seek(-8, os.SEEK_END)
+        assert reader.read() == content[-8:]
+
+    with pytest.raises(ValueError):
+        gcs.ArtifactReader(blob)
+
+
+def test_download_artifact_truncated(fake_gcs, tmp_path):
+    blob = fake_gcs.bucket('infra-test').blob('artifact.txt')
+    blob.content_encoding = 'gzip'
+    blob.upload_from_string(gzip.compress(b'artifact' * 100)[:-20])
+
+    assert not gcs.download_artifact('infra-test', 'artifact.txt', None,
+                                     str(tmp_path), 'artifact.txt')
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_artifacts_bunch(fake_gcs, tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.txt').write_bytes(b'a')
+    (tmp_path / 'sub' / 'b.txt').write_bytes(b'bb')
+
+    report = gcs.upload_artifacts_bunch('infra-test', str(tmp_path),
+                                        object_prefix='run/',
+                                        metadata={'run': '1'})
+    assert report
+    assert report.bytes == 3
+    assert fake_gcs.read('infra-test', 'run/sub/b.txt') == b'bb'
+    assert fake_gcs.bucket_gets == 0
+
+    report = gcs.upload_artifacts_bunch(
+        'infra-test',
+        {'x.txt': (str(tmp_path / 'a.txt'), {'kind': 'x'}),
+         'missing.txt': str(tmp_path / 'missing.txt')},
+        metadata={'run': '2'})
+    assert not report
+    assert list(report.failures) == [str(tmp_path / 'missing.txt')]
+    blob = fake_gcs.bucket('infra-test').get_blob('x.txt')
+    assert blob.metadata == {'run': '2', 'kind': 'x'}
+
+
+def test_download_artifact_cached(artifacts, fake_gcs, monkeypatch, tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=1024 ** 2)
+    monkeypatch.setattr(gcs, '_artifact_cache', cache)
+    generation = fake_gcs.bucket('infra-test').get_blob(
+        'data/a.csv').generation
+
+    for dest_dir in ('first', 'second'):
+        (tmp_path / dest_dir).mkdir()
+        assert gcs.download_artifact('infra-test', 'data/a.csv', generation,
+                                     str(tmp_path / dest_dir), 'a.csv')
+        assert (tmp_path / dest_dir / 'a.csv').read_bytes() == \
+            artifacts['data/a.csv']
+
+    assert fake_gcs.downloads == 1
+    assert gcs.get_cache_stats()['hits'] == 1
+
+    assert not gcs.download_artifact('infra-test', 'data/a.csv',
+                                     generation + 1000, str(tmp_path), 'a.csv')
+
+
+def test_open_artifact_write_and_read(fake_gcs, monkeypatch):
+    monkeypatch.setattr(gcs, 'UPLOAD_CHUNK_SIZE', 256 * 1024)
+    data = os.urandom(1024 ** 2 + 123)
+
+    with gcs.open_artifact('infra-test', 'stream.bin', 'wb',
+                           metadata={'kind': 'stream'},
+                           buffer_size=100 * 1024) as writer:
+        for i in range(0, len(data), 70000):
+            writer.write(data[i:i + 70000])
+        assert writer.tell() == len(data)
+
+    assert fake_gcs.read('infra-test', 'stream.bin') == data
+
+    downloads = fake_gcs.downloads
+    with gcs.open_artifact('infra-test', 'stream.bin',
+                           buffer_size=4096) as reader:
+        assert reader.read(10) == data[:10]
+        assert reader.read(10) == data[10:20]
+        reader.seek(-100, os.SEEK_END)
+        assert reader.read() == data[-100:]
+    assert fake_gcs.downloads == downloads + 2
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_open_artifact_write_compressed(fake_gcs, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    data = b'0123456789' * 10000
+
+    with gcs.open_artifact('infra-test', 'stream.txt', 'wb',
+                           buffer_size=4096,
+                           compression=compression) as writer:
+        for i in range(0, len(data), 7000):
+            writer.write(data[i:i + 7000])
+
+    blob = fake_gcs.bucket('infra-test').get_blob('stream.txt')
+    assert blob.content_encoding == compression
+    assert blob.size < len(data)
+
+    with gcs.open_artifact('infra-test', 'stream.txt') as reader:
+        assert reader.read() == data
+
+    assert gcs.upload_bytes('infra-test', 'bytes.txt', data,
+                            compression=compression)
+    assert gcs.download_bytes('infra-test', 'bytes.txt') == data
+
+
+def test_open_artifact_abort(fake_gcs):
+    with pytest.raises(RuntimeError):
+        with gcs.open_artifact('infra-test', 'aborted.bin', 'wb') as writer:
+            writer.write(b'partial')
+            raise RuntimeError()
+
+    assert fake_gcs.bucket('infra-test').get_blob('aborted.bin') is None
+
+
+def test_upload_and_download_bytes(fake_gcs):
+    data = bytearray(b'0123456789')
+    assert gcs.upload_bytes('infra-test', 'digits', memoryview(data))
+    assert gcs.download_bytes('infra-test', 'digits') == b'0123456789'
+    assert gcs.download_bytes('infra-test', 'digits', start=2, end=4) == \
+        b'234'
+    assert gcs.download_bytes('infra-test', 'imaginary') is None
+
+
+def test_sync_directory_up(fake_gcs, monkeypatch, tmp_path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'a.bin').write_bytes(b'a' * 100)
+    (tmp_path / 'sub' / 'b.bin').write_bytes(b'b' * 100)
+    report = gcs.sync_directory(str(tmp_path), 'infra-test', 'models/v1')
+    assert report and len(report.files) == 2
+    assert fake_gcs.read('infra-test', 'models/v1/sub/b.bin') == b'b' * 100
+    assert (tmp_path / gcs.SYNC_MANIFEST_NAME).exists()
+
+    hashed = []
+    file_checksum = gcs._file_checksum
+    monkeypatch.setattr(gcs, '_file_checksum',
+                        lambda path, algorithm: hashed.append(path) or
+                        file_checksum(path, algorithm))
+    uploads = fake_gcs.uploads
+    report = gcs.sync_directory(str(tmp_path), 'infra-test', 'models/v1')
+    assert report and len(report.skipped) == 2
+    assert hashed == [] and fake_gcs.uploads == uploads
+
+    (tmp_path / 'a.bin').write_bytes(b'c' * 100)
+    (tmp_path / 'sub' / 'b.bin').unlink()
+    report = gcs.sync_directory(str(tmp_path), 'infra-test', 'models/v1/',
+                                delete_extra=True)
+    assert report
+    assert report.files == [str(tmp_path / 'a.bin')]
+    assert report.deleted == ['models/v1/sub/b.bin']
+    assert hashed == [str(tmp_path / 'a.bin')]
+    assert [blob.name for blob in fake_gcs.list_blobs('infra-test')] == \
+        ['models/v1/a.bin']
+
+
+def test_sync_directory_down(artifacts, fake_gcs, tmp_path):
+    (tmp_path / 'extra.txt').write_bytes(b'extra')
+    report = gcs.sync_directory(str(tmp_path), 'infra-test', 'data',
+                                direction='down')
+    assert report and len(report.files) == 4
+    assert (tmp_path / 'raw' / 'c.csv').read_bytes() == \
+        artifacts['data/raw/c.csv']
+    assert (tmp_path / 'extra.txt').exists()
+
+    fake_gcs.bucket('infra-test').blob('data/a.csv').upload_from_string(b'new')
+    downloads = fake_gcs.downloads
+    report = gcs.sync_directory(str(tmp_path), 'infra-test', 'data',
+                                direction='down', delete_extra=True)
+    assert report
+    assert report.files == [str(tmp_path / 'a.csv')]
+    assert len(report.skipped) == 3
+    assert report.deleted == [str(tmp_path / 'extra.txt')]
+    assert fake_gcs.downloads == downloads + 1
+    assert (tmp_path / 'a.csv').read_bytes() == b'new'
+
+
+def test_sync_directory_compressed(fake_gcs, tmp_path):
+    source_dir, dest_dir = tmp_path / 'source', tmp_path / 'dest'
+    (source_dir / 'sub').mkdir(parents=True)
+    (source_dir / 'sub' / 'a.txt').write_bytes(b'a' * 1000)
+    report = gcs.sync_directory(str(source_dir), 'infra-test', 'models',
+                                compression='gzip')
+    assert report and len(report.files) == 1
+    blob = fake_gcs.bucket('infra-test').get_blob('models/sub/a.txt')
+    assert blob.content_encoding == 'gzip' and blob.size < 1000
+
+    uploads = fake_gcs.uploads
+    report = gcs.sync_directory(str(source_dir), 'infra-test', 'models',
+                                compression='gzip')
+    assert report and len(report.skipped) == 1
+    assert fake_gcs.uploads == uploads
+    # Without the checksum of its content in the metadata.
+    assert gcs.upload_artifact('infra-test', 'models/b.txt',
+                               str(source_dir / 'sub' / 'a.txt'),
+                               compression='zstd')
+
+    for _ in range(2):
+        downloads = fake_gcs.downloads
+        report = gcs.sync_directory(str(dest_dir), 'infra-test', 'models',
+                                    direction='down')
+        assert report
+        assert (dest_dir / 'sub' / 'a.txt').read_bytes() == b'a' * 1000
+        assert (dest_dir / 'b.txt').read_bytes() == b'a' * 1000
+
+    assert len(report.skipped) == 2
+    assert fake_gcs.downloads == downloads
+
+
+def test_sync_directory_tmp_files(fake_gcs, tmp_path):
+    source_dir, dest_dir = tmp_path / 'source', tmp_path / 'dest'
+    source_dir.mkdir()
+    (source_dir / 'x.part').write_bytes(b'x')
+    (source_dir / ('y.bin' + gcs.SYNC_TMP_SUFFIX + 'f' * 32)).write_bytes(b'y')
+    report = gcs.sync_directory(str(source_dir), 'infra-test', 'models',
+                                delete_extra=True)
+    assert report and report.files == [str(source_dir / 'x.part')]
+
+    report = gcs.sync_directory(str(source_dir), 'infra-test', 'models',
+                                delete_extra=True)
+    assert report and report.skipped == [str(source_dir / 'x.part')]
+    assert not report.deleted
+    assert fake_gcs.read('infra-test', 'models/x.part') == b'x'
+
+    for _ in range(2):
+        downloads = fake_gcs.downloads
+        report = gcs.sync_directory(str(dest_dir), 'infra-test', 'models',
+                                    direction='down', delete_extra=True)
+        assert report and not report.deleted
+
+    assert report.skipped == [str(dest_dir / 'x.part')]
+    assert fake_gcs.downloads == downloads
+    assert sorted(os.listdir(dest_dir)) == \
+        sorted([gcs.SYNC_MANIFEST_NAME, 'x.part'])
+
+
+def test_sync_directory_invalid_direction(fake_gcs, tmp_path):
+    assert not gcs.sync_directory(str(tmp_path), 'infra-test',
+                                  direction='sideways')
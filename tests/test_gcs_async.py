@@ -0,0 +1,82 @@
+import asyncio
+import gzip
+
+import pytest
+
+from tests.fake_gcs import FakeClient, fake_gcs_app
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from aiohttp.test_utils import TestServer  # noqa: E402
+from google.auth.credentials import AnonymousCredentials  # noqa: E402
+
+from infra.core.gcp.gcs_async import AsyncGCSClient  # noqa: E402
+
+
+def run(coroutine_function):
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(coroutine_function())
+    finally:
+        loop.close()
+
+
+def test_async_client():
+    fake_gcs = FakeClient(bucket_names=['infra-test'])
+
+    async def scenario():
+        async with TestServer(fake_gcs_app(fake_gcs)) as server, \
+                AsyncGCSClient(max_concurrency=4,
+                               base_url=str(server.make_url('')),
+                               credentials=AnonymousCredentials()) as client:
+            names = [f'features/{i}/v?1.bin' for i in range(20)]
+            uploaded = await asyncio.gather(
+                *(client.upload('infra-test', name, name.encode('utf-8'),
+                                metadata={'index': name})
+                  for name in names))
+            assert all(uploaded)
+            assert fake_gcs.read('infra-test', names[3]) == \
+                names[3].encode('utf-8')
+
+            contents = await client.download_many('infra-test', names)
+            assert contents == {name: name.encode('utf-8')
+                                for name in names}
+
+            items = await client.list('infra-test', prefix='features/1')
+            assert sorted(item['name'] for item in items) == \
+                sorted(name for name in names
+                       if name.startswith('features/1'))
+            assert items[0]['metadata'] == {'index': items[0]['name']}
+
+            assert await client.delete('infra-test', names[0])
+            assert await client.download('infra-test', names[0]) is None
+            assert not await client.delete('infra-test', names[0])
+            assert not await client.upload('imaginary-bucket', 'a', b'a')
+            assert await client.list('imaginary-bucket') is None
+
+    run(scenario)
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_async_client_download_compressed(compression):
+    fake_gcs = FakeClient(bucket_names=['infra-test'])
+    data = b'feature ' * 1000
+
+    if compression == 'zstd':
+        zstandard = pytest.importorskip('zstandard')
+        compressed = zstandard.ZstdCompressor().compress(data)
+    else:
+        compressed = gzip.compress(data)
+
+    blob = fake_gcs.bucket('infra-test').blob('feature.bin')
+    blob.content_encoding = compression
+    blob.upload_from_string(compressed)
+
+    async def scenario():
+        async with TestServer(fake_gcs_app(fake_gcs)) as server, \
+                AsyncGCSClient(base_url=str(server.make_url('')),
+                               credentials=AnonymousCredentials()) as client:
+            assert await client.download('infra-test', 'feature.bin') == data
+
+    run(scenario)
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+from infra.core.gcp.gcs_cache import ArtifactCache
+
+
+def writer(data: bytes, calls: list = None):
+    def download(path: str):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(0.01)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    return download
+
+
+def test_cache_hit(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=1024)
+    calls = []
+    dest = tmp_path / 'model.bin'
+
+    assert not cache.get_file('b', 'model.bin', 1, str(dest),
+                              writer(b'model', calls))
+    assert cache.get_file('b', 'model.bin', 1, str(dest),
+                          writer(b'model', calls))
+    assert dest.read_bytes() == b'model'
+    assert len(calls) == 1
+    assert cache.stats == {'hits': 1, 'misses': 1, 'bytesSaved': 5}
+
+    assert not cache.get_file('b', 'model.bin', 2, str(dest),
+                              writer(b'model v2', calls))
+    assert dest.read_bytes() == b'model v2'
+
+
+def test_cache_concurrent_fill(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=1024)
+    calls = []
+    threads = [threading.Thread(target=cache.get_file,
+                                args=('b', 'o', 1, str(tmp_path / f'{i}.bin'),
+                                      writer(b'data', calls)))
+               for i in range(8)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert cache.stats['hits'] == 7
+    assert all((tmp_path / f'{i}.bin').read_bytes() == b'data'
+               for i in range(8))
+
+
+def test_cache_eviction(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=250)
+
+    for generation in range(3):
+        cache.get_file('b', 'o', generation, str(tmp_path / 'o.bin'),
+                       writer(bytes(100)))
+        os.utime(cache.entry_path('b', 'o', generation),
+                 (generation, generation))
+
+    cache.get_file('b', 'o', 0, str(tmp_path / 'o.bin'), writer(bytes(100)))
+    cache.evict()
+
+    assert os.path.exists(cache.entry_path('b', 'o', 0))
+    assert not os.path.exists(cache.entry_path('b', 'o', 1))
+    assert os.path.exists(cache.entry_path('b', 'o', 2))
+    assert not os.path.exists(cache.entry_path('b', 'o', 1) + '.lock')
+    assert os.path.exists(cache.entry_path('b', 'o', 2) + '.lock')
+
+
+def test_cache_writable_copy(tmp_path):
+    cache = ArtifactCache(str(tmp_path / 'cache'), max_bytes=1024)
+    dest = tmp_path / 'model.bin'
+
+    cache.get_file('b', 'model.bin', 1, str(dest), writer(b'model'),
+                   writable=True)
+
+    with open(dest, 'ab') as f:
+        f.write(b' tuned')
+
+    assert dest.read_bytes() == b'model tuned'
+    assert open(cache.entry_path('b', 'model.bin', 1), 'rb').read() == b'model'
+    assert cache.get_file('b', 'model.bin', 1, str(dest), writer(b'model'))
+    assert dest.read_bytes() == b'model'
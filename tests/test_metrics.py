@@ -0,0 +1,150 @@
+import math
+import threading
+import urllib.request
+
+import pytest
+
+from infra.core.metrics import (REGISTRY, MetricsRegistry, instrument,
+                                start_metrics_server)
+
+
+@pytest.fixture(scope='function')
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter(registry):
+    counter = registry.counter('ops_total', 'Operations.', ('status',))
+    assert registry.counter('ops_total', 'Operations.', ('status',)) is \
+        counter
+
+    def work():
+        for _ in range(1000):
+            counter.inc(status='ok')
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counter.inc(2.5, status='error')
+    assert counter.get(status='ok') == 4000
+    assert counter.get(status='error') == 2.5
+
+    with pytest.raises(ValueError):
+        counter.inc(-1, status='ok')
+    with pytest.raises(ValueError):
+        counter.inc(kind='ok')
+    with pytest.raises(ValueError):
+        registry.gauge('ops_total', 'Operations.')
+
+
+def test_gauge_and_histogram(registry):
+    gauge = registry.gauge('running', 'Running transfers.')
+    gauge.inc(3)
+    gauge.dec()
+    assert gauge.get() == 2
+
+    histogram = registry.histogram('seconds', 'Durations.', ('operation',),
+                                   buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, operation='upload')
+
+    assert histogram.get(operation='upload') == {
+        'buckets': {0.1: 2, 1.0: 3, math.inf: 4}, 'count': 4, 'sum': 3.65}
+
+    with histogram.time(operation='download'):
+        pass
+    assert histogram.get(operation='download')['count'] == 1
+
+
+def test_exposition(registry):
+    registry.counter('ops_total', 'Operations "by" status.',
+                     ('status',)).inc(status='o"k')
+    registry.histogram('seconds', 'Durations.',
+                       buckets=(1.0,)).observe(0.5)
+
+    assert registry.exposition() == '\n'.join([
+        '# HELP ops_total Operations \\"by\\" status.',
+        '# TYPE ops_total counter',
+        'ops_total{status="o\\"k"} 1',
+        '# HELP seconds Durations.',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="1"} 1',
+        'seconds_bucket{le="+Inf"} 1',
+        'seconds_count 1',
+        'seconds_sum 0.5',
+        ''])
+
+
+def test_instrument(registry):
+    operations = registry.counter('ops_total', 'Operations.',
+                                  ('operation', 'status'))
+    latency = registry.histogram('seconds', 'Durations.', ('operation',))
+
+    @instrument(operations, latency, 'work')
+    def work(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    assert work(True) and work(b'') == b''
+    assert work(False) is False
+    with pytest.raises(KeyError):
+        work(KeyError())
+
+    assert operations.get(operation='work', status='ok') == 2
+    assert operations.get(operation='work', status='error') == 2
+    assert latency.get(operation='work')['count'] == 4
+
+    @instrument(operations, latency, 'lookup',
+                is_failure=lambda result: False)
+    def lookup():
+        return None
+
+    assert lookup() is None
+    assert operations.get(operation='lookup', status='ok') == 1
+
+
+def test_metrics_server(registry):
+    registry.counter('ops_total', 'Operations.').inc()
+    server = start_metrics_server(port=0, addr='127.0.0.1',
+                                  registry=registry)
+
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert b'ops_total 1\n' in response.read()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_gcs_metrics(fake_gcs):
+    from infra.core.gcp import gcs
+
+    operations = REGISTRY.get('infra_gcs_operations_total')
+    transferred = REGISTRY.get('infra_gcs_bytes_total')
+    ok = operations.get(operation='upload_bytes', status='ok')
+    errors = operations.get(operation='download_bytes', status='error')
+    uploaded = transferred.get(operation='upload_bytes', direction='upload')
+
+    assert gcs.upload_bytes('infra-test', 'artifact', b'artifact')
+    assert gcs.download_bytes('infra-test', 'imaginary') is None
+
+    assert operations.get(operation='upload_bytes', status='ok') == ok + 1
+    assert operations.get(operation='download_bytes',
+                          status='error') == errors + 1
+    assert transferred.get(operation='upload_bytes',
+                           direction='upload') == uploaded + 8
+    assert 'infra_gcs_operation_seconds_bucket{operation="upload_bytes",' \
+        in REGISTRY.exposition()
+
+    # Without a cache directory, None is the documented result.
+    cache_errors = operations.get(operation='get_cached_artifact_path',
+                                  status='error')
+    assert gcs.get_cached_artifact_path('infra-test', 'artifact', 1) is None
+    assert operations.get(operation='get_cached_artifact_path',
+                          status='error') == cache_errors